@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
 from app.core.database import get_db
 from app.schemas.schemas import (
     DataSourceCreate, DataSourceUpdate, DataSourceResponse,
     MigrationTaskCreate, MigrationTaskUpdate, MigrationTaskResponse,
+    MigrationJobCreate, MigrationJobUpdate, MigrationJobResponse,
     Response
 )
 from app.services.datasource_service import DataSourceService
 from app.services.migration_service import MigrationTaskService
+from app.services.job_service import MigrationJobService
 
 # 创建主路由
 api_router = APIRouter()
@@ -205,6 +207,58 @@ async def get_datasource_tables(
         )
 
 
+@api_router.get("/datasources/{datasource_id}/catalog", response_model=Response)
+async def get_datasource_catalog(
+    datasource_id: int,
+    tables: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """批量获取表的列、主键、索引和估算行数，tables 为逗号分隔的表名，为空时返回全部表"""
+    try:
+        selection = [name.strip() for name in tables.split(",") if name.strip()] if tables else None
+        catalog = await DataSourceService.get_catalog(db, datasource_id, selection)
+        if catalog is None:
+            return Response(
+                success=False,
+                message=f"数据源ID {datasource_id} 不存在"
+            )
+        return Response(
+            success=True,
+            message="获取数据源目录成功",
+            data=catalog
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"获取数据源目录失败: {str(e)}"
+        )
+
+
+@api_router.post("/datasources/{datasource_id}/tables/refresh", response_model=Response)
+async def refresh_datasource_tables(
+    datasource_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """刷新数据源的表列表和表结构缓存"""
+    try:
+        tables = await DataSourceService.refresh_metadata(db, datasource_id)
+        if tables is None:
+            return Response(
+                success=False,
+                message=f"数据源ID {datasource_id} 不存在"
+            )
+        return Response(
+            success=True,
+            message="刷新表列表成功",
+            data=tables
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"刷新表列表失败: {str(e)}"
+        )
+
+
 @api_router.get("/datasources/{datasource_id}/tables/{table_name}/schema", response_model=Response)
 async def get_table_schema(
     datasource_id: int,
@@ -373,7 +427,7 @@ async def start_migration_task(
         if success:
             return Response(
                 success=True,
-                message="迁移任务启动成功"
+                message="迁移任务已加入执行队列"
             )
         else:
             return Response(
@@ -387,6 +441,31 @@ async def start_migration_task(
         )
 
 
+@api_router.post("/migration-tasks/{task_id}/resume", response_model=Response)
+async def resume_migration_task(
+    task_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """从检查点继续执行迁移任务"""
+    try:
+        success = await MigrationTaskService.resume_task(db, task_id)
+        if success:
+            return Response(
+                success=True,
+                message="迁移任务已从检查点加入执行队列"
+            )
+        else:
+            return Response(
+                success=False,
+                message="迁移任务续传失败，任务可能不存在、状态不正确或没有可用的检查点"
+            )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"续传迁移任务失败: {str(e)}"
+        )
+
+
 @api_router.post("/migration-tasks/{task_id}/cancel", response_model=Response)
 async def cancel_migration_task(
     task_id: int,
@@ -435,4 +514,237 @@ async def get_task_progress(
         return Response(
             success=False,
             message=f"获取任务进度失败: {str(e)}"
+        )
+
+
+# 多表迁移作业相关路由
+@api_router.post("/migration-jobs", response_model=Response)
+async def create_migration_job(
+    job: MigrationJobCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """创建多表迁移作业"""
+    try:
+        if not await DataSourceService.get_datasource(db, job.source_id):
+            return Response(
+                success=False,
+                message=f"源数据源ID {job.source_id} 不存在"
+            )
+        
+        if not await DataSourceService.get_datasource(db, job.target_id):
+            return Response(
+                success=False,
+                message=f"目标数据源ID {job.target_id} 不存在"
+            )
+        
+        created_job = await MigrationJobService.create_job(db, job)
+        return Response(
+            success=True,
+            message="迁移作业创建成功",
+            data=MigrationJobResponse.from_orm(created_job)
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"创建迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.get("/migration-jobs", response_model=Response)
+async def get_migration_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取迁移作业列表"""
+    try:
+        jobs = await MigrationJobService.get_jobs(db, skip, limit)
+        return Response(
+            success=True,
+            message="获取迁移作业列表成功",
+            data=[MigrationJobResponse.from_orm(job) for job in jobs]
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"获取迁移作业列表失败: {str(e)}"
+        )
+
+
+@api_router.get("/migration-jobs/{job_id}", response_model=Response)
+async def get_migration_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取单个迁移作业"""
+    try:
+        job = await MigrationJobService.get_job(db, job_id)
+        if not job:
+            return Response(
+                success=False,
+                message=f"迁移作业ID {job_id} 不存在"
+            )
+        
+        return Response(
+            success=True,
+            message="获取迁移作业成功",
+            data=MigrationJobResponse.from_orm(job)
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"获取迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.put("/migration-jobs/{job_id}", response_model=Response)
+async def update_migration_job(
+    job_id: int,
+    job_update: MigrationJobUpdate,
+    db: AsyncSession = Depends(get_db)
+):
+    """更新迁移作业"""
+    try:
+        updated_job = await MigrationJobService.update_job(db, job_id, job_update)
+        if not updated_job:
+            return Response(
+                success=False,
+                message=f"迁移作业ID {job_id} 不存在"
+            )
+        
+        return Response(
+            success=True,
+            message="迁移作业更新成功",
+            data=MigrationJobResponse.from_orm(updated_job)
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"更新迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.delete("/migration-jobs/{job_id}", response_model=Response)
+async def delete_migration_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """删除迁移作业"""
+    try:
+        success = await MigrationJobService.delete_job(db, job_id)
+        if not success:
+            return Response(
+                success=False,
+                message=f"迁移作业ID {job_id} 不存在"
+            )
+        
+        return Response(
+            success=True,
+            message="迁移作业删除成功"
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"删除迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.post("/migration-jobs/{job_id}/start", response_model=Response)
+async def start_migration_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """启动迁移作业"""
+    try:
+        success = await MigrationJobService.start_job(db, job_id)
+        if success:
+            return Response(
+                success=True,
+                message="迁移作业已开始调度"
+            )
+        else:
+            return Response(
+                success=False,
+                message="迁移作业启动失败，作业可能不存在或状态不正确"
+            )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"启动迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.post("/migration-jobs/{job_id}/resume", response_model=Response)
+async def resume_migration_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """继续执行迁移作业"""
+    try:
+        success = await MigrationJobService.resume_job(db, job_id)
+        if success:
+            return Response(
+                success=True,
+                message="迁移作业已继续调度"
+            )
+        else:
+            return Response(
+                success=False,
+                message="迁移作业续传失败，作业可能不存在或状态不正确"
+            )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"续传迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.post("/migration-jobs/{job_id}/cancel", response_model=Response)
+async def cancel_migration_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """取消迁移作业"""
+    try:
+        success = await MigrationJobService.cancel_job(db, job_id)
+        if success:
+            return Response(
+                success=True,
+                message="迁移作业取消成功"
+            )
+        else:
+            return Response(
+                success=False,
+                message="迁移作业取消失败，作业可能不存在或状态不正确"
+            )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"取消迁移作业失败: {str(e)}"
+        )
+
+
+@api_router.get("/migration-jobs/{job_id}/progress", response_model=Response)
+async def get_job_progress(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取作业进度"""
+    try:
+        progress = await MigrationJobService.get_job_progress(db, job_id)
+        if not progress:
+            return Response(
+                success=False,
+                message=f"迁移作业ID {job_id} 不存在"
+            )
+        
+        return Response(
+            success=True,
+            message="获取作业进度成功",
+            data=progress
+        )
+    except Exception as e:
+        return Response(
+            success=False,
+            message=f"获取作业进度失败: {str(e)}"
         )
\ No newline at end of file
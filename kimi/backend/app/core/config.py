@@ -21,12 +21,54 @@ class Settings(BaseSettings):
     DB_MAX_OVERFLOW: int = 10
     DB_POOL_TIMEOUT: int = 30
     
+    # 数据源连接池配置（迁移源库/目标库）
+    DATASOURCE_POOL_MIN_SIZE: int = 1
+    DATASOURCE_POOL_MAX_SIZE: int = 10
+    DATASOURCE_POOL_IDLE_TIMEOUT: int = 300  # 秒，超过该时间的空闲连接会被回收
+    DATASOURCE_POOL_HEALTH_CHECK_INTERVAL: int = 30  # 秒，空闲超过该时间的连接借出前先做健康检查
+    DATASOURCE_POOL_TIMEOUT: int = 30  # 秒，等待可用连接的最长时间
+    DATASOURCE_CONNECT_TIMEOUT: int = 10  # 秒
+    
+    # SQL Server（pyodbc同步驱动）专用线程池
+    SQLSERVER_EXECUTOR_WORKERS: int = 8
+    SQLSERVER_EXECUTOR_QUEUE_SIZE: int = 64  # 超出后调用方异步等待
+    
+    # 目标库批量写入配置
+    MYSQL_LOAD_DATA_LOCAL: bool = False  # MySQL目标使用 LOAD DATA LOCAL INFILE 导入（需服务端开启 local_infile）
+    SQLSERVER_FAST_EXECUTEMANY: bool = True  # SQL Server目标使用 pyodbc fast_executemany
+    
+    # 数据源元数据缓存（表列表、表结构）
+    METADATA_CACHE_TTL: int = 300  # 秒，0 表示不缓存
+    METADATA_CACHE_MAX_ENTRIES: int = 10000  # 超出后淘汰最久未使用的项
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     
     # 迁移任务配置
     MAX_CONCURRENT_TASKS: int = 3
     TASK_TIMEOUT: int = 3600  # 秒
+    MIGRATION_BATCH_SIZE: int = 5000  # 每批读取/写入的行数（自适应调整时为初始值）
+    MIGRATION_ADAPTIVE_BATCH: bool = True  # 按每批耗时和数据量自动调整批大小
+    MIGRATION_BATCH_TARGET_SECONDS: float = 1.0  # 自适应调整的目标单批耗时（秒）
+    MIGRATION_BATCH_MIN_SIZE: int = 100  # 自适应调整的批大小下限
+    MIGRATION_BATCH_MAX_SIZE: int = 100000  # 自适应调整的批大小上限
+    MIGRATION_MEMORY_BUDGET_MB: int = 256  # 单个任务读写流水线中缓存的数据量上限（MB），按同时驻留的批数分摊到每批
+    MIGRATION_COLUMNAR_BATCHES: bool = False  # 读取的批次按列存放（数值列使用定长数组和NULL位图）后再转换和写入；减少排队批次的内存，但除 LOAD DATA 外整体吞吐量更低
+    MIGRATION_PARALLELISM: int = 4  # 单表按主键区间并行复制的并发数
+    MIGRATION_QUEUE_DEPTH: int = 4  # 读写流水线中已读取、等待写入的最大批数
+    MIGRATION_SPILL_ENABLED: bool = False  # 队列已满时把读取的批次压缩写入本地段文件，读取不等待较慢的目标写入
+    MIGRATION_SPILL_DIR: str = ""  # 段文件目录，为空时使用系统临时目录下的 migration_spill，每个任务一个子目录（均要求只有服务进程用户可访问）
+    MIGRATION_SPILL_MAX_MB: int = 2048  # 单个任务段文件占用的磁盘上限（MB），达到后读取协程等待写入
+    MIGRATION_CANCEL_POLICY: str = "commit"  # 取消时正在写入的批次：commit 写完后停止，rollback 立即中断并回滚
+    MIGRATION_CHECKPOINT_INTERVAL: int = 10  # 每写入多少批保存一次检查点
+    MIGRATION_PROGRESS_FLUSH_INTERVAL: float = 2.0  # 运行中任务的进度最长多少秒写入一次元数据库
+    MIGRATION_PROGRESS_FLUSH_PERCENT: float = 5.0  # 进度变化达到多少个百分点时立即写入
+    MIGRATION_JOB_PARALLEL_TABLES: int = 2  # 多表迁移作业中同时复制的表数（同时受 MAX_CONCURRENT_TASKS 限制）
+    MIGRATION_EXACT_COUNT: bool = False  # 开始复制前是否用 COUNT(*) 精确统计源表行数，否则读取统计信息估算并在复制中修正
+    MIGRATION_ALLOW_RAW_FILTER: bool = False  # 是否允许 filter_condition 使用原始SQL条件（直接拼接进查询，有注入风险）
+    MIGRATION_LOAD_MODE: str = "append"  # 目标表写入方式：append 直接写入，deferred 导入前删除或禁用二级索引、约束和触发器，导入后重建
+    MIGRATION_VERIFY_CHUNK_ROWS: int = 100000  # 数据校验时每个顶层主键区间的行数
+    MIGRATION_VERIFY_LEAF_ROWS: int = 1000  # 不一致的区间细分到不超过多少行时停止细分并报告
     
     class Config:
         env_file = ".env"
@@ -1,7 +1,11 @@
+import logging
+from sqlalchemy import inspect, literal, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
     pass
@@ -47,7 +51,89 @@ async def get_db():
             await session.close()
 
 
+# create_all 只建立不存在的表，不会修改已有的表。
+# 模型中后来加入的列按加入顺序登记在这里，启动时补到已有的元数据库中。
+_ADDED_COLUMNS = [
+    ("migration_tasks", "batch_size"),
+    ("migration_tasks", "last_key"),
+    ("migration_tasks", "parallelism"),
+    ("migration_tasks", "priority"),
+    ("migration_tasks", "cancel_policy"),
+    ("migration_tasks", "checkpoint"),
+    ("migration_tasks", "checkpoint_at"),
+    ("migration_tasks", "metrics"),
+    ("migration_tasks", "migrate_structure"),
+    ("migration_tasks", "load_mode"),
+    ("migration_tasks", "exact_count"),
+    ("migration_tasks", "job_id"),
+    ("migration_tasks", "sync_mode"),
+    ("migration_tasks", "watermark_column"),
+    ("migration_tasks", "watermark"),
+    ("migration_tasks", "task_type"),
+    ("migration_tasks", "verification_result"),
+]
+
+# 后来增加了取值的枚举列（如任务状态 QUEUED）
+_EXTENDED_ENUM_COLUMNS = [
+    ("migration_tasks", "status"),
+]
+
+
+def _add_missing_columns(sync_conn):
+    """为已有的表补齐后来加入的列，已存在的列跳过，可以重复执行"""
+    inspector = inspect(sync_conn)
+    dialect = sync_conn.dialect
+    quote = dialect.identifier_preparer.quote
+    existing = {}
+    for table_name, column_name in _ADDED_COLUMNS:
+        if table_name not in existing:
+            if not inspector.has_table(table_name):
+                existing[table_name] = None
+            else:
+                existing[table_name] = {column["name"] for column in inspector.get_columns(table_name)}
+        columns = existing[table_name]
+        if columns is None or column_name in columns:
+            continue
+        
+        column = Base.metadata.tables[table_name].c[column_name]
+        ddl = f"ALTER TABLE {quote(table_name)} {'ADD' if dialect.name == 'mssql' else 'ADD COLUMN'} " \
+              f"{quote(column_name)} {column.type.compile(dialect=dialect)}"
+        if column.default is not None and column.default.is_scalar:
+            # 已有的行按模型的默认值填充
+            default = literal(column.default.arg, column.type).compile(
+                dialect=dialect, compile_kwargs={"literal_binds": True}
+            )
+            ddl += f" DEFAULT {default}"
+        sync_conn.execute(text(ddl))
+        for index in column.table.indexes:
+            if list(index.columns) == [column]:
+                index.create(sync_conn, checkfirst=True)
+        columns.add(column_name)
+        logger.info(f"元数据库表 {table_name} 已添加列 {column_name}")
+
+
+def _extend_enum_columns(sync_conn):
+    """MySQL 的原生 ENUM 列不接受建表之后加入的取值，按模型当前的取值重新定义列；其他数据库按字符串存放，无需修改"""
+    if sync_conn.dialect.name != "mysql":
+        return
+    inspector = inspect(sync_conn)
+    for table_name, column_name in _EXTENDED_ENUM_COLUMNS:
+        if not inspector.has_table(table_name):
+            continue
+        current = next((column for column in inspector.get_columns(table_name) if column["name"] == column_name), None)
+        column = Base.metadata.tables[table_name].c[column_name]
+        if current is None or set(getattr(current["type"], "enums", None) or ()) >= set(column.type.enums):
+            continue
+        quote = sync_conn.dialect.identifier_preparer.quote
+        sync_conn.execute(text(
+            f"ALTER TABLE {quote(table_name)} MODIFY {quote(column_name)} {column.type.compile(dialect=sync_conn.dialect)}"
+        ))
+        logger.info(f"元数据库表 {table_name} 的列 {column_name} 已更新取值")
+
+
 async def init_db():
-    """初始化数据库表"""
+    """初始化数据库表：建立缺少的表，并为已有的表补齐后来加入的列"""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_extend_enum_columns)
\ No newline at end of file
@@ -12,10 +12,12 @@ class DatabaseType(str, enum.Enum):
 
 class TaskStatus(str, enum.Enum):
     PENDING = "pending"
+    QUEUED = "queued"
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELLED = "cancelled"
+    RESUMABLE = "resumable"
 
 
 class DataSource(Base):
@@ -45,12 +47,59 @@ class MigrationTask(Base):
     target_id = Column(Integer, nullable=False)
     source_table = Column(String(100), nullable=False)
     target_table = Column(String(100), nullable=False)
+    job_id = Column(Integer, index=True)  # 所属的多表迁移作业，单独创建的任务为空
+    task_type = Column(String(20), default="migration")  # migration 复制数据 / verification 按主键区间校验和比较源表和目标表
     mapping_config = Column(Text)  # JSON格式的字段映射配置
-    filter_condition = Column(Text)  # 数据过滤条件
+    filter_condition = Column(Text)  # 数据过滤条件：JSON格式的结构化条件，以参数形式下推到源库
+    batch_size = Column(Integer)  # 每批行数，为空时使用全局配置
+    parallelism = Column(Integer)  # 单表并行复制的区间数，为空时使用全局配置
+    priority = Column(Integer, default=0)  # 调度优先级，数值越大越先执行
+    cancel_policy = Column(String(20))  # 取消时正在写入批次的处理方式：commit / rollback
+    migrate_structure = Column(Boolean, default=True)  # 目标表不存在时按源表结构建表，二级索引在数据导入后创建
+    exact_count = Column(Boolean)  # 开始前是否用 COUNT(*) 精确统计源表行数，为空时使用全局配置；否则读取统计信息估算
+    load_mode = Column(String(20))  # 目标表写入方式：append 直接写入 / deferred 导入前删除或禁用索引、约束和触发器，导入后重建
+    sync_mode = Column(String(20), default="full")  # full 全量复制 / incremental 只复制水位列高于上次水位的行并按键插入或更新
+    watermark_column = Column(String(100))  # 增量同步的水位列，如 updated_at 或自增ID
+    watermark = Column(Text)  # JSON：上次成功同步到的水位值，只在同步成功完成后更新
     status = Column(Enum(TaskStatus), default=TaskStatus.PENDING)
     progress = Column(Integer, default=0)  # 进度百分比
     total_rows = Column(Integer, default=0)
     processed_rows = Column(Integer, default=0)
+    last_key = Column(Text)  # 最后写入的主键值（JSON），用于续传
+    checkpoint = Column(Text)  # JSON格式的检查点：各主键区间的位置、已提交行数、目标表行数
+    checkpoint_at = Column(DateTime(timezone=True))
+    metrics = Column(Text)  # JSON格式的执行统计：读写耗时、吞吐量、写入方式
+    verification_result = Column(Text)  # JSON格式的校验结果：两表行数、不一致的主键区间
+    error_message = Column(Text)
+    started_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class MigrationJob(Base):
+    """多表迁移作业：每个表对应一个迁移任务，按外键依赖顺序调度"""
+    __tablename__ = "migration_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    description = Column(Text)
+    source_id = Column(Integer, nullable=False)
+    target_id = Column(Integer, nullable=False)
+    tables = Column(Text)  # JSON列表：要迁移的表，为空时迁移源库的全部表
+    max_parallel_tables = Column(Integer)  # 同时复制的表数，为空时使用全局配置
+    batch_size = Column(Integer)  # 以下为各表任务的配置，含义与迁移任务相同
+    parallelism = Column(Integer)
+    priority = Column(Integer, default=0)
+    cancel_policy = Column(String(20))
+    migrate_structure = Column(Boolean, default=True)
+    exact_count = Column(Boolean)
+    load_mode = Column(String(20))
+    status = Column(Enum(TaskStatus), default=TaskStatus.PENDING)
+    progress = Column(Integer, default=0)  # 进度百分比，按各表行数汇总
+    total_rows = Column(Integer, default=0)
+    processed_rows = Column(Integer, default=0)
+    plan = Column(Text)  # JSON格式的执行计划：各表的依赖、估算行数、对应任务ID
     error_message = Column(Text)
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
@@ -1,3 +1,3 @@
-from . import DataSource, MigrationTask, DatabaseType, TaskStatus
+from . import DataSource, MigrationTask, MigrationJob, DatabaseType, TaskStatus
 
-__all__ = ["DataSource", "MigrationTask", "DatabaseType", "TaskStatus"]
\ No newline at end of file
+__all__ = ["DataSource", "MigrationTask", "MigrationJob", "DatabaseType", "TaskStatus"]
\ No newline at end of file
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+import json
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from app.models.models import DatabaseType, TaskStatus
 
@@ -58,8 +59,18 @@ class MigrationTaskBase(BaseModel):
     target_id: int
     source_table: str = Field(..., min_length=1, max_length=100)
     target_table: str = Field(..., min_length=1, max_length=100)
+    task_type: str = Field("migration", pattern="^(migration|verification)$")
     mapping_config: Optional[str] = None  # JSON字符串
-    filter_condition: Optional[str] = None
+    filter_condition: Optional[str] = None  # JSON字符串：结构化过滤条件
+    batch_size: Optional[int] = Field(None, ge=1, le=1000000)
+    parallelism: Optional[int] = Field(None, ge=1, le=32)
+    priority: int = 0  # 数值越大越先执行
+    cancel_policy: Optional[str] = Field(None, pattern="^(commit|rollback)$")
+    migrate_structure: bool = True  # 目标表不存在时按源表结构建表
+    load_mode: Optional[str] = Field(None, pattern="^(append|deferred)$")  # 为空时使用 mapping_config 或全局配置
+    exact_count: Optional[bool] = None  # 为空时使用全局配置 MIGRATION_EXACT_COUNT
+    sync_mode: str = Field("full", pattern="^(full|incremental)$")
+    watermark_column: Optional[str] = Field(None, min_length=1, max_length=100)  # incremental 模式必填
 
 
 class MigrationTaskCreate(MigrationTaskBase):
@@ -73,8 +84,19 @@ class MigrationTaskUpdate(BaseModel):
     target_id: Optional[int] = None
     source_table: Optional[str] = Field(None, min_length=1, max_length=100)
     target_table: Optional[str] = Field(None, min_length=1, max_length=100)
+    task_type: Optional[str] = Field(None, pattern="^(migration|verification)$")
     mapping_config: Optional[str] = None
     filter_condition: Optional[str] = None
+    batch_size: Optional[int] = Field(None, ge=1, le=1000000)
+    parallelism: Optional[int] = Field(None, ge=1, le=32)
+    priority: Optional[int] = None
+    cancel_policy: Optional[str] = Field(None, pattern="^(commit|rollback)$")
+    migrate_structure: Optional[bool] = None
+    load_mode: Optional[str] = Field(None, pattern="^(append|deferred)$")
+    exact_count: Optional[bool] = None
+    sync_mode: Optional[str] = Field(None, pattern="^(full|incremental)$")
+    watermark_column: Optional[str] = Field(None, min_length=1, max_length=100)
+    watermark: Optional[str] = None  # JSON：修改或清空已同步的水位，清空后下次同步复制全部行
 
 
 class MigrationTaskResponse(BaseModel):
@@ -85,18 +107,106 @@ class MigrationTaskResponse(BaseModel):
     target_id: int
     source_table: str
     target_table: str
+    job_id: Optional[int] = None
+    task_type: Optional[str] = None
     mapping_config: Optional[str]
     filter_condition: Optional[str]
+    batch_size: Optional[int]
+    parallelism: Optional[int]
+    priority: Optional[int]
+    cancel_policy: Optional[str]
+    migrate_structure: Optional[bool]
+    load_mode: Optional[str]
+    exact_count: Optional[bool]
+    sync_mode: Optional[str] = None
+    watermark_column: Optional[str] = None
+    watermark: Optional[str] = None
+    status: TaskStatus
+    progress: int
+    total_rows: int
+    processed_rows: int
+    last_key: Optional[str]
+    checkpoint: Optional[str]
+    checkpoint_at: Optional[datetime]
+    metrics: Optional[str]
+    verification_result: Optional[str] = None
+    error_message: Optional[str]
+    started_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    created_at: datetime
+    updated_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+
+# 多表迁移作业相关Schema
+class MigrationJobBase(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    description: Optional[str] = None
+    source_id: int
+    target_id: int
+    tables: Optional[List[str]] = None  # 为空时迁移源库的全部表
+    max_parallel_tables: Optional[int] = Field(None, ge=1, le=32)  # 为空时使用全局配置
+    batch_size: Optional[int] = Field(None, ge=1, le=1000000)
+    parallelism: Optional[int] = Field(None, ge=1, le=32)
+    priority: int = 0
+    cancel_policy: Optional[str] = Field(None, pattern="^(commit|rollback)$")
+    migrate_structure: bool = True
+    exact_count: Optional[bool] = None
+    load_mode: Optional[str] = Field(None, pattern="^(append|deferred)$")
+
+
+class MigrationJobCreate(MigrationJobBase):
+    pass
+
+
+class MigrationJobUpdate(BaseModel):
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    description: Optional[str] = None
+    tables: Optional[List[str]] = None
+    max_parallel_tables: Optional[int] = Field(None, ge=1, le=32)
+    batch_size: Optional[int] = Field(None, ge=1, le=1000000)
+    parallelism: Optional[int] = Field(None, ge=1, le=32)
+    priority: Optional[int] = None
+    cancel_policy: Optional[str] = Field(None, pattern="^(commit|rollback)$")
+    migrate_structure: Optional[bool] = None
+    exact_count: Optional[bool] = None
+    load_mode: Optional[str] = Field(None, pattern="^(append|deferred)$")
+
+
+class MigrationJobResponse(BaseModel):
+    id: int
+    name: str
+    description: Optional[str]
+    source_id: int
+    target_id: int
+    tables: Optional[List[str]]
+    max_parallel_tables: Optional[int]
+    batch_size: Optional[int]
+    parallelism: Optional[int]
+    priority: Optional[int]
+    cancel_policy: Optional[str]
+    migrate_structure: Optional[bool]
+    exact_count: Optional[bool]
+    load_mode: Optional[str]
     status: TaskStatus
     progress: int
     total_rows: int
     processed_rows: int
+    plan: Optional[str]
     error_message: Optional[str]
     started_at: Optional[datetime]
     completed_at: Optional[datetime]
     created_at: datetime
     updated_at: Optional[datetime]
     
+    @field_validator("tables", mode="before")
+    @classmethod
+    def _parse_tables(cls, value):
+        # 数据库中以JSON字符串保存
+        return json.loads(value) if isinstance(value, str) else value
+    
     class Config:
         from_attributes = True
 
@@ -1,11 +1,13 @@
 from . import (
     DataSourceBase, DataSourceCreate, DataSourceUpdate, DataSourceResponse,
     MigrationTaskBase, MigrationTaskCreate, MigrationTaskUpdate, MigrationTaskResponse,
+    MigrationJobBase, MigrationJobCreate, MigrationJobUpdate, MigrationJobResponse,
     Response, ErrorResponse
 )
 
 __all__ = [
     "DataSourceBase", "DataSourceCreate", "DataSourceUpdate", "DataSourceResponse",
     "MigrationTaskBase", "MigrationTaskCreate", "MigrationTaskUpdate", "MigrationTaskResponse",
+    "MigrationJobBase", "MigrationJobCreate", "MigrationJobUpdate", "MigrationJobResponse",
     "Response", "ErrorResponse"
 ]
\ No newline at end of file
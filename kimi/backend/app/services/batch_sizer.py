@@ -0,0 +1,141 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from app.core.config import settings
+from app.services.columnar import ColumnBatch
+
+logger = logging.getLogger(__name__)
+
+# 估算每行字节数时抽样的行数
+_SAMPLE_ROWS = 50
+# 指标中保留的批大小调整记录条数
+_MAX_HISTORY = 100
+# 判断为超时或单条语句过大的错误信息片段，出现时立即缩小批大小后重试
+_SHRINK_ERRORS = (
+    "timeout", "timed out", "hyt00", "hyt01",
+    "max_allowed_packet", "packet too large", "packet bigger than",
+)
+
+
+def _value_bytes(value) -> int:
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return len(value) + 16
+    return 8
+
+
+def estimate_row_bytes(rows: Union[Sequence[Sequence], ColumnBatch]) -> int:
+    """按抽样估算一批数据在内存中的大小：字符串和二进制按长度计，其他值按8字节计；列批中的数值列按缓冲区实际大小计"""
+    if not rows:
+        return 0
+    if isinstance(rows, ColumnBatch):
+        total = 0
+        for column in rows.columns:
+            if column.kind != "object":
+                total += column.values.itemsize * len(column.values)
+                continue
+            step = max(1, len(column.values) // _SAMPLE_ROWS)
+            sample = column.values[::step]
+            total += sum(map(_value_bytes, sample)) * len(column.values) // len(sample)
+        return total
+    step = max(1, len(rows) // _SAMPLE_ROWS)
+    sample = rows[::step]
+    total = 0
+    for row in sample:
+        total += sum(map(_value_bytes, row))
+    return total * len(rows) // len(sample)
+
+
+class AdaptiveBatchSizer:
+    """按实测的每批耗时和数据量调整批大小（AIMD）
+    
+    每批读取或写入（两者流水线并行，取较慢的一个）耗时低于目标时，批大小加上初始值的 1/4，
+    超过目标耗时 1.5 倍时减半，任何时候都不超过按每行字节数换算的内存预算行数；
+    超时或语句过大的错误缩小为原来的 1/4。批大小始终在 [min_size, max_size] 内。
+    """
+    
+    def __init__(self, initial: int, min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 target_seconds: Optional[float] = None, memory_budget: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        self.enabled = settings.MIGRATION_ADAPTIVE_BATCH if enabled is None else enabled
+        self.min_size = max(1, min(min_size or settings.MIGRATION_BATCH_MIN_SIZE, initial))
+        self.max_size = max(initial, max_size or settings.MIGRATION_BATCH_MAX_SIZE)
+        self.target_seconds = target_seconds or settings.MIGRATION_BATCH_TARGET_SECONDS
+        # 单批数据允许占用的内存（字节）
+        self.memory_budget = memory_budget
+        self.initial = initial
+        self.size = initial
+        self.step = max(1, initial // 4)
+        self.batches = 0
+        self.rows = 0
+        self.bytes = 0
+        self.min_seen = initial
+        self.max_seen = initial
+        self.increases = 0
+        self.decreases = 0
+        self.history: List[Dict[str, Any]] = []
+    
+    def record(self, rows: int, seconds: float, nbytes: int):
+        """一批数据处理完成后按耗时和数据量调整批大小"""
+        self.batches += 1
+        self.rows += rows
+        self.bytes += nbytes
+        if not self.enabled or rows <= 0:
+            return
+        
+        size = self.size
+        reason = f"单批耗时 {seconds:.2f} 秒"
+        if seconds > self.target_seconds * 1.5:
+            size = self.size // 2
+        elif seconds < self.target_seconds and rows >= self.size:
+            # 只在整批时增加：不足一批说明数据已读完，耗时不能反映批大小
+            size = self.size + self.step
+        row_bytes = nbytes / rows
+        if self.memory_budget and row_bytes:
+            budget_rows = int(self.memory_budget / row_bytes)
+            if size > budget_rows:
+                size = budget_rows
+                reason = f"每行约 {row_bytes:.0f} 字节，超出单批内存预算"
+        self._resize(size, reason)
+    
+    def shrink(self, error: BaseException) -> bool:
+        """超时或语句过大时缩小批大小，返回是否应以新的批大小重试"""
+        if not self.enabled or not self.is_shrinkable(error) or self.size <= self.min_size:
+            return False
+        self._resize(self.size // 4, f"{type(error).__name__}: {str(error)[:200]}")
+        return True
+    
+    @staticmethod
+    def is_shrinkable(error: BaseException) -> bool:
+        if isinstance(error, TimeoutError):
+            return True
+        message = str(error).lower()
+        return any(fragment in message for fragment in _SHRINK_ERRORS)
+    
+    def _resize(self, size: int, reason: str):
+        size = max(self.min_size, min(self.max_size, size))
+        if size == self.size:
+            return
+        if size > self.size:
+            self.increases += 1
+        else:
+            self.decreases += 1
+            logger.info(f"批大小 {self.size} -> {size}: {reason}")
+        self.size = size
+        self.min_seen = min(self.min_seen, size)
+        self.max_seen = max(self.max_seen, size)
+        if len(self.history) < _MAX_HISTORY:
+            self.history.append({"batch": self.batches, "size": size, "reason": reason})
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "adaptive": self.enabled,
+            "initial": self.initial,
+            "final": self.size,
+            "min": self.min_seen,
+            "max": self.max_seen,
+            "average": round(self.rows / self.batches) if self.batches else None,
+            "avg_row_bytes": round(self.bytes / self.rows) if self.rows else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "history": self.history,
+        }
\ No newline at end of file
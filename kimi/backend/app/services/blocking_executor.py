@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingExecutor:
+    """有界线程池：在专用线程中执行阻塞的数据库驱动调用，避免卡住事件循环
+    
+    同时在执行和排队的调用数不超过 max_workers + max_queue，超出后调用方异步等待。
+    """
+    
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._waiting = 0  # 等待进入执行器的调用
+        self._queued = 0  # 已提交、尚未开始执行的调用
+        self._active = 0  # 正在线程中执行的调用
+        self._completed = 0
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"{self.name}-worker"
+            )
+        return self._executor
+    
+    def _call(self, func: Callable, *args, **kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行阻塞调用并等待结果"""
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._get_executor().submit(functools.partial(self._call, func, *args, **kwargs))
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            self._slots.release()
+            raise
+        # 线程真正结束（或未开始即被取消）后才释放名额，调用方被取消时也不会超出上限
+        future.add_done_callback(functools.partial(self._on_done, loop))
+        return await asyncio.wrap_future(future)
+    
+    def _on_done(self, loop: asyncio.AbstractEventLoop, future):
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._slots.release)
+    
+    def stats(self) -> Dict[str, Any]:
+        """执行器状态，queue_depth 为尚未开始执行的调用数"""
+        with self._lock:
+            queued = self._queued
+            active = self._active
+            completed = self._completed
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queue_depth": queued + self._waiting,
+            "completed": completed,
+        }
+    
+    def shutdown(self):
+        """关闭线程池，未开始的调用会被取消"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# SQL Server（pyodbc）是同步驱动，所有调用都经由该执行器
+sqlserver_executor = BlockingExecutor(
+    "sqlserver",
+    max_workers=settings.SQLSERVER_EXECUTOR_WORKERS,
+    max_queue=settings.SQLSERVER_EXECUTOR_QUEUE_SIZE
+)
\ No newline at end of file
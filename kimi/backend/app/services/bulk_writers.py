@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
+
+from app.core.config import settings
+from app.models.models import DatabaseType
+from app.services.columnar import ColumnBatch, as_rows
+from app.services.database_service import DatabaseConnection, complete_uninterrupted
+
+logger = logging.getLogger(__name__)
+
+# 各写入方式在本进程内的累计写入量，用于 /metrics
+_writer_totals: Dict[str, Dict[str, float]] = {}
+
+
+class BulkWriter:
+    """目标表批量写入器：每次写入一批并提交，同时统计写入吞吐量
+    
+    默认实现使用驱动的 executemany，各数据库的快速写入方式由子类实现。
+    按列存放的批（ColumnBatch）在写入前组装为行，columnar 为 True 的写入方式直接按列处理。
+    """
+    
+    name = "executemany"
+    columnar = False
+    
+    def __init__(self, target: DatabaseConnection, table_name: str):
+        self.target = target
+        self.table_name = table_name
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+        # 目标表的标识列（小写），None 表示尚未读取
+        self.identity_columns: Optional[Set[str]] = None
+    
+    async def prepare(self, conn):
+        """在连接上开始写入前调用一次"""
+    
+    async def _load_identity_columns(self):
+        """读取目标表的标识列，同一写入器只读取一次"""
+        if self.identity_columns is None:
+            self.identity_columns = {column.lower() for column in await self.target.get_identity_columns(self.table_name)}
+    
+    def _identity_insert(self, columns: List[str]) -> bool:
+        """这一批是否显式写入标识列（源表的自增值需要原样保留）"""
+        return bool(self.identity_columns) and any(column.lower() in self.identity_columns for column in columns)
+    
+    async def write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        """写入一批数据并提交，返回写入行数"""
+        if not rows:
+            return 0
+        started = time.monotonic()
+        if not self.columnar:
+            rows = as_rows(rows)
+        written = await self._write(conn, columns, rows)
+        elapsed = time.monotonic() - started
+        
+        self.rows += written
+        self.batches += 1
+        self.seconds += elapsed
+        totals = _writer_totals.setdefault(self.name, {"rows": 0, "batches": 0, "seconds": 0.0})
+        totals["rows"] += written
+        totals["batches"] += 1
+        totals["seconds"] += elapsed
+        return written
+    
+    async def _write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        return await self.target.insert_batch(conn, self.table_name, columns, rows)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "writer": self.name,
+            "rows": self.rows,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds else None,
+        }
+
+
+class MySQLMultiRowWriter(BulkWriter):
+    """MySQL多行插入：INSERT ... VALUES (...),(...)，单条语句长度按服务端 max_allowed_packet 切分"""
+    
+    name = "mysql_multi_row"
+    
+    def __init__(self, target: DatabaseConnection, table_name: str):
+        super().__init__(target, table_name)
+        self.max_statement_bytes: Optional[int] = None
+    
+    async def prepare(self, conn):
+        if self.max_statement_bytes is None:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT @@max_allowed_packet")
+                (max_allowed_packet,) = await cursor.fetchone()
+            # 留出协议包头和字符集换算的余量
+            self.max_statement_bytes = max(64 * 1024, int(max_allowed_packet) * 9 // 10)
+    
+    def _statements(self, conn, columns: List[str], rows: List[Sequence]) -> List[str]:
+        column_list = ", ".join(self.target.quote_identifier(column) for column in columns)
+        prefix = f"INSERT INTO {self.target.quote_identifier(self.table_name)} ({column_list}) VALUES "
+        limit = self.max_statement_bytes or 1024 * 1024
+        
+        statements = []
+        values: List[str] = []
+        size = len(prefix)
+        for row in rows:
+            literal = conn.escape(tuple(row))
+            literal_size = len(literal.encode("utf-8")) + 1
+            if values and size + literal_size > limit:
+                statements.append(prefix + ",".join(values))
+                values = []
+                size = len(prefix)
+            values.append(literal)
+            size += literal_size
+        if values:
+            statements.append(prefix + ",".join(values))
+        return statements
+    
+    async def _write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        statements = self._statements(conn, columns, rows)
+        await conn.begin()
+        try:
+            async with conn.cursor() as cursor:
+                for statement in statements:
+                    await cursor.execute(statement)
+        except Exception:
+            await conn.rollback()
+            raise
+        await complete_uninterrupted(conn.commit())
+        return len(rows)
+
+
+class MySQLLoadDataWriter(MySQLMultiRowWriter):
+    """MySQL LOAD DATA LOCAL INFILE：批次先写成临时制表符分隔文件再整体导入
+    
+    需要服务端开启 local_infile；批次中含有无法按文本导入的值（如二进制）时该批改用多行插入。
+    """
+    
+    name = "mysql_load_data"
+    columnar = True
+    
+    _text_types = (str, int, float, Decimal, datetime, date, dt_time)
+    
+    @staticmethod
+    def _field(value) -> str:
+        if value is None:
+            return "\\N"
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        if isinstance(value, datetime):
+            text = value.isoformat(sep=" ")
+        elif isinstance(value, (date, dt_time)):
+            text = value.isoformat()
+        else:
+            text = str(value)
+        return (
+            text.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+            .replace("\0", "\\0")
+        )
+    
+    def _encode(self, rows: Union[List[Sequence], ColumnBatch]) -> Optional[bytes]:
+        if isinstance(rows, ColumnBatch):
+            return self._encode_columns(rows)
+        lines = []
+        for row in rows:
+            if any(value is not None and not isinstance(value, self._text_types) for value in row):
+                return None
+            lines.append("\t".join(self._field(value) for value in row))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+    
+    def _encode_columns(self, batch: ColumnBatch) -> Optional[bytes]:
+        """按列编码：数值列不需要逐值检查类型，各列先整体转为文本再按行拼接"""
+        fields = []
+        for column in batch.columns:
+            values = column.to_list()
+            if column.kind == "object" and any(
+                value is not None and not isinstance(value, self._text_types) for value in values
+            ):
+                return None
+            fields.append(list(map(self._field, values)))
+        return ("\n".join(map("\t".join, zip(*fields))) + "\n").encode("utf-8")
+    
+    @staticmethod
+    def _spool(data: bytes) -> str:
+        with tempfile.NamedTemporaryFile(prefix="load-data-", suffix=".tsv", delete=False) as spool:
+            spool.write(data)
+            return spool.name
+    
+    async def _write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        data = self._encode(rows)
+        if data is None:
+            return await super()._write(conn, columns, as_rows(rows))
+        
+        path = await asyncio.to_thread(self._spool, data)
+        column_list = ", ".join(self.target.quote_identifier(column) for column in columns)
+        query = (
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {self.target.quote_identifier(self.table_name)} "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({column_list})"
+        )
+        try:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, (path,))
+            except Exception:
+                await conn.rollback()
+                raise
+            await complete_uninterrupted(conn.commit())
+        finally:
+            os.unlink(path)
+        return len(rows)
+
+
+class SQLServerFastWriter(BulkWriter):
+    """SQL Server：pyodbc fast_executemany 把整批参数一次发送给服务端
+    
+    写入的列包含目标表的标识列时，每批在 SET IDENTITY_INSERT ON/OFF 之间执行，保留源表的自增值。
+    """
+    
+    name = "sqlserver_fast_executemany"
+    
+    async def prepare(self, conn):
+        await self._load_identity_columns()
+    
+    async def _write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        return await self.target.insert_batch(
+            conn, self.table_name, columns, rows,
+            fast_executemany=settings.SQLSERVER_FAST_EXECUTEMANY,
+            identity_insert=self._identity_insert(columns)
+        )
+
+
+class SQLiteBulkWriter(BulkWriter):
+    """SQLite：整批 executemany 放在一个事务中，写入连接使用适合批量导入的 PRAGMA"""
+    
+    name = "sqlite_executemany"
+    
+    pragmas = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -65536",
+    )
+    
+    async def prepare(self, conn):
+        for pragma in self.pragmas:
+            async with conn.execute(pragma):
+                pass
+
+
+class UpsertWriter(BulkWriter):
+    """增量同步：按目标表的键插入或更新（MySQL ON DUPLICATE KEY UPDATE、SQL Server MERGE、SQLite ON CONFLICT）
+    
+    同一批数据重复写入结果不变，续传时重新写入检查点之后的批次不会产生重复行。
+    """
+    
+    name = "upsert"
+    
+    def __init__(self, target: DatabaseConnection, table_name: str, key_columns: Sequence[str]):
+        super().__init__(target, table_name)
+        self.key_columns = list(key_columns)
+    
+    async def prepare(self, conn):
+        if self.target.db_type == DatabaseType.SQLITE:
+            await SQLiteBulkWriter(self.target, self.table_name).prepare(conn)
+        elif self.target.db_type == DatabaseType.SQLSERVER:
+            # MERGE 插入新行时同样需要 IDENTITY_INSERT 才能写入标识列
+            await self._load_identity_columns()
+    
+    async def _write(self, conn, columns: List[str], rows: List[Sequence]) -> int:
+        return await self.target.insert_batch(
+            conn, self.table_name, columns, rows,
+            fast_executemany=self.target.db_type == DatabaseType.SQLSERVER and settings.SQLSERVER_FAST_EXECUTEMANY,
+            upsert_keys=self.key_columns,
+            identity_insert=self._identity_insert(columns)
+        )
+
+
+def create_bulk_writer(target: DatabaseConnection, table_name: str,
+                       upsert_keys: Optional[Sequence[str]] = None) -> BulkWriter:
+    """按目标库类型选择写入方式；指定 upsert_keys 时按键插入或更新"""
+    if upsert_keys:
+        return UpsertWriter(target, table_name, upsert_keys)
+    if target.db_type == DatabaseType.MYSQL:
+        if settings.MYSQL_LOAD_DATA_LOCAL:
+            return MySQLLoadDataWriter(target, table_name)
+        return MySQLMultiRowWriter(target, table_name)
+    if target.db_type == DatabaseType.SQLSERVER:
+        return SQLServerFastWriter(target, table_name)
+    if target.db_type == DatabaseType.SQLITE:
+        return SQLiteBulkWriter(target, table_name)
+    return BulkWriter(target, table_name)
+
+
+def bulk_writer_stats() -> Dict[str, Dict[str, Any]]:
+    """各写入方式的累计写入量和平均吞吐量"""
+    return {
+        name: {
+            "rows": int(totals["rows"]),
+            "batches": int(totals["batches"]),
+            "seconds": round(totals["seconds"], 3),
+            "rows_per_second": round(totals["rows"] / totals["seconds"], 1) if totals["seconds"] else None,
+        }
+        for name, totals in _writer_totals.items()
+    }
\ No newline at end of file
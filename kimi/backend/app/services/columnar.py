@@ -0,0 +1,174 @@
+import sys
+from array import array
+from typing import Any, Iterator, List, Optional, Sequence, Union
+
+# 数值列使用的 array 类型码：int64 / float64 / 布尔按 int8 存放
+_INT = "q"
+_FLOAT = "d"
+_BOOL = "b"
+
+
+class Column:
+    """一列数据
+    
+    整数、浮点数和布尔列存放在定长的 array 缓冲区中（每个值8字节或1字节，不为每个值创建Python对象），
+    NULL 位置由位图标记（第 i 位为1表示第 i 行为NULL，该位置的缓冲区值为0）；
+    其他类型（字符串、二进制、小数、日期时间等）存放在列表中，NULL 直接记为 None。
+    """
+    
+    __slots__ = ("values", "nulls", "kind")
+    
+    def __init__(self, values: Union[array, list], nulls: Optional[bytearray] = None, kind: str = "object"):
+        self.values = values
+        self.nulls = nulls
+        self.kind = kind
+    
+    @classmethod
+    def from_values(cls, values: Sequence) -> "Column":
+        """由一列值构造，按第一个非NULL值的类型选择存放方式，整列不能按该类型存放时使用列表"""
+        sample = next((value for value in values if value is not None), None)
+        value_type = type(sample)
+        if value_type is int:
+            typecode, kind = _INT, "int"
+        elif value_type is float:
+            typecode, kind = _FLOAT, "float"
+        elif value_type is bool:
+            typecode, kind = _BOOL, "bool"
+        else:
+            return cls(values if isinstance(values, list) else list(values))
+        
+        nulls = None
+        filled = values
+        if None in values:
+            nulls = bytearray((len(values) + 7) // 8)
+            placeholder = value_type()
+            filled = []
+            for index, value in enumerate(values):
+                if value is None:
+                    nulls[index >> 3] |= 1 << (index & 7)
+                    filled.append(placeholder)
+                else:
+                    filled.append(value)
+        # 同一列中混有其他类型的值（SQLite动态类型，或布尔与整数混合）时 array 会拒绝转换或改变值的类型
+        if set(map(type, filled)) != {value_type}:
+            return cls(values if isinstance(values, list) else list(values))
+        try:
+            return cls(array(typecode, filled), nulls, kind)
+        except OverflowError:
+            # 超出 int64 范围的整数
+            return cls(values if isinstance(values, list) else list(values))
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    def to_list(self) -> list:
+        """还原为值列表，NULL 为 None"""
+        if self.kind == "object":
+            return self.values
+        values = self.values.tolist()
+        if self.kind == "bool":
+            values = [bool(value) for value in values]
+        if self.nulls is not None:
+            for index in _null_positions(self.nulls, len(values)):
+                values[index] = None
+        return values
+    
+    def slice(self, start: int, stop: int) -> "Column":
+        nulls = None
+        if self.nulls is not None:
+            positions = [index - start for index in _null_positions(self.nulls, len(self.values)) if start <= index < stop]
+            if positions:
+                nulls = bytearray((stop - start + 7) // 8)
+                for index in positions:
+                    nulls[index >> 3] |= 1 << (index & 7)
+        return Column(self.values[start:stop], nulls, self.kind)
+    
+    def nbytes(self) -> int:
+        """列占用的内存（字节），列表列包括其中各对象的大小"""
+        if self.kind == "object":
+            return sys.getsizeof(self.values) + sum(map(sys.getsizeof, self.values))
+        size = sys.getsizeof(self.values)
+        if self.nulls is not None:
+            size += sys.getsizeof(self.nulls)
+        return size
+
+
+class ColumnBatch:
+    """按列存放的一批数据，代替在读取、转换、写入各阶段之间传递的行元组列表
+    
+    读取后立即由驱动返回的结果转置为列（zip 在C层完成），在队列中等待写入期间数值列不保留逐值的Python对象；
+    列转换直接按列计算；写入阶段按写入方式的需要再组装为行。
+    """
+    
+    __slots__ = ("names", "columns", "length")
+    
+    def __init__(self, names: List[str], columns: List[Column], length: int):
+        self.names = names
+        self.columns = columns
+        self.length = length
+    
+    @classmethod
+    def from_rows(cls, names: Sequence[str], rows: Sequence[Sequence]) -> "ColumnBatch":
+        if not rows:
+            return cls(list(names), [Column([]) for _ in names], 0)
+        return cls(list(names), [Column.from_values(values) for values in zip(*rows)], len(rows))
+    
+    @classmethod
+    def from_lists(cls, names: Sequence[str], lists: Sequence[Sequence]) -> "ColumnBatch":
+        length = len(lists[0]) if lists else 0
+        return cls(list(names), [Column.from_values(values) for values in lists], length)
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def __bool__(self) -> bool:
+        return self.length > 0
+    
+    def __getitem__(self, item):
+        """切片得到新的批；按下标取得一行（元组），只用于少量访问"""
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step != 1:
+                raise ValueError("ColumnBatch 只支持连续切片")
+            stop = max(start, stop)
+            return ColumnBatch(self.names, [column.slice(start, stop) for column in self.columns], stop - start)
+        if item < 0:
+            item += self.length
+        return tuple(self.value(index, item) for index in range(len(self.columns)))
+    
+    def value(self, column_index: int, row_index: int) -> Any:
+        column = self.columns[column_index]
+        if column.nulls is not None and column.nulls[row_index >> 3] & (1 << (row_index & 7)):
+            return None
+        value = column.values[row_index]
+        return bool(value) if column.kind == "bool" else value
+    
+    def column_lists(self) -> List[list]:
+        """各列的值列表"""
+        return [column.to_list() for column in self.columns]
+    
+    def rows(self) -> Iterator[tuple]:
+        """逐行产出元组，不一次性保留整批的行对象"""
+        return zip(*self.column_lists())
+    
+    def to_rows(self) -> List[tuple]:
+        return list(self.rows())
+    
+    def nbytes(self) -> int:
+        return sum(column.nbytes() for column in self.columns)
+
+
+def as_rows(rows: Union[ColumnBatch, List[Sequence]]) -> List[Sequence]:
+    """写入阶段需要逐行参数时把列批组装为行列表，已是行列表时原样返回"""
+    if isinstance(rows, ColumnBatch):
+        return rows.to_rows()
+    return rows
+
+
+def _null_positions(nulls: bytearray, length: int) -> Iterator[int]:
+    for byte_index, byte in enumerate(nulls):
+        if byte:
+            base = byte_index << 3
+            for bit in range(8):
+                if byte & (1 << bit) and base + bit < length:
+                    yield base + bit
\ No newline at end of file
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """单个数据源的异步连接池
+    
+    连接的创建、关闭、健康检查和归还前的状态重置由调用方以回调形式提供，
+    池本身与具体数据库驱动无关。
+    """
+    
+    def __init__(self, name: str,
+                 create: Callable[[], Awaitable[Any]],
+                 close: Callable[[Any], Awaitable[None]],
+                 ping: Callable[[Any], Awaitable[bool]],
+                 reset: Optional[Callable[[Any], Awaitable[None]]] = None,
+                 min_size: int = 1, max_size: int = 10,
+                 idle_timeout: float = 300, health_check_interval: float = 30,
+                 acquire_timeout: float = 30):
+        self.name = name
+        self._create = create
+        self._close = close
+        self._ping = ping
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        
+        # 空闲连接按 (连接, 最近归还时间) 保存，后进先出以便冷连接自然过期
+        self._idle: deque = deque()
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._in_use = 0
+        self._closed = False
+        self._reaper: Optional[asyncio.Task] = None
+    
+    @property
+    def size(self) -> int:
+        """当前打开的连接数（空闲 + 借出）"""
+        return len(self._idle) + self._in_use
+    
+    def stats(self) -> Dict[str, Any]:
+        """连接池状态统计"""
+        return {
+            "name": self.name,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """借出一个连接，退出上下文时归还
+        
+        上下文内抛出异常（包括任务取消）时连接状态不可信，直接关闭而不放回池中。
+        """
+        conn = await self._get()
+        try:
+            yield conn
+        except BaseException:
+            self._in_use -= 1
+            self._semaphore.release()
+            await self._close_quietly(conn)
+            raise
+        else:
+            await self._put(conn)
+    
+    async def _get(self):
+        if self._closed:
+            raise RuntimeError(f"连接池 {self.name} 已关闭")
+        self._ensure_reaper()
+        
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"等待连接池 {self.name} 的可用连接超时")
+        
+        try:
+            while self._idle:
+                conn, released_at = self._idle.pop()
+                if time.monotonic() - released_at > self.health_check_interval:
+                    if not await self._check(conn):
+                        await self._close_quietly(conn)
+                        continue
+                self._in_use += 1
+                return conn
+            
+            conn = await self._create()
+            self._in_use += 1
+            return conn
+        except BaseException:
+            self._semaphore.release()
+            raise
+    
+    async def _put(self, conn):
+        self._in_use -= 1
+        try:
+            if self._closed:
+                await self._close_quietly(conn)
+                return
+            if self._reset:
+                try:
+                    await self._reset(conn)
+                except Exception as e:
+                    logger.warning(f"连接池 {self.name} 重置连接失败，丢弃该连接: {str(e)}")
+                    await self._close_quietly(conn)
+                    return
+            self._idle.append((conn, time.monotonic()))
+        finally:
+            self._semaphore.release()
+    
+    async def _check(self, conn) -> bool:
+        try:
+            return await self._ping(conn)
+        except Exception as e:
+            logger.info(f"连接池 {self.name} 健康检查失败: {str(e)}")
+            return False
+    
+    async def _close_quietly(self, conn):
+        try:
+            await self._close(conn)
+        except Exception as e:
+            logger.debug(f"关闭连接失败: {str(e)}")
+    
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_idle())
+    
+    async def _reap_idle(self):
+        """定期回收空闲超时的连接，至少保留 min_size 个"""
+        interval = max(1.0, min(self.idle_timeout, self.health_check_interval))
+        while not self._closed:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            # 队头是最久未使用的连接
+            while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+                conn, _ = self._idle.popleft()
+                await self._close_quietly(conn)
+    
+    async def close(self):
+        """关闭连接池；借出中的连接会在归还时关闭"""
+        self._closed = True
+        if self._reaper and not self._reaper.done():
+            self._reaper.cancel()
+        while self._idle:
+            conn, _ = self._idle.popleft()
+            await self._close_quietly(conn)
+
+
+class PoolRegistry:
+    """按数据源ID和连接参数维护连接池"""
+    
+    def __init__(self):
+        self._pools: Dict[Tuple, ConnectionPool] = {}
+    
+    @staticmethod
+    def make_key(datasource_id: int, db_type: str, host: str, port: int,
+                 database: str, username: str, password: str) -> Tuple:
+        """连接参数变化（例如数据源被修改）后会得到新的连接池"""
+        password_digest = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return (datasource_id, db_type, host, port, database, username, password_digest)
+    
+    def get_pool(self, key: Tuple, **pool_options) -> ConnectionPool:
+        """获取连接池，不存在时按给定参数创建"""
+        pool = self._pools.get(key)
+        if pool is None:
+            pool_options.setdefault("min_size", settings.DATASOURCE_POOL_MIN_SIZE)
+            pool_options.setdefault("max_size", settings.DATASOURCE_POOL_MAX_SIZE)
+            pool_options.setdefault("idle_timeout", settings.DATASOURCE_POOL_IDLE_TIMEOUT)
+            pool_options.setdefault("health_check_interval", settings.DATASOURCE_POOL_HEALTH_CHECK_INTERVAL)
+            pool_options.setdefault("acquire_timeout", settings.DATASOURCE_POOL_TIMEOUT)
+            pool = ConnectionPool(**pool_options)
+            self._pools[key] = pool
+        return pool
+    
+    async def close_datasource(self, datasource_id: int):
+        """关闭某个数据源的全部连接池"""
+        for key in [key for key in self._pools if key[0] == datasource_id]:
+            await self._pools.pop(key).close()
+    
+    async def close_all(self):
+        """关闭所有连接池"""
+        while self._pools:
+            _, pool = self._pools.popitem()
+            await pool.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        """所有连接池的状态"""
+        return {pool.name: pool.stats() for pool in self._pools.values()}
+
+
+pool_registry = PoolRegistry()
\ No newline at end of file
@@ -1,241 +1,1162 @@
+import asyncio
 import aiomysql
 import aiosqlite
 import pyodbc
-from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Sequence, Tuple, Union
 from sqlalchemy import text
+import hashlib
 import json
 import logging
+import sqlite3
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 
+from app.core.config import settings
 from app.models.models import DatabaseType
+from app.services.connection_pool import ConnectionPool, pool_registry
+from app.services.blocking_executor import sqlserver_executor
+from app.services.filters import RowFilter
 
 logger = logging.getLogger(__name__)
 
+# sqlite3 不能直接绑定 Decimal（如来自MySQL/SQL Server的 decimal 列），按字符串写入以保留精度，由列的类型亲和性转换
+sqlite3.register_adapter(Decimal, str)
+
+# get_catalog 指定的表不超过该数量时在SQL中过滤（SQL Server单条语句最多2100个参数）
+_MAX_CATALOG_FILTER = 500
+
+# 数据校验时在SQLite连接上注册的行校验函数
+_SQLITE_CHECKSUM_FUNCTION = "migration_row_checksum"
+# 行校验和中列值的规范化类别，与方言无关；浮点数按6位小数、时间按毫秒比较
+CHECKSUM_KINDS = ("integer", "decimal", "float", "date", "time", "datetime", "binary", "char", "uuid", "text")
+
+
+def _decimal_text(value: Decimal) -> str:
+    """十进制数的规范文本：不用科学计数法，去掉小数部分末尾的0"""
+    if value == 0:
+        return "0"
+    text = format(value, "f")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+def canonical_value(kind: str, value: Any) -> Optional[str]:
+    """列值按类别换算为规范文本，与 get_chunk_checksum 中MySQL/SQL Server的SQL表达式结果一致"""
+    if value is None:
+        return None
+    try:
+        if kind == "integer":
+            if isinstance(value, (bool, int)):
+                return str(int(value))
+            number = Decimal(str(value))
+            return str(int(number)) if number == number.to_integral_value() else str(value)
+        if kind == "decimal":
+            return _decimal_text(Decimal(str(value)))
+        if kind == "float":
+            return _decimal_text(Decimal(repr(float(value))).quantize(Decimal("0.000001"), ROUND_HALF_UP))
+        if kind == "date":
+            if isinstance(value, date):
+                return value.strftime("%Y-%m-%d")
+            return date.fromisoformat(str(value)[:10]).strftime("%Y-%m-%d")
+        if kind == "datetime":
+            if not isinstance(value, datetime):
+                value = datetime.fromisoformat(str(value))
+            return value.strftime("%Y-%m-%d %H:%M:%S.%f")[:23]
+        if kind == "time":
+            if not isinstance(value, time):
+                value = time.fromisoformat(str(value))
+            return value.strftime("%H:%M:%S.%f")[:12]
+    except (ArithmeticError, InvalidOperation, TypeError, ValueError):
+        return str(value)
+    if kind == "binary":
+        return (value.encode("utf-8") if isinstance(value, str) else bytes(value)).hex()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if kind == "uuid" and len(value) == 16:
+            return str(uuid.UUID(bytes=bytes(value)))
+        value = bytes(value).decode("utf-8", errors="replace")
+    if kind == "char":
+        return str(value).rstrip(" ")
+    if kind == "uuid":
+        return str(value).lower()
+    return str(value)
+
+
+def row_checksum(kinds: str, *values) -> int:
+    """一行的校验值：各列规范文本以 | 连接并追加NULL标记，取UTF-16LE编码的MD5前4字节（无符号整数）
+    
+    kinds 为逗号分隔的列类别。SQLite 校验时注册为SQL函数，MySQL和SQL Server在数据库端计算同样的值。
+    """
+    texts = [canonical_value(kind, value) for kind, value in zip(kinds.split(","), values)]
+    row = "|".join(text or "" for text in texts) + "|" + "".join("1" if value is None else "0" for value in values)
+    return int.from_bytes(hashlib.md5(row.encode("utf-16-le")).digest()[:4], "big")
+
+
+async def complete_uninterrupted(aw):
+    """等待一个不能半途放弃的操作完成（例如已发出的提交）
+    
+    期间收到的取消请求推迟到操作完成之后重新投递，调用方在下一个等待点才看到取消。
+    """
+    future = asyncio.ensure_future(aw)
+    task = asyncio.current_task()
+    cancelled = False
+    while True:
+        try:
+            result = await asyncio.shield(future)
+            break
+        except asyncio.CancelledError:
+            if future.cancelled():
+                raise
+            task.uncancel()
+            cancelled = True
+    if cancelled:
+        task.cancel()
+    return result
+
 
 class DatabaseConnection:
     """数据库连接管理器"""
     
     def __init__(self, db_type: DatabaseType, host: str, port: int, 
-                 database: str, username: str, password: str):
+                 database: str, username: str, password: str,
+                 datasource_id: Optional[int] = None):
         self.db_type = db_type
         self.host = host
         self.port = port
         self.database = database
         self.username = username
         self.password = password
+        # 指定数据源ID时连接从该数据源的连接池借用，否则每次新建连接（如保存前的连接测试）
+        self.datasource_id = datasource_id
         self.connection = None
     
+    def _sqlserver_conn_str(self) -> str:
+        return (
+            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+            f"SERVER={self.host},{self.port};"
+            f"DATABASE={self.database};"
+            f"UID={self.username};"
+            f"PWD={self.password};"
+            f"Connection Timeout={settings.DATASOURCE_CONNECT_TIMEOUT};"
+        )
+    
+    async def _connect(self):
+        """新建一个原始数据库连接"""
+        if self.db_type == DatabaseType.MYSQL:
+            return await aiomysql.connect(
+                host=self.host,
+                port=self.port,
+                user=self.username,
+                password=self.password,
+                db=self.database,
+                connect_timeout=settings.DATASOURCE_CONNECT_TIMEOUT,
+                autocommit=True,
+                local_infile=settings.MYSQL_LOAD_DATA_LOCAL
+            )
+        elif self.db_type == DatabaseType.SQLSERVER:
+            # 读操作使用自动提交，写入时再显式开启事务
+            return await sqlserver_executor.run(pyodbc.connect, self._sqlserver_conn_str(), autocommit=True)
+        elif self.db_type == DatabaseType.SQLITE:
+            return await aiosqlite.connect(self.database)
+        raise ValueError(f"不支持的数据库类型: {self.db_type}")
+    
+    async def _close(self, conn):
+        """关闭原始数据库连接"""
+        if self.db_type == DatabaseType.SQLITE:
+            await conn.close()
+        elif self.db_type == DatabaseType.SQLSERVER:
+            await self._sqlserver_call(conn.close)
+        else:
+            conn.close()
+    
+    async def _ping(self, conn) -> bool:
+        """连接健康检查"""
+        if self.db_type == DatabaseType.MYSQL:
+            await conn.ping(reconnect=False)
+        elif self.db_type == DatabaseType.SQLSERVER:
+            await self._sqlserver_call(self._sqlserver_fetchall, conn, "SELECT 1")
+        elif self.db_type == DatabaseType.SQLITE:
+            async with conn.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+        return True
+    
+    async def _reset(self, conn):
+        """归还连接池前回滚未结束的事务"""
+        if self.db_type == DatabaseType.SQLSERVER:
+            if not conn.autocommit:
+                await self._sqlserver_call(self._sqlserver_rollback, conn)
+        elif self.db_type == DatabaseType.SQLITE:
+            if conn.in_transaction:
+                await conn.rollback()
+    
+    async def _sqlserver_call(self, func, *args):
+        """在sqlserver_executor中执行与连接相关的阻塞调用
+        
+        调用方被取消时先等待工作线程结束再抛出CancelledError，
+        保证同一个pyodbc连接不会被两个线程同时使用（例如随后的回滚或关闭）。
+        """
+        future = asyncio.ensure_future(sqlserver_executor.run(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+    
+    @staticmethod
+    def _sqlserver_fetchall(conn, query: str, params: Sequence = ()) -> List[tuple]:
+        """执行查询并返回全部结果（阻塞调用，需在sqlserver_executor中执行）"""
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _sqlserver_fetch(conn, query: str, params: Sequence = ()) -> Tuple[List[str], List[tuple]]:
+        """执行查询并返回 (列名列表, 全部结果)（阻塞调用，需在sqlserver_executor中执行）"""
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            columns = [desc[0] for desc in cursor.description]
+            return columns, [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _sqlserver_executemany(conn, query: str, rows: List[Sequence], fast: bool = False,
+                               identity_table: Optional[str] = None):
+        """开启事务并批量执行，提交由调用方决定（阻塞调用，需在sqlserver_executor中执行）
+        
+        identity_table 为转义后的表名时，执行期间对该表开启 IDENTITY_INSERT 以显式写入标识列；
+        该设置作用于整个会话且同一时刻只能对一个表开启，执行结束后立即关闭，连接归还连接池后不影响其他任务。
+        """
+        conn.autocommit = False
+        cursor = conn.cursor()
+        # fast_executemany 把整批参数打包为一次往返发送
+        cursor.fast_executemany = fast
+        try:
+            if identity_table:
+                cursor.execute(f"SET IDENTITY_INSERT {identity_table} ON")
+            try:
+                cursor.executemany(query, rows)
+            finally:
+                if identity_table:
+                    cursor.execute(f"SET IDENTITY_INSERT {identity_table} OFF")
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _sqlserver_execute(conn, statement: str, params: Sequence = ()):
+        """执行不返回结果的语句（阻塞调用，需在sqlserver_executor中执行）"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(statement, params)
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _sqlserver_commit(conn):
+        """提交并恢复自动提交（阻塞调用，需在sqlserver_executor中执行）"""
+        conn.commit()
+        conn.autocommit = True
+    
+    @staticmethod
+    def _sqlserver_rollback(conn):
+        """回滚并恢复自动提交（阻塞调用，需在sqlserver_executor中执行）"""
+        conn.rollback()
+        conn.autocommit = True
+    
+    @property
+    def pool(self) -> Optional[ConnectionPool]:
+        """当前数据源的连接池，未指定数据源ID时为None"""
+        if self.datasource_id is None:
+            return None
+        key = pool_registry.make_key(
+            self.datasource_id, self.db_type.value, self.host, self.port,
+            self.database, self.username, self.password
+        )
+        return pool_registry.get_pool(
+            key,
+            name=f"{self.db_type.value}#{self.datasource_id}@{self.host}:{self.port}/{self.database}",
+            create=self._connect,
+            close=self._close,
+            ping=self._ping,
+            reset=self._reset
+        )
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """借用一个数据库连接；有连接池时从池中借出，否则新建并在使用后关闭"""
+        pool = self.pool
+        if pool is not None:
+            async with pool.acquire() as conn:
+                yield conn
+            return
+        
+        conn = await self._connect()
+        try:
+            yield conn
+        finally:
+            await self._close(conn)
+    
     async def test_connection(self) -> bool:
         """测试数据库连接"""
         try:
-            if self.db_type == DatabaseType.MYSQL:
-                conn = await aiomysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.username,
-                    password=self.password,
-                    db=self.database,
-                    connect_timeout=10
-                )
-                conn.close()
-                return True
-                
-            elif self.db_type == DatabaseType.SQLSERVER:
-                # SQL Server连接字符串
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.host},{self.port};"
-                    f"DATABASE={self.database};"
-                    f"UID={self.username};"
-                    f"PWD={self.password};"
-                    f"Connection Timeout=10;"
-                )
-                conn = pyodbc.connect(conn_str)
-                conn.close()
-                return True
-                
-            elif self.db_type == DatabaseType.SQLITE:
-                conn = await aiosqlite.connect(self.database)
-                await conn.close()
-                return True
+            async with self.acquire() as conn:
+                return await self._ping(conn)
                 
         except Exception as e:
             logger.error(f"数据库连接测试失败: {str(e)}")
             return False
     
-    async def get_tables(self) -> List[Dict[str, Any]]:
-        """获取数据库中的所有表"""
+    async def get_tables(self, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """获取数据库中的所有表；查询失败时返回空列表，raise_errors 为 True 时抛出异常"""
         try:
             tables = []
             
-            if self.db_type == DatabaseType.MYSQL:
-                conn = await aiomysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.username,
-                    password=self.password,
-                    db=self.database
-                )
-                async with conn.cursor() as cursor:
-                    await cursor.execute("SHOW TABLES")
-                    result = await cursor.fetchall()
-                    tables = [{"name": table[0], "type": "table"} for table in result]
-                conn.close()
-                
-            elif self.db_type == DatabaseType.SQLSERVER:
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.host},{self.port};"
-                    f"DATABASE={self.database};"
-                    f"UID={self.username};"
-                    f"PWD={self.password};"
-                )
-                conn = pyodbc.connect(conn_str)
-                cursor = conn.cursor()
-                cursor.execute("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_TYPE = 'BASE TABLE'")
-                result = cursor.fetchall()
-                tables = [{"name": table[0], "type": "table"} for table in result]
-                cursor.close()
-                conn.close()
-                
-            elif self.db_type == DatabaseType.SQLITE:
-                conn = await aiosqlite.connect(self.database)
-                async with conn.execute("SELECT name FROM sqlite_master WHERE type='table'") as cursor:
-                    result = await cursor.fetchall()
+            async with self.acquire() as conn:
+                if self.db_type == DatabaseType.MYSQL:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute("SHOW TABLES")
+                        result = await cursor.fetchall()
+                        tables = [{"name": table[0], "type": "table"} for table in result]
+                    
+                elif self.db_type == DatabaseType.SQLSERVER:
+                    result = await self._sqlserver_call(
+                        self._sqlserver_fetchall, conn,
+                        "SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_TYPE = 'BASE TABLE'"
+                    )
                     tables = [{"name": table[0], "type": "table"} for table in result]
-                await conn.close()
+                    
+                elif self.db_type == DatabaseType.SQLITE:
+                    async with conn.execute("SELECT name FROM sqlite_master WHERE type='table'") as cursor:
+                        result = await cursor.fetchall()
+                        tables = [{"name": table[0], "type": "table"} for table in result]
             
             return tables
             
         except Exception as e:
             logger.error(f"获取表列表失败: {str(e)}")
+            if raise_errors:
+                raise
             return []
     
-    async def get_table_schema(self, table_name: str) -> List[Dict[str, Any]]:
-        """获取表结构"""
+    async def get_table_schema(self, table_name: str, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """获取表结构；查询失败时返回空列表，raise_errors 为 True 时抛出异常"""
         try:
             schema = []
             
-            if self.db_type == DatabaseType.MYSQL:
-                conn = await aiomysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.username,
-                    password=self.password,
-                    db=self.database
-                )
-                async with conn.cursor() as cursor:
-                    await cursor.execute(f"DESCRIBE {table_name}")
-                    result = await cursor.fetchall()
+            async with self.acquire() as conn:
+                if self.db_type == DatabaseType.MYSQL:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(f"DESCRIBE {table_name}")
+                        result = await cursor.fetchall()
+                        for row in result:
+                            schema.append({
+                                "column_name": row[0],
+                                "data_type": row[1],
+                                "is_nullable": row[2] == "YES",
+                                "default_value": row[4],
+                                "is_primary_key": row[3] == "PRI",
+                                "is_auto_increment": "auto_increment" in (row[5] or "").lower()
+                            })
+                    
+                elif self.db_type == DatabaseType.SQLSERVER:
+                    result = await self._sqlserver_call(self._sqlserver_fetchall, conn, """
+                        SELECT c.COLUMN_NAME, c.DATA_TYPE, c.IS_NULLABLE, c.COLUMN_DEFAULT,
+                               CASE WHEN pk.COLUMN_NAME IS NULL THEN 0 ELSE 1 END,
+                               c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE,
+                               c.DATETIME_PRECISION,
+                               COLUMNPROPERTY(OBJECT_ID(QUOTENAME(c.TABLE_SCHEMA) + '.' + QUOTENAME(c.TABLE_NAME)),
+                                              c.COLUMN_NAME, 'IsIdentity')
+                        FROM INFORMATION_SCHEMA.COLUMNS c
+                        LEFT JOIN (
+                            SELECT ku.TABLE_SCHEMA, ku.TABLE_NAME, ku.COLUMN_NAME
+                            FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+                            JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku
+                              ON ku.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+                             AND ku.TABLE_SCHEMA = tc.TABLE_SCHEMA
+                            WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+                        ) pk ON pk.TABLE_SCHEMA = c.TABLE_SCHEMA
+                            AND pk.TABLE_NAME = c.TABLE_NAME
+                            AND pk.COLUMN_NAME = c.COLUMN_NAME
+                        WHERE c.TABLE_NAME = ?
+                        ORDER BY c.ORDINAL_POSITION
+                    """, (table_name,))
                     for row in result:
                         schema.append({
                             "column_name": row[0],
-                            "data_type": row[1],
+                            "data_type": self._sqlserver_full_type(row[1], row[5], row[6], row[7], row[8]),
                             "is_nullable": row[2] == "YES",
-                            "default_value": row[4],
-                            "is_primary_key": row[3] == "PRI"
-                        })
-                conn.close()
-                
-            elif self.db_type == DatabaseType.SQLSERVER:
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.host},{self.port};"
-                    f"DATABASE={self.database};"
-                    f"UID={self.username};"
-                    f"PWD={self.password};"
-                )
-                conn = pyodbc.connect(conn_str)
-                cursor = conn.cursor()
-                cursor.execute(f"""
-                    SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT 
-                    FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_NAME = '{table_name}'
-                """)
-                result = cursor.fetchall()
-                for row in result:
-                    schema.append({
-                        "column_name": row[0],
-                        "data_type": row[1],
-                        "is_nullable": row[2] == "YES",
-                        "default_value": row[3],
-                        "is_primary_key": False  # 需要额外查询主键信息
-                    })
-                cursor.close()
-                conn.close()
-                
-            elif self.db_type == DatabaseType.SQLITE:
-                conn = await aiosqlite.connect(self.database)
-                async with conn.execute(f"PRAGMA table_info({table_name})") as cursor:
-                    result = await cursor.fetchall()
-                    for row in result:
-                        schema.append({
-                            "column_name": row[1],
-                            "data_type": row[2],
-                            "is_nullable": not row[3],
-                            "default_value": row[4],
-                            "is_primary_key": bool(row[5])
+                            "default_value": row[3],
+                            "is_primary_key": bool(row[4]),
+                            "is_auto_increment": bool(row[9])
                         })
-                await conn.close()
+                    
+                elif self.db_type == DatabaseType.SQLITE:
+                    async with conn.execute(f"PRAGMA table_info({table_name})") as cursor:
+                        result = await cursor.fetchall()
+                        for row in result:
+                            schema.append({
+                                "column_name": row[1],
+                                "data_type": row[2],
+                                "is_nullable": not row[3],
+                                "default_value": row[4],
+                                "is_primary_key": bool(row[5])
+                            })
+                    self._mark_sqlite_rowid(schema)
             
             return schema
             
         except Exception as e:
             logger.error(f"获取表结构失败: {str(e)}")
+            if raise_errors:
+                raise
             return []
     
-    async def get_table_count(self, table_name: str, filter_condition: Optional[str] = None) -> int:
-        """获取表记录数"""
-        try:
-            count = 0
+    @staticmethod
+    def _mark_sqlite_rowid(columns: List[Dict[str, Any]]):
+        """SQLite没有自增属性：唯一的主键列声明为 INTEGER 时是 rowid 的别名，未指定值时自动分配"""
+        primary_key = [column for column in columns if column["is_primary_key"]]
+        for column in columns:
+            column["is_auto_increment"] = (
+                len(primary_key) == 1 and column is primary_key[0]
+                and (column["data_type"] or "").strip().upper() == "INTEGER"
+            )
+    
+    @staticmethod
+    def _sqlserver_full_type(data_type: str, max_length: Optional[int], precision: Optional[int],
+                             scale: Optional[int], datetime_precision: Optional[int]) -> str:
+        """把 INFORMATION_SCHEMA 中分开存放的长度、精度拼回完整类型，如 nvarchar(50)、decimal(10,2)"""
+        name = data_type.lower()
+        if name in ("char", "varchar", "nchar", "nvarchar", "binary", "varbinary"):
+            if max_length == -1:
+                return f"{name}(max)"
+            if max_length:
+                return f"{name}({max_length})"
+        elif name in ("decimal", "numeric") and precision is not None:
+            return f"{name}({precision},{scale or 0})"
+        elif name in ("datetime2", "datetimeoffset", "time") and datetime_precision is not None:
+            return f"{name}({datetime_precision})"
+        return name
+    
+    async def get_table_indexes(self, table_name: str) -> List[Dict[str, Any]]:
+        """获取表的二级索引（不含主键），列按索引中的顺序排列"""
+        indexes: Dict[str, Dict[str, Any]] = {}
+        
+        def add(name: str, column: str, is_unique: bool):
+            index = indexes.setdefault(name, {"index_name": name, "columns": [], "is_unique": is_unique})
+            index["columns"].append(column)
+        
+        async with self.acquire() as conn:
+            if self.db_type == DatabaseType.MYSQL:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(f"SHOW INDEX FROM {self.quote_identifier(table_name)}")
+                    # Table, Non_unique, Key_name, Seq_in_index, Column_name, ...
+                    for row in await cursor.fetchall():
+                        if row[2] != "PRIMARY":
+                            add(row[2], row[4], not row[1])
             
+            elif self.db_type == DatabaseType.SQLSERVER:
+                result = await self._sqlserver_call(self._sqlserver_fetchall, conn, """
+                    SELECT i.name, c.name, i.is_unique
+                    FROM sys.indexes i
+                    JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+                    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                    WHERE i.object_id = OBJECT_ID(?) AND i.is_primary_key = 0 AND i.type > 0
+                      AND ic.is_included_column = 0
+                    ORDER BY i.index_id, ic.key_ordinal
+                """, (table_name,))
+                for name, column, is_unique in result:
+                    add(name, column, bool(is_unique))
+            
+            elif self.db_type == DatabaseType.SQLITE:
+                async with conn.execute(f"PRAGMA index_list({self.quote_identifier(table_name)})") as cursor:
+                    # seq, name, unique, origin（c: CREATE INDEX, u: UNIQUE约束, pk: 主键）, partial
+                    index_list = [row for row in await cursor.fetchall() if row[3] != "pk"]
+                for row in index_list:
+                    async with conn.execute(f"PRAGMA index_info({self.quote_identifier(row[1])})") as cursor:
+                        for info in await cursor.fetchall():
+                            add(row[1], info[2], bool(row[2]))
+        
+        return list(indexes.values())
+    
+    async def get_catalog(self, tables: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """批量读取表的列、主键、二级索引、外键和估算行数
+        
+        每类信息用一条目录查询取得所有表（或 tables 指定的表），查询次数与表的数量无关，
+        全部在同一个连接上执行。列和索引的格式与 get_table_schema、get_table_indexes 相同，
+        外键为 {name, columns, referenced_table, referenced_columns}，
+        row_estimate 为统计信息中的行数，没有统计信息时为None。
+        """
+        selected = list(dict.fromkeys(tables)) if tables else []
+        # 指定的表过多时查询全部再过滤，避免超出单条语句的参数个数限制
+        in_sql = len(selected) <= _MAX_CATALOG_FILTER
+        
+        def table_filter(column: str) -> Tuple[str, List[Any]]:
+            if not selected or not in_sql:
+                return "", []
+            return f" AND {column} IN ({', '.join([self.placeholder] * len(selected))})", list(selected)
+        
+        catalog: Dict[str, Dict[str, Any]] = {}
+        
+        def entry(table: str) -> Dict[str, Any]:
+            return catalog.setdefault(table, {
+                "name": table, "columns": [], "primary_key": [], "indexes": [],
+                "foreign_keys": [], "row_estimate": None
+            })
+        
+        def add_index(table: str, name: str, column: str, is_unique: bool, is_primary: bool):
+            if is_primary:
+                entry(table)["primary_key"].append(column)
+                return
+            indexes = entry(table)["indexes"]
+            if not indexes or indexes[-1]["index_name"] != name:
+                indexes.append({"index_name": name, "columns": [], "is_unique": is_unique})
+            indexes[-1]["columns"].append(column)
+        
+        def add_foreign_key(table: str, name: str, column: str, referenced_table: str, referenced_column: str):
+            foreign_keys = entry(table)["foreign_keys"]
+            if not foreign_keys or foreign_keys[-1]["name"] != name:
+                foreign_keys.append({
+                    "name": name, "columns": [], "referenced_table": referenced_table, "referenced_columns": []
+                })
+            foreign_keys[-1]["columns"].append(column)
+            foreign_keys[-1]["referenced_columns"].append(referenced_column)
+        
+        async with self.acquire() as conn:
             if self.db_type == DatabaseType.MYSQL:
-                conn = await aiomysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.username,
-                    password=self.password,
-                    db=self.database
+                where, params = table_filter("c.TABLE_NAME")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.COLUMN_TYPE, c.IS_NULLABLE, c.COLUMN_DEFAULT, c.COLUMN_KEY,
+                           c.EXTRA
+                    FROM information_schema.COLUMNS c
+                    JOIN information_schema.TABLES t
+                      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+                    WHERE c.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE'{where}
+                    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+                """, params)
+                for table, column, data_type, nullable, default, key, extra in rows:
+                    entry(table)["columns"].append({
+                        "column_name": column,
+                        "data_type": data_type,
+                        "is_nullable": nullable == "YES",
+                        "default_value": default,
+                        "is_primary_key": key == "PRI",
+                        "is_auto_increment": "auto_increment" in (extra or "").lower()
+                    })
+                
+                where, params = table_filter("TABLE_NAME")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME
+                    FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE(){where}
+                    ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+                """, params)
+                for table, name, non_unique, column in rows:
+                    add_index(table, name, column, not int(non_unique), name == "PRIMARY")
+                
+                where, params = table_filter("TABLE_NAME")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+                    FROM information_schema.KEY_COLUMN_USAGE
+                    WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL{where}
+                    ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+                """, params)
+                for row in rows:
+                    add_foreign_key(*row)
+                
+                where, params = table_filter("TABLE_NAME")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'{where}
+                """, params)
+            
+            elif self.db_type == DatabaseType.SQLSERVER:
+                where, params = table_filter("c.TABLE_NAME")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE, c.IS_NULLABLE, c.COLUMN_DEFAULT,
+                           CASE WHEN pk.COLUMN_NAME IS NULL THEN 0 ELSE 1 END,
+                           c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE,
+                           c.DATETIME_PRECISION,
+                           COLUMNPROPERTY(OBJECT_ID(QUOTENAME(c.TABLE_SCHEMA) + '.' + QUOTENAME(c.TABLE_NAME)),
+                                          c.COLUMN_NAME, 'IsIdentity')
+                    FROM INFORMATION_SCHEMA.COLUMNS c
+                    JOIN INFORMATION_SCHEMA.TABLES t
+                      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+                    LEFT JOIN (
+                        SELECT ku.TABLE_SCHEMA, ku.TABLE_NAME, ku.COLUMN_NAME
+                        FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+                        JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku
+                          ON ku.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+                         AND ku.TABLE_SCHEMA = tc.TABLE_SCHEMA
+                        WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+                    ) pk ON pk.TABLE_SCHEMA = c.TABLE_SCHEMA
+                        AND pk.TABLE_NAME = c.TABLE_NAME
+                        AND pk.COLUMN_NAME = c.COLUMN_NAME
+                    WHERE t.TABLE_TYPE = 'BASE TABLE'{where}
+                    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+                """, params)
+                for row in rows:
+                    entry(row[0])["columns"].append({
+                        "column_name": row[1],
+                        "data_type": self._sqlserver_full_type(row[2], row[6], row[7], row[8], row[9]),
+                        "is_nullable": row[3] == "YES",
+                        "default_value": row[4],
+                        "is_primary_key": bool(row[5]),
+                        "is_auto_increment": bool(row[10])
+                    })
+                
+                where, params = table_filter("t.name")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT t.name, i.name, i.is_unique, c.name, i.is_primary_key
+                    FROM sys.tables t
+                    JOIN sys.indexes i ON i.object_id = t.object_id
+                    JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+                    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                    WHERE i.type > 0 AND ic.is_included_column = 0{where}
+                    ORDER BY t.name, i.index_id, ic.key_ordinal
+                """, params)
+                for table, name, is_unique, column, is_primary in rows:
+                    add_index(table, name, column, bool(is_unique), bool(is_primary))
+                
+                where, params = table_filter("t.name")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT t.name, fk.name, c.name, rt.name, rc.name
+                    FROM sys.foreign_keys fk
+                    JOIN sys.tables t ON t.object_id = fk.parent_object_id
+                    JOIN sys.tables rt ON rt.object_id = fk.referenced_object_id
+                    JOIN sys.foreign_key_columns fkc ON fkc.constraint_object_id = fk.object_id
+                    JOIN sys.columns c ON c.object_id = fkc.parent_object_id AND c.column_id = fkc.parent_column_id
+                    JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id AND rc.column_id = fkc.referenced_column_id
+                    WHERE 1 = 1{where}
+                    ORDER BY t.name, fk.name, fkc.constraint_column_id
+                """, params)
+                for row in rows:
+                    add_foreign_key(*row)
+                
+                where, params = table_filter("t.name")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT t.name, SUM(ps.row_count)
+                    FROM sys.tables t
+                    JOIN sys.dm_db_partition_stats ps ON ps.object_id = t.object_id AND ps.index_id IN (0, 1)
+                    WHERE 1 = 1{where}
+                    GROUP BY t.name
+                """, params)
+            
+            elif self.db_type == DatabaseType.SQLITE:
+                # 表值函数 pragma_table_info / pragma_index_list 可以在一条查询中读取所有表
+                where, params = table_filter("m.name")
+                _, rows = await self._fetch(conn, f"""
+                    SELECT m.name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+                    FROM sqlite_master m JOIN pragma_table_info(m.name) p
+                    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'{where}
+                    ORDER BY m.name, p.cid
+                """, params)
+                primary_keys: Dict[str, List[Tuple[int, str]]] = {}
+                for table, column, data_type, notnull, default, pk in rows:
+                    entry(table)["columns"].append({
+                        "column_name": column,
+                        "data_type": data_type,
+                        "is_nullable": not notnull,
+                        "default_value": default,
+                        "is_primary_key": bool(pk)
+                    })
+                    if pk:
+                        primary_keys.setdefault(table, []).append((pk, column))
+                for table, columns in primary_keys.items():
+                    entry(table)["primary_key"] = [column for _, column in sorted(columns)]
+                for table in catalog.values():
+                    self._mark_sqlite_rowid(table["columns"])
+                
+                _, rows = await self._fetch(conn, f"""
+                    SELECT m.name, il.name, il."unique", ii.name
+                    FROM sqlite_master m
+                    JOIN pragma_index_list(m.name) il
+                    JOIN pragma_index_info(il.name) ii
+                    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND il.origin <> 'pk'{where}
+                    ORDER BY m.name, il.name, ii.seqno
+                """, params)
+                for table, name, is_unique, column in rows:
+                    add_index(table, name, column, bool(is_unique), False)
+                
+                # 外键没有名称，按 id 区分同一个表的多个外键；to 为空时引用被引用表的主键
+                _, rows = await self._fetch(conn, f"""
+                    SELECT m.name, fk.id, fk."from", fk."table", fk."to"
+                    FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) fk
+                    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'{where}
+                    ORDER BY m.name, fk.id, fk.seq
+                """, params)
+                for table, fk_id, column, referenced_table, referenced_column in rows:
+                    add_foreign_key(table, f"fk_{table}_{fk_id}", column, referenced_table, referenced_column)
+                
+                rows = []
+                _, stat_tables = await self._fetch(
+                    conn, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
                 )
+                if stat_tables:
+                    # stat 的第一个数字为表的行数，每个表取一行
+                    _, stats = await self._fetch(conn, "SELECT tbl, stat FROM sqlite_stat1 ORDER BY tbl, idx IS NOT NULL")
+                    seen = set()
+                    for table, stat in stats:
+                        if table not in seen:
+                            seen.add(table)
+                            rows.append((table, int(stat.split()[0])))
+            else:
+                raise ValueError(f"不支持的数据库类型: {self.db_type}")
+        
+        for table, row_count in rows:
+            if table in catalog and row_count is not None:
+                catalog[table]["row_estimate"] = int(row_count)
+        
+        result = [catalog[name] for name in sorted(catalog)]
+        if selected and not in_sql:
+            wanted = set(selected)
+            result = [table for table in result if table["name"] in wanted]
+        return result
+    
+    async def table_exists(self, table_name: str) -> bool:
+        """表或同名视图是否存在（表名不区分大小写）
+        
+        直接查询系统目录，查询失败时抛出异常，不会把连接或权限错误当作表不存在。
+        """
+        if self.db_type == DatabaseType.MYSQL:
+            query = "SELECT COUNT(*) FROM information_schema.TABLES " \
+                    "WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) = LOWER(%s)"
+        elif self.db_type == DatabaseType.SQLSERVER:
+            query = "SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE LOWER(TABLE_NAME) = LOWER(?)"
+        else:
+            query = "SELECT COUNT(*) FROM sqlite_master WHERE type IN ('table', 'view') AND LOWER(name) = LOWER(?)"
+        rows = await self.fetch_all(query, (table_name,))
+        return bool(rows and rows[0][0])
+    
+    async def fetch_all(self, query: str, params: Sequence = ()) -> List[Sequence]:
+        """借用一个连接执行查询并返回全部结果（用于读取元数据）"""
+        async with self.acquire() as conn:
+            _, rows = await self._fetch(conn, query, params)
+        return rows
+    
+    async def execute(self, statement: str):
+        """执行一条不返回结果的语句（如DDL）"""
+        async with self.acquire() as conn:
+            if self.db_type == DatabaseType.MYSQL:
                 async with conn.cursor() as cursor:
-                    query = f"SELECT COUNT(*) FROM {table_name}"
-                    if filter_condition:
-                        query += f" WHERE {filter_condition}"
-                    await cursor.execute(query)
-                    result = await cursor.fetchone()
-                    count = result[0] if result else 0
-                conn.close()
-                
+                    await cursor.execute(statement)
             elif self.db_type == DatabaseType.SQLSERVER:
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.host},{self.port};"
-                    f"DATABASE={self.database};"
-                    f"UID={self.username};"
-                    f"PWD={self.password};"
+                await self._sqlserver_call(self._sqlserver_execute, conn, statement)
+            elif self.db_type == DatabaseType.SQLITE:
+                await conn.execute(statement)
+                await conn.commit()
+    
+    async def get_table_count(self, table_name: str, row_filter: Optional[RowFilter] = None) -> int:
+        """获取表记录数，过滤条件以参数形式下推到数据库"""
+        where, params = self._where(row_filter)
+        query = f"SELECT COUNT(*) FROM {self.quote_identifier(table_name)}{where}"
+        async with self.acquire() as conn:
+            _, rows = await self._fetch(conn, query, params)
+        return rows[0][0] if rows else 0
+    
+    async def estimate_row_count(self, table_name: str) -> Optional[int]:
+        """从系统目录的统计信息估算表行数，不扫描表；没有可用统计信息时返回None
+        
+        MySQL: information_schema.TABLES.TABLE_ROWS（InnoDB为抽样估计）
+        SQL Server: sys.dm_db_partition_stats 中堆或聚集索引的行数
+        SQLite: ANALYZE 生成的 sqlite_stat1，没有时用 MAX(rowid)
+        """
+        try:
+            if self.db_type == DatabaseType.MYSQL:
+                rows = await self.fetch_all(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    (table_name,)
+                )
+            elif self.db_type == DatabaseType.SQLSERVER:
+                rows = await self.fetch_all(
+                    "SELECT SUM(row_count) FROM sys.dm_db_partition_stats "
+                    "WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)",
+                    (table_name,)
                 )
-                conn = pyodbc.connect(conn_str)
-                cursor = conn.cursor()
-                query = f"SELECT COUNT(*) FROM {table_name}"
-                if filter_condition:
-                    query += f" WHERE {filter_condition}"
-                cursor.execute(query)
-                result = cursor.fetchone()
-                count = result[0] if result else 0
-                cursor.close()
-                conn.close()
-                
             elif self.db_type == DatabaseType.SQLITE:
-                conn = await aiosqlite.connect(self.database)
-                query = f"SELECT COUNT(*) FROM {table_name}"
-                if filter_condition:
-                    query += f" WHERE {filter_condition}"
-                async with conn.execute(query) as cursor:
-                    result = await cursor.fetchone()
-                    count = result[0] if result else 0
-                await conn.close()
-            
-            return count
-            
+                rows = []
+                if await self.fetch_all("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"):
+                    # stat 的第一个数字为表的行数
+                    stats = await self.fetch_all(
+                        "SELECT stat FROM sqlite_stat1 WHERE tbl = ? ORDER BY idx IS NOT NULL LIMIT 1",
+                        (table_name,)
+                    )
+                    rows = [(int(stats[0][0].split()[0]),)] if stats else []
+                if not rows:
+                    rows = await self.fetch_all(f"SELECT MAX(rowid) FROM {self.quote_identifier(table_name)}")
+            else:
+                return None
         except Exception as e:
-            logger.error(f"获取表记录数失败: {str(e)}")
-            return 0
\ No newline at end of file
+            logger.warning(f"读取表 {table_name} 的行数统计失败: {str(e)}")
+            return None
+        if not rows or rows[0][0] is None:
+            return None
+        return int(rows[0][0])
+    
+    def quote_identifier(self, name: str) -> str:
+        """按数据库方言转义标识符（表名、列名）"""
+        if self.db_type == DatabaseType.MYSQL:
+            return "`" + name.replace("`", "``") + "`"
+        elif self.db_type == DatabaseType.SQLSERVER:
+            return "[" + name.replace("]", "]]") + "]"
+        return '"' + name.replace('"', '""') + '"'
+    
+    @property
+    def placeholder(self) -> str:
+        """当前驱动使用的参数占位符"""
+        return "%s" if self.db_type == DatabaseType.MYSQL else "?"
+    
+    def _where(self, row_filter: Optional[RowFilter] = None, conditions: Sequence[str] = (),
+               params: Sequence = ()) -> Tuple[str, List[Any]]:
+        """把过滤条件和其他条件（如主键范围）组合为 WHERE 子句和参数列表"""
+        conditions = list(conditions)
+        params = list(params)
+        if row_filter is not None:
+            condition, filter_params = row_filter.compile(self)
+            conditions.insert(0, condition)
+            params[:0] = filter_params
+        if not conditions:
+            return "", params
+        return f" WHERE {' AND '.join(conditions)}", params
+    
+    async def iter_batches(self, table_name: str, batch_size: Union[int, Callable[[], int]],
+                           row_filter: Optional[RowFilter] = None) -> AsyncIterator[Tuple[List[str], List[Sequence]]]:
+        """使用服务端游标分批读取表数据，每次产出 (列名列表, 行列表)，内存占用与表大小无关
+        
+        batch_size 可以是函数，每批读取前调用以取得这一批的行数。
+        """
+        next_size = batch_size if callable(batch_size) else lambda: batch_size
+        where, params = self._where(row_filter)
+        query = f"SELECT * FROM {self.quote_identifier(table_name)}{where}"
+        
+        async with self.acquire() as conn:
+            if self.db_type == DatabaseType.MYSQL:
+                # SSCursor不会把整个结果集缓存到客户端
+                cursor = await conn.cursor(aiomysql.SSCursor)
+                await cursor.execute(query, tuple(params) if params else None)
+                columns = [desc[0] for desc in cursor.description]
+                while True:
+                    rows = await cursor.fetchmany(next_size())
+                    if not rows:
+                        break
+                    yield columns, list(rows)
+                # 中途退出时不关闭游标（关闭会读完剩余结果），由连接池直接丢弃连接
+                await cursor.close()
+                    
+            elif self.db_type == DatabaseType.SQLSERVER:
+                cursor = await self._sqlserver_call(conn.cursor)
+                try:
+                    await self._sqlserver_call(cursor.execute, query, *params)
+                    columns = [desc[0] for desc in cursor.description]
+                    while True:
+                        rows = await self._sqlserver_call(cursor.fetchmany, next_size())
+                        if not rows:
+                            break
+                        yield columns, [tuple(row) for row in rows]
+                finally:
+                    await self._sqlserver_call(cursor.close)
+                    
+            elif self.db_type == DatabaseType.SQLITE:
+                async with conn.execute(query, tuple(params)) as cursor:
+                    columns = [desc[0] for desc in cursor.description]
+                    while True:
+                        rows = await cursor.fetchmany(next_size())
+                        if not rows:
+                            break
+                        yield columns, list(rows)
+    
+    async def _fetch(self, conn, query: str, params: Sequence = ()) -> Tuple[List[str], List[Sequence]]:
+        """在给定连接上执行查询，返回 (列名列表, 全部结果)"""
+        if self.db_type == DatabaseType.MYSQL:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, tuple(params) if params else None)
+                columns = [desc[0] for desc in cursor.description]
+                return columns, list(await cursor.fetchall())
+        elif self.db_type == DatabaseType.SQLSERVER:
+            return await self._sqlserver_call(self._sqlserver_fetch, conn, query, tuple(params))
+        elif self.db_type == DatabaseType.SQLITE:
+            async with conn.execute(query, tuple(params)) as cursor:
+                columns = [desc[0] for desc in cursor.description]
+                return columns, list(await cursor.fetchall())
+        raise ValueError(f"不支持的数据库类型: {self.db_type}")
+    
+    async def get_primary_key(self, table_name: str) -> List[str]:
+        """获取表的主键列（按表结构中的顺序）"""
+        schema = await self.get_table_schema(table_name)
+        return [column["column_name"] for column in schema if column["is_primary_key"]]
+    
+    async def get_identity_columns(self, table_name: str) -> List[str]:
+        """SQL Server 表的标识列（IDENTITY），显式写入这些列需要开启 IDENTITY_INSERT；其他数据库返回空列表"""
+        if self.db_type != DatabaseType.SQLSERVER:
+            return []
+        rows = await self.fetch_all(
+            "SELECT name FROM sys.identity_columns WHERE object_id = OBJECT_ID(?)",
+            (self.quote_identifier(table_name),)
+        )
+        return [row[0] for row in rows]
+    
+    async def get_key_range(self, table_name: str, key_column: str,
+                            row_filter: Optional[RowFilter] = None) -> Tuple[Any, Any]:
+        """获取主键的最小值和最大值"""
+        key = self.quote_identifier(key_column)
+        where, params = self._where(row_filter)
+        query = f"SELECT MIN({key}), MAX({key}) FROM {self.quote_identifier(table_name)}{where}"
+        async with self.acquire() as conn:
+            _, rows = await self._fetch(conn, query, params)
+        return (rows[0][0], rows[0][1]) if rows else (None, None)
+    
+    def _key_range_conditions(self, key: str, lower_key: Any, upper_key: Any) -> Tuple[List[str], List[Any]]:
+        """主键区间 (lower_key, upper_key] 的条件，None 表示该侧不限"""
+        conditions = []
+        params = []
+        if lower_key is not None:
+            conditions.append(f"{key} > {self.placeholder}")
+            params.append(lower_key)
+        if upper_key is not None:
+            conditions.append(f"{key} <= {self.placeholder}")
+            params.append(upper_key)
+        return conditions, params
+    
+    async def get_key_range_stats(self, table_name: str, key_column: str,
+                                  lower_key: Any = None, upper_key: Any = None) -> Tuple[int, Any]:
+        """统计主键区间 (lower_key, upper_key] 内的行数和最大主键"""
+        key = self.quote_identifier(key_column)
+        conditions, params = self._key_range_conditions(key, lower_key, upper_key)
+        where, params = self._where(None, conditions, params)
+        query = f"SELECT COUNT(*), MAX({key}) FROM {self.quote_identifier(table_name)}{where}"
+        async with self.acquire() as conn:
+            _, rows = await self._fetch(conn, query, params)
+        return (rows[0][0] or 0, rows[0][1]) if rows else (0, None)
+    
+    async def get_key_quantiles(self, table_name: str, key_column: str, offsets: List[int],
+                                row_filter: Optional[RowFilter] = None,
+                                lower_key: Any = None, upper_key: Any = None) -> List[Any]:
+        """按行偏移量抽样主键值，用于把非数值主键切分为行数相近的区间；可限定在主键区间 (lower_key, upper_key] 内"""
+        key = self.quote_identifier(key_column)
+        conditions, params = self._key_range_conditions(key, lower_key, upper_key)
+        where, params = self._where(row_filter, conditions, params)
+        query = f"SELECT {key} FROM {self.quote_identifier(table_name)}{where}"
+        
+        values = []
+        async with self.acquire() as conn:
+            for offset in offsets:
+                if self.db_type == DatabaseType.SQLSERVER:
+                    sample_query = f"{query} ORDER BY {key} OFFSET {int(offset)} ROWS FETCH NEXT 1 ROWS ONLY"
+                else:
+                    sample_query = f"{query} ORDER BY {key} LIMIT 1 OFFSET {int(offset)}"
+                _, rows = await self._fetch(conn, sample_query, params)
+                if rows:
+                    values.append(rows[0][0])
+        return values
+    
+    async def get_chunk_checksum(self, conn, table_name: str, key_column: str, columns: Sequence[Tuple[str, str]],
+                                 lower_key: Any = None, upper_key: Any = None,
+                                 row_filter: Optional[RowFilter] = None) -> Tuple[int, int]:
+        """主键区间 (lower_key, upper_key] 内的行数和各行校验值之和，在数据库端计算，不传输行数据
+        
+        columns 为 (列名, 类别) 列表，类别见 CHECKSUM_KINDS。各列值先按类别换算为与方言无关的规范文本
+        （去掉小数末尾的0、时间格式化到毫秒、二进制转为小写十六进制等），校验值的算法见 row_checksum，
+        因此不同类型数据库之间的校验和可以直接比较。SQLite 在连接上注册 row_checksum 函数计算。
+        """
+        key = self.quote_identifier(key_column)
+        conditions, params = self._key_range_conditions(key, lower_key, upper_key)
+        where, params = self._where(row_filter, conditions, params)
+        quoted = [(self.quote_identifier(column), kind) for column, kind in columns]
+        
+        if self.db_type == DatabaseType.MYSQL:
+            # CONCAT_WS 跳过NULL，NULL 先换成空串，再追加各列的 ISNULL 标记区分NULL和空串
+            values = ", ".join(f"COALESCE({self._mysql_canonical(column, kind)}, '')" for column, kind in quoted)
+            nulls = ", ".join(f"ISNULL({column})" for column, _ in quoted)
+            row = f"CONVERT(CONCAT_WS('|', {values}, CONCAT({nulls})) USING utf16le)"
+            checksum = f"SUM(CAST(CONV(LEFT(MD5({row}), 8), 16, 10) AS UNSIGNED))"
+        elif self.db_type == DatabaseType.SQLSERVER:
+            # 以 NVARCHAR(MAX) 开头，拼接结果不会截断为4000个字符
+            parts = [f"ISNULL({self._sqlserver_canonical(column, kind)}, N'')" for column, kind in quoted]
+            nulls = [f"CASE WHEN {column} IS NULL THEN N'1' ELSE N'0' END" for column, _ in quoted]
+            row = "CAST(N'' AS NVARCHAR(MAX)) + " + " + N'|' + ".join(parts) + " + N'|' + " + " + ".join(nulls)
+            checksum = f"SUM(CAST(SUBSTRING(HASHBYTES('MD5', {row}), 1, 4) AS BIGINT))"
+        elif self.db_type == DatabaseType.SQLITE:
+            await conn.create_function(_SQLITE_CHECKSUM_FUNCTION, -1, row_checksum, deterministic=True)
+            kinds = ",".join(kind for _, kind in quoted)
+            checksum = f"SUM({_SQLITE_CHECKSUM_FUNCTION}('{kinds}', {', '.join(column for column, _ in quoted)}))"
+        else:
+            raise ValueError(f"不支持的数据库类型: {self.db_type}")
+        
+        query = f"SELECT COUNT(*), {checksum} FROM {self.quote_identifier(table_name)}{where}"
+        _, rows = await self._fetch(conn, query, params)
+        count, total = rows[0] if rows else (0, None)
+        return int(count or 0), int(total or 0)
+    
+    @staticmethod
+    def _mysql_canonical(column: str, kind: str) -> str:
+        """MySQL中列值的规范文本表达式，结果与 canonical_value 一致"""
+        if kind == "integer":
+            # + 0 使 BIT 列按数值输出
+            return f"CAST({column} + 0 AS CHAR)"
+        if kind in ("decimal", "float"):
+            value = f"CAST({column} AS CHAR)" if kind == "decimal" else f"CAST(CAST({column} AS DECIMAL(65,6)) AS CHAR)"
+            return f"IF(LOCATE('.', {value}) > 0, TRIM(TRAILING '.' FROM TRIM(TRAILING '0' FROM {value})), {value})"
+        # 不使用 DATE_FORMAT：带参数执行时驱动会把格式串中的 % 当作占位符
+        if kind == "date":
+            return f"CAST(CAST({column} AS DATE) AS CHAR)"
+        if kind == "datetime":
+            return f"LEFT(CAST(CAST({column} AS DATETIME(6)) AS CHAR), 23)"
+        if kind == "time":
+            return f"LEFT(CAST(CAST({column} AS TIME(6)) AS CHAR), 12)"
+        if kind == "binary":
+            return f"LOWER(HEX({column}))"
+        # 统一转换为 utf8mb4，避免不同字符集的列拼接时报排序规则冲突
+        value = f"CONVERT({column} USING utf8mb4)"
+        if kind == "char":
+            return f"TRIM(TRAILING ' ' FROM {value})"
+        if kind == "uuid":
+            return f"LOWER({value})"
+        return value
+    
+    @staticmethod
+    def _sqlserver_canonical(column: str, kind: str) -> str:
+        """SQL Server中列值的规范文本表达式，结果与 canonical_value 一致"""
+        if kind == "integer":
+            return f"CAST({column} AS NVARCHAR(40))"
+        if kind in ("decimal", "float"):
+            # 样式2使 money 输出4位小数，decimal 忽略样式；去掉末尾的0：把0换成空格后 RTRIM 再换回
+            value = f"CONVERT(NVARCHAR(60), {column}, 2)" if kind == "decimal" else \
+                f"CAST(CAST({column} AS DECIMAL(38,6)) AS NVARCHAR(60))"
+            trimmed = f"REPLACE(RTRIM(REPLACE({value}, N'0', N' ')), N' ', N'0')"
+            return (
+                f"CASE WHEN CHARINDEX(N'.', {value}) = 0 THEN {value} "
+                f"WHEN RIGHT({trimmed}, 1) = N'.' THEN LEFT({trimmed}, LEN({trimmed}) - 1) ELSE {trimmed} END"
+            )
+        if kind == "date":
+            return f"CONVERT(NVARCHAR(10), {column}, 23)"
+        if kind == "datetime":
+            return f"CONVERT(NVARCHAR(23), CAST({column} AS DATETIME2(7)), 121)"
+        if kind == "time":
+            return f"LEFT(CAST(CAST({column} AS TIME(7)) AS NVARCHAR(16)), 12)"
+        if kind == "binary":
+            return f"LOWER(CONVERT(NVARCHAR(MAX), CAST({column} AS VARBINARY(MAX)), 2))"
+        if kind == "char":
+            return f"RTRIM(CAST({column} AS NVARCHAR(MAX)))"
+        if kind == "uuid":
+            return f"LOWER(CAST({column} AS NVARCHAR(36)))"
+        return f"CAST({column} AS NVARCHAR(MAX))"
+    
+    async def fetch_keyset_batch(self, conn, table_name: str, key_column: str, after_key: Any,
+                                 batch_size: int, row_filter: Optional[RowFilter] = None,
+                                 upper_key: Any = None) -> Tuple[List[str], List[Sequence]]:
+        """按主键范围读取一批数据（after_key < key <= upper_key，按主键排序），每批代价与已读取的行数无关
+        
+        过滤条件与主键范围一起下推，由数据库按主键索引定位区间后再过滤。
+        """
+        key = self.quote_identifier(key_column)
+        conditions, params = self._key_range_conditions(key, after_key, upper_key)
+        where, params = self._where(row_filter, conditions, params)
+        
+        if self.db_type == DatabaseType.SQLSERVER:
+            query = f"SELECT TOP ({int(batch_size)}) * FROM {self.quote_identifier(table_name)}{where} ORDER BY {key}"
+        else:
+            query = f"SELECT * FROM {self.quote_identifier(table_name)}{where} ORDER BY {key} LIMIT {int(batch_size)}"
+        return await self._fetch(conn, query, params)
+    
+    def upsert_statement(self, table_name: str, columns: List[str], key_columns: Sequence[str]) -> str:
+        """按键插入或更新单行的参数化语句：键已存在时更新其余列，不存在时插入
+        
+        MySQL 使用 ON DUPLICATE KEY UPDATE，SQL Server 使用 MERGE，SQLite 使用 ON CONFLICT DO UPDATE
+        （不使用 INSERT OR REPLACE：它先删除旧行，会触发级联删除并清空目标表中未写入的列）。
+        """
+        table = self.quote_identifier(table_name)
+        keys = {key.lower() for key in key_columns}
+        missing = [key for key in key_columns if key.lower() not in {column.lower() for column in columns}]
+        if missing:
+            raise ValueError(f"写入的列中缺少键列 {', '.join(missing)}，无法按键更新表 {table_name}")
+        quoted = [self.quote_identifier(column) for column in columns]
+        updates = [self.quote_identifier(column) for column in columns if column.lower() not in keys]
+        column_list = ", ".join(quoted)
+        values = ", ".join([self.placeholder] * len(columns))
+        
+        if self.db_type == DatabaseType.MYSQL:
+            # 只有键列时用 键 = 键 使重复行成为空操作
+            assignments = [f"{column} = VALUES({column})" for column in updates] or [f"{quoted[0]} = {quoted[0]}"]
+            return (
+                f"INSERT INTO {table} ({column_list}) VALUES ({values}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+            )
+        if self.db_type == DatabaseType.SQLSERVER:
+            matches = " AND ".join(
+                f"tgt.{self.quote_identifier(key)} = src.{self.quote_identifier(key)}" for key in key_columns
+            )
+            source_list = ", ".join(f"src.{column}" for column in quoted)
+            query = (
+                f"MERGE INTO {table} WITH (HOLDLOCK) AS tgt "
+                f"USING (VALUES ({values})) AS src ({column_list}) ON {matches} "
+            )
+            if updates:
+                query += f"WHEN MATCHED THEN UPDATE SET {', '.join(f'tgt.{column} = src.{column}' for column in updates)} "
+            return query + f"WHEN NOT MATCHED THEN INSERT ({column_list}) VALUES ({source_list});"
+        
+        conflict = ", ".join(self.quote_identifier(key) for key in key_columns)
+        action = f"DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in updates)}" if updates else "DO NOTHING"
+        return f"INSERT INTO {table} ({column_list}) VALUES ({values}) ON CONFLICT ({conflict}) {action}"
+    
+    async def insert_batch(self, conn, table_name: str, columns: List[str], rows: List[Sequence],
+                           fast_executemany: bool = False,
+                           upsert_keys: Optional[Sequence[str]] = None,
+                           identity_insert: bool = False) -> int:
+        """在给定连接上批量插入一批数据并提交，返回写入行数
+        
+        指定 upsert_keys 时按这些键插入或更新；identity_insert 为 True 时（SQL Server）允许显式写入标识列。
+        """
+        if not rows:
+            return 0
+        
+        if upsert_keys:
+            query = self.upsert_statement(table_name, columns, upsert_keys)
+        else:
+            column_list = ", ".join(self.quote_identifier(column) for column in columns)
+            values = ", ".join([self.placeholder] * len(columns))
+            query = f"INSERT INTO {self.quote_identifier(table_name)} ({column_list}) VALUES ({values})"
+        
+        if self.db_type == DatabaseType.MYSQL:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    # PyMySQL会把 INSERT ... VALUES [ON DUPLICATE KEY UPDATE ...] 的executemany改写为多行插入
+                    await cursor.executemany(query, rows)
+            except Exception:
+                await conn.rollback()
+                raise
+            await complete_uninterrupted(conn.commit())
+                
+        elif self.db_type == DatabaseType.SQLSERVER:
+            try:
+                await self._sqlserver_call(
+                    self._sqlserver_executemany, conn, query, rows, fast_executemany,
+                    self.quote_identifier(table_name) if identity_insert else None
+                )
+            except BaseException:
+                # 包括任务被取消：工作线程结束后回滚这一批
+                await self._sqlserver_call(self._sqlserver_rollback, conn)
+                raise
+            await complete_uninterrupted(self._sqlserver_call(self._sqlserver_commit, conn))
+                
+        elif self.db_type == DatabaseType.SQLITE:
+            try:
+                await conn.executemany(query, rows)
+            except Exception:
+                await conn.rollback()
+                raise
+            await complete_uninterrupted(conn.commit())
+        
+        return len(rows)
\ No newline at end of file
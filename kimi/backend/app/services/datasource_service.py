@@ -6,6 +6,8 @@ import logging
 from app.models.models import DataSource
 from app.schemas.schemas import DataSourceCreate, DataSourceUpdate
 from app.services.database_service import DatabaseConnection
+from app.services.connection_pool import pool_registry
+from app.services.metadata_cache import metadata_cache
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +51,9 @@ class DataSourceService:
         
         await db.commit()
         await db.refresh(db_datasource)
+        # 连接参数可能已变化，关闭旧的连接池并丢弃缓存的元数据
+        await pool_registry.close_datasource(datasource_id)
+        metadata_cache.invalidate(datasource_id)
         return db_datasource
     
     @staticmethod
@@ -56,6 +61,8 @@ class DataSourceService:
         """删除数据源"""
         result = await db.execute(delete(DataSource).where(DataSource.id == datasource_id))
         await db.commit()
+        await pool_registry.close_datasource(datasource_id)
+        metadata_cache.invalidate(datasource_id)
         return result.rowcount > 0
     
     @staticmethod
@@ -72,7 +79,8 @@ class DataSourceService:
                 port=datasource.port,
                 database=datasource.database,
                 username=datasource.username,
-                password=datasource.password
+                password=datasource.password,
+                datasource_id=datasource.id
             )
             return await connection.test_connection()
         except Exception as e:
@@ -81,42 +89,77 @@ class DataSourceService:
     
     @staticmethod
     async def get_datasource_tables(db: AsyncSession, datasource_id: int) -> List[dict]:
-        """获取数据源的所有表"""
-        datasource = await DataSourceService.get_datasource(db, datasource_id)
-        if not datasource:
-            return []
+        """获取数据源的所有表，结果在元数据缓存中保留 METADATA_CACHE_TTL 秒"""
+        async def load():
+            datasource = await DataSourceService.get_datasource(db, datasource_id)
+            if not datasource:
+                return None
+            # 读取失败时抛出异常而不是返回空列表，失败结果不会进入缓存
+            return await DataSourceService.connect(datasource).get_tables(raise_errors=True)
         
         try:
-            connection = DatabaseConnection(
-                db_type=datasource.db_type,
-                host=datasource.host,
-                port=datasource.port,
-                database=datasource.database,
-                username=datasource.username,
-                password=datasource.password
-            )
-            return await connection.get_tables()
+            return await metadata_cache.get_or_load(datasource_id, "tables", None, load) or []
         except Exception as e:
             logger.error(f"获取数据源表列表失败: {str(e)}")
             return []
     
     @staticmethod
     async def get_table_schema(db: AsyncSession, datasource_id: int, table_name: str) -> List[dict]:
-        """获取表结构"""
-        datasource = await DataSourceService.get_datasource(db, datasource_id)
-        if not datasource:
-            return []
+        """获取表结构，结果在元数据缓存中保留 METADATA_CACHE_TTL 秒"""
+        async def load():
+            datasource = await DataSourceService.get_datasource(db, datasource_id)
+            if not datasource:
+                return None
+            return await DataSourceService.connect(datasource).get_table_schema(table_name, raise_errors=True)
         
         try:
-            connection = DatabaseConnection(
-                db_type=datasource.db_type,
-                host=datasource.host,
-                port=datasource.port,
-                database=datasource.database,
-                username=datasource.username,
-                password=datasource.password
-            )
-            return await connection.get_table_schema(table_name)
+            return await metadata_cache.get_or_load(datasource_id, "schema", table_name, load) or []
         except Exception as e:
             logger.error(f"获取表结构失败: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+    
+    @staticmethod
+    async def get_catalog(db: AsyncSession, datasource_id: int,
+                          tables: Optional[List[str]] = None) -> Optional[List[dict]]:
+        """批量获取表的列、主键、索引和估算行数，数据源不存在时返回None
+        
+        全部表的目录信息整体缓存；同时按表写入表结构缓存，之后逐表查看结构不再访问数据库。
+        指定表名时优先从已缓存的全部目录中选取，没有缓存时只查询这些表。
+        """
+        async def load(selection: Optional[List[str]]):
+            datasource = await DataSourceService.get_datasource(db, datasource_id)
+            if not datasource:
+                return None
+            catalog = await DataSourceService.connect(datasource).get_catalog(selection)
+            for table in catalog:
+                metadata_cache.put(datasource_id, "schema", table["name"], table["columns"])
+            return catalog
+        
+        if not tables:
+            return await metadata_cache.get_or_load(datasource_id, "catalog", None, lambda: load(None))
+        cached = metadata_cache.get(datasource_id, "catalog", None)
+        if cached is not None:
+            wanted = set(tables)
+            return [table for table in cached if table["name"] in wanted]
+        return await load(tables)
+    
+    @staticmethod
+    async def refresh_metadata(db: AsyncSession, datasource_id: int) -> Optional[List[dict]]:
+        """丢弃数据源的元数据缓存并重新加载表列表，数据源不存在时返回None"""
+        if not await DataSourceService.get_datasource(db, datasource_id):
+            return None
+        metadata_cache.invalidate(datasource_id)
+        return await DataSourceService.get_datasource_tables(db, datasource_id)
+    
+    @staticmethod
+    def connect(datasource: DataSource) -> DatabaseConnection:
+        """按数据源记录建立连接对象，连接池按数据源ID共享"""
+        return DatabaseConnection(
+            db_type=datasource.db_type,
+            host=datasource.host,
+            port=datasource.port,
+            database=datasource.database,
+            username=datasource.username,
+            password=datasource.password,
+            datasource_id=datasource.id
+        )
\ No newline at end of file
@@ -0,0 +1,256 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 比较运算符 -> SQL，值作为参数绑定
+_COMPARISONS = {
+    "=": "=", "==": "=", "!=": "<>", "<>": "<>",
+    "<": "<", "<=": "<=", ">": ">", ">=": ">=",
+    "like": "LIKE", "not like": "NOT LIKE",
+}
+_LIST_OPERATORS = {"in": "IN", "not in": "NOT IN"}
+_NULL_OPERATORS = {"is null": "IS NULL", "is not null": "IS NOT NULL"}
+_OPERATORS = set(_COMPARISONS) | set(_LIST_OPERATORS) | set(_NULL_OPERATORS) | {"between"}
+
+# 可以由以该列开头的索引定位的运算符（like 另需不以通配符开头）
+_INDEXABLE_OPERATORS = {"=", "==", "<", "<=", ">", ">=", "in", "between", "is null", "like"}
+
+# SQL Server 单条语句最多2100个参数
+_MAX_LIST_VALUES = 1000
+
+
+class RowFilter:
+    """结构化的行过滤条件，编译为带参数占位符的SQL条件，值不拼接进SQL
+    
+    filter_condition 为JSON：
+    - 单个条件：{"column": "status", "op": "=", "value": "active"}
+    - 列表表示各条件同时成立：[{...}, {...}]
+    - 组合：{"and": [...]}、{"or": [...]}、{"not": {...}}
+    运算符：= != < <= > >= like "not like" in "not in" between "is null" "is not null"，
+    in / not in 的值为列表，between 的值为 [下限, 上限]。
+    """
+    
+    def __init__(self, node: Dict[str, Any]):
+        self.node = self._validate(node)
+    
+    @classmethod
+    def parse(cls, filter_condition: Optional[str]) -> Optional["RowFilter"]:
+        """解析任务的 filter_condition，为空时返回None
+        
+        不是JSON的旧式SQL条件只在 MIGRATION_ALLOW_RAW_FILTER 开启时按原样使用（RawFilter）。
+        """
+        if filter_condition is None or not filter_condition.strip():
+            return None
+        try:
+            spec = json.loads(filter_condition)
+        except ValueError:
+            if settings.MIGRATION_ALLOW_RAW_FILTER:
+                return RawFilter(filter_condition)
+            raise ValueError(
+                "filter_condition 必须是结构化条件（JSON），例如 "
+                '[{"column": "status", "op": "=", "value": "active"}]；'
+                "旧式SQL条件需要开启 MIGRATION_ALLOW_RAW_FILTER 才能使用"
+            )
+        if isinstance(spec, list):
+            spec = {"and": spec}
+        if not isinstance(spec, dict):
+            raise ValueError("filter_condition 必须是JSON对象或列表")
+        return cls(spec)
+    
+    def _validate(self, node: Any) -> Dict[str, Any]:
+        if isinstance(node, list):
+            node = {"and": node}
+        if not isinstance(node, dict):
+            raise ValueError(f"过滤条件格式错误: {node!r}")
+        
+        for combinator in ("and", "or"):
+            if combinator in node:
+                children = node[combinator]
+                if not isinstance(children, list) or not children:
+                    raise ValueError(f"过滤条件 {combinator} 的值必须是非空列表")
+                return {combinator: [self._validate(child) for child in children]}
+        if "not" in node:
+            return {"not": self._validate(node["not"])}
+        
+        column = node.get("column")
+        op = str(node.get("op", "=")).strip().lower()
+        if not isinstance(column, str) or not column:
+            raise ValueError(f"过滤条件缺少列名: {node!r}")
+        if op not in _OPERATORS:
+            raise ValueError(f"过滤条件不支持的运算符 {op}，可用: {', '.join(sorted(_OPERATORS))}")
+        
+        value = node.get("value")
+        if op in _NULL_OPERATORS:
+            value = None
+        elif op in _LIST_OPERATORS:
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"列 {column} 的 {op} 条件的值必须是非空列表")
+            if len(value) > _MAX_LIST_VALUES:
+                raise ValueError(f"列 {column} 的 {op} 条件最多 {_MAX_LIST_VALUES} 个值")
+        elif op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise ValueError(f"列 {column} 的 between 条件的值必须是 [下限, 上限]")
+        elif value is None:
+            raise ValueError(f"列 {column} 的 {op} 条件缺少值，判断NULL请使用 is null / is not null")
+        if isinstance(value, dict) or (isinstance(value, list) and any(isinstance(item, (dict, list)) for item in value)):
+            raise ValueError(f"列 {column} 的条件值只能是字符串、数字或布尔值")
+        return {"column": column, "op": op, "value": value}
+    
+    def compile(self, db) -> Tuple[str, List[Any]]:
+        """编译为 db 方言的SQL条件和参数列表"""
+        params: List[Any] = []
+        sql = self._compile(self.node, db, params)
+        return sql, params
+    
+    def _compile(self, node: Dict[str, Any], db, params: List[Any]) -> str:
+        for combinator in ("and", "or"):
+            if combinator in node:
+                parts = [self._compile(child, db, params) for child in node[combinator]]
+                return "(" + f" {combinator.upper()} ".join(parts) + ")"
+        if "not" in node:
+            return f"(NOT {self._compile(node['not'], db, params)})"
+        
+        column = db.quote_identifier(node["column"])
+        op = node["op"]
+        value = node["value"]
+        if op in _NULL_OPERATORS:
+            return f"{column} {_NULL_OPERATORS[op]}"
+        if op in _LIST_OPERATORS:
+            params.extend(value)
+            placeholders = ", ".join([db.placeholder] * len(value))
+            return f"{column} {_LIST_OPERATORS[op]} ({placeholders})"
+        if op == "between":
+            params.extend(value)
+            return f"{column} BETWEEN {db.placeholder} AND {db.placeholder}"
+        params.append(value)
+        return f"{column} {_COMPARISONS[op]} {db.placeholder}"
+    
+    def columns(self) -> List[str]:
+        """条件中引用的列"""
+        names: List[str] = []
+        
+        def walk(node: Dict[str, Any]):
+            for combinator in ("and", "or"):
+                for child in node.get(combinator, []):
+                    walk(child)
+            if "not" in node:
+                walk(node["not"])
+            if "column" in node and node["column"] not in names:
+                names.append(node["column"])
+        
+        walk(self.node)
+        return names
+    
+    def index_plan(self, indexes: Sequence[Sequence[str]]) -> Dict[str, Any]:
+        """判断条件能否由源表索引定位
+        
+        indexes 为各索引（含主键）的列列表。条件整体可用索引的情况：AND 中任一条件可用索引，
+        或 OR 的每个分支都可用索引；单个条件可用索引需要运算符可定位，且存在以该列开头的索引。
+        """
+        leading = {columns[0].lower(): columns for columns in indexes if columns}
+        used: List[str] = []
+        
+        def indexable(node: Dict[str, Any]) -> bool:
+            if "and" in node:
+                return any([indexable(child) for child in node["and"]])
+            if "or" in node:
+                return all([indexable(child) for child in node["or"]])
+            if "not" in node:
+                return False
+            op = node["op"]
+            if op not in _INDEXABLE_OPERATORS:
+                return False
+            if op == "like" and (not isinstance(node["value"], str) or node["value"][:1] in ("%", "_")):
+                return False
+            if node["column"].lower() not in leading:
+                return False
+            used.append(node["column"])
+            return True
+        
+        indexed = indexable(self.node)
+        return {
+            "indexed": indexed,
+            "index_columns": list(dict.fromkeys(used)) if indexed else [],
+            "columns": self.columns(),
+        }
+    
+    def __repr__(self) -> str:
+        return json.dumps(self.node, ensure_ascii=False, default=str)
+
+
+class RawFilter(RowFilter):
+    """旧式的SQL条件字符串，原样拼接进查询，只在 MIGRATION_ALLOW_RAW_FILTER 开启时使用"""
+    
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.node = {}
+        logger.warning("过滤条件为原始SQL，将直接拼接进查询，建议改为结构化条件")
+    
+    def compile(self, db) -> Tuple[str, List[Any]]:
+        return f"({self.condition})", []
+    
+    def columns(self) -> List[str]:
+        return []
+    
+    def index_plan(self, indexes: Sequence[Sequence[str]]) -> Dict[str, Any]:
+        # 无法分析原始SQL，不做判断
+        return {"indexed": None, "index_columns": [], "columns": []}
+    
+    def __repr__(self) -> str:
+        return self.condition
+
+
+class AllOf(RowFilter):
+    """多个过滤条件同时成立，例如任务的过滤条件加上增量同步的水位条件（其中可以有 RawFilter）"""
+    
+    def __init__(self, *filters: RowFilter):
+        self.filters = list(filters)
+        self.node = {"and": [row_filter.node for row_filter in self.filters if row_filter.node]}
+    
+    def compile(self, db) -> Tuple[str, List[Any]]:
+        parts: List[str] = []
+        params: List[Any] = []
+        for row_filter in self.filters:
+            condition, filter_params = row_filter.compile(db)
+            parts.append(condition)
+            params.extend(filter_params)
+        return "(" + " AND ".join(parts) + ")", params
+    
+    def columns(self) -> List[str]:
+        names: List[str] = []
+        for row_filter in self.filters:
+            names.extend(column for column in row_filter.columns() if column not in names)
+        return names
+    
+    def index_plan(self, indexes: Sequence[Sequence[str]]) -> Dict[str, Any]:
+        # 任一条件可用索引即整体可用；无法判断的条件（原始SQL）不影响其他条件的判断
+        plans = [row_filter.index_plan(indexes) for row_filter in self.filters]
+        used = [column for plan in plans if plan["indexed"] for column in plan["index_columns"]]
+        if used:
+            indexed = True
+        elif any(plan["indexed"] is None for plan in plans):
+            indexed = None
+        else:
+            indexed = False
+        return {
+            "indexed": indexed,
+            "index_columns": list(dict.fromkeys(used)),
+            "columns": self.columns(),
+        }
+    
+    def __repr__(self) -> str:
+        return " AND ".join(repr(row_filter) for row_filter in self.filters)
+
+
+def combine_filters(*filters: Optional[RowFilter]) -> Optional[RowFilter]:
+    """组合多个过滤条件（忽略None），全部为空时返回None"""
+    filters = [row_filter for row_filter in filters if row_filter is not None]
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return AllOf(*filters)
\ No newline at end of file
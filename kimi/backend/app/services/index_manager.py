@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, List
+
+from app.models.models import DatabaseType
+from app.services.database_service import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+# 导入前按 triggers -> constraints -> indexes 的顺序删除/禁用，导入后按相反顺序重建
+_DISABLE_ORDER = ("trigger", "constraint", "index")
+
+# SHOW CREATE TABLE 中的普通索引行和外键行
+_MYSQL_INDEX_LINE = re.compile(r"^\s*((?:FULLTEXT |SPATIAL )?KEY `((?:[^`]|``)+)` .*?),?$")
+_MYSQL_FOREIGN_KEY_LINE = re.compile(r"^\s*(CONSTRAINT `((?:[^`]|``)+)` FOREIGN KEY .*?),?$")
+_MYSQL_DEFINER = re.compile(r"\s+DEFINER\s*=\s*\S+", re.IGNORECASE)
+
+
+class TargetObjectManager:
+    """批量导入期间目标表的二级索引、约束和触发器
+    
+    导入前记录这些对象的定义并删除或禁用，导入完成（或失败、取消）后按记录的定义重建；
+    重建失败时改用不校验已有数据的方式恢复原定义，两种方式都失败的对象记录在 errors 中。
+    唯一索引和主键保持不变，保证导入期间的去重和按主键续传仍然有效。
+    每个对象是一个可以序列化到检查点的字典：kind、name、disable（导入前执行）、
+    rebuild（导入后执行）、fallback（重建失败时执行，可为空）。
+    """
+    
+    def __init__(self, target: DatabaseConnection, table_name: str, parallelism: int = 1):
+        self.target = target
+        self.table_name = table_name
+        self.parallelism = max(1, parallelism)
+        self.objects: List[Dict[str, Any]] = []
+        # captured: 只记录了定义；disabled: 已删除或禁用，等待重建；restored: 已重建
+        self.state = "captured"
+        self.errors: List[str] = []
+        self.rebuild_seconds = 0.0
+    
+    @property
+    def disabled(self) -> bool:
+        return self.state == "disabled"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "objects": self.objects}
+    
+    def load(self, data: Dict[str, Any]):
+        """从检查点恢复上次执行记录的对象定义和状态"""
+        self.objects = data.get("objects", [])
+        self.state = data.get("state", "captured")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "objects": [{"kind": item["kind"], "name": item["name"]} for item in self.objects],
+            "rebuild_seconds": round(self.rebuild_seconds, 3),
+            "errors": self.errors,
+        }
+    
+    async def capture(self):
+        """读取目标表当前的二级索引、约束和触发器定义"""
+        self.objects = await self._capture()
+        self.state = "captured"
+        if self.objects:
+            summary = ", ".join(f"{item['kind']} {item['name']}" for item in self.objects)
+            logger.info(f"目标表 {self.table_name} 导入期间将删除或禁用: {summary}")
+    
+    async def disable(self):
+        """按顺序删除或禁用已记录的对象；中途失败时恢复已处理的对象并抛出异常"""
+        done: List[Dict[str, Any]] = []
+        for kind in _DISABLE_ORDER:
+            for item in self._of_kind(kind):
+                try:
+                    await self.target.execute(item["disable"])
+                except Exception:
+                    logger.error(f"删除或禁用 {item['kind']} {item['name']} 失败，恢复已处理的对象")
+                    self.objects = done
+                    self.state = "disabled"
+                    await self.rebuild()
+                    raise
+                done.append(item)
+        self.state = "disabled"
+    
+    async def rebuild(self) -> List[str]:
+        """按记录的定义重建索引、约束和触发器，返回未能恢复的对象的错误信息"""
+        if self.state != "disabled":
+            return self.errors
+        started = time.monotonic()
+        await self._rebuild_indexes(self._of_kind("index"))
+        for kind in ("constraint", "trigger"):
+            for item in self._of_kind(kind):
+                await self._rebuild_one(item)
+        self.rebuild_seconds += time.monotonic() - started
+        self.state = "restored"
+        logger.info(
+            f"目标表 {self.table_name} 的 {len(self.objects)} 个索引/约束/触发器已重建，"
+            f"耗时 {self.rebuild_seconds:.1f} 秒，失败 {len(self.errors)} 个"
+        )
+        return self.errors
+    
+    def _of_kind(self, kind: str) -> List[Dict[str, Any]]:
+        return [item for item in self.objects if item["kind"] == kind]
+    
+    async def _rebuild_indexes(self, indexes: List[Dict[str, Any]]):
+        """重建二级索引，默认逐个执行"""
+        for item in indexes:
+            await self._rebuild_one(item)
+    
+    async def _rebuild_one(self, item: Dict[str, Any]):
+        try:
+            await self.target.execute(item["rebuild"])
+            return
+        except Exception as e:
+            error = f"重建 {item['kind']} {item['name']} 失败: {str(e)}"
+        
+        if item.get("fallback"):
+            try:
+                await self._execute_fallback(item)
+                logger.warning(f"{error}；已改用不校验已有数据的方式恢复原定义")
+                self.errors.append(f"{error}（已按原定义恢复，未校验已有数据）")
+                return
+            except Exception as e:
+                error = f"{error}；恢复原定义也失败: {str(e)}"
+        logger.error(f"{error}；原定义: {item['rebuild']}")
+        self.errors.append(error)
+    
+    async def _execute_fallback(self, item: Dict[str, Any]):
+        await self.target.execute(item["fallback"])
+    
+    async def _capture(self) -> List[Dict[str, Any]]:
+        return []
+
+
+class MySQLObjectManager(TargetObjectManager):
+    """MySQL：删除普通索引、外键和触发器，导入后用一条 ALTER TABLE 一次扫描建立全部索引"""
+    
+    async def _capture(self) -> List[Dict[str, Any]]:
+        table = self.target.quote_identifier(self.table_name)
+        rows = await self.target.fetch_all(f"SHOW CREATE TABLE {table}")
+        objects = []
+        for line in rows[0][1].splitlines():
+            match = _MYSQL_INDEX_LINE.match(line)
+            if match:
+                objects.append({
+                    "kind": "index",
+                    "name": match.group(2).replace("``", "`"),
+                    "disable": f"ALTER TABLE {table} DROP INDEX `{match.group(2)}`",
+                    "rebuild": f"ALTER TABLE {table} ADD {match.group(1)}",
+                })
+                continue
+            match = _MYSQL_FOREIGN_KEY_LINE.match(line)
+            if match:
+                rebuild = f"ALTER TABLE {table} ADD {match.group(1)}"
+                objects.append({
+                    "kind": "constraint",
+                    "name": match.group(2).replace("``", "`"),
+                    "disable": f"ALTER TABLE {table} DROP FOREIGN KEY `{match.group(2)}`",
+                    "rebuild": rebuild,
+                    # 在 FOREIGN_KEY_CHECKS = 0 的会话中执行，见 _execute_fallback
+                    "fallback": rebuild,
+                })
+        
+        triggers = await self.target.fetch_all(
+            "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS "
+            "WHERE EVENT_OBJECT_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = %s",
+            (self.table_name,)
+        )
+        for (name,) in triggers:
+            quoted = self.target.quote_identifier(name)
+            # Trigger, sql_mode, SQL Original Statement, ...
+            definition = (await self.target.fetch_all(f"SHOW CREATE TRIGGER {quoted}"))[0][2]
+            objects.append({
+                "kind": "trigger",
+                "name": name,
+                "disable": f"DROP TRIGGER {quoted}",
+                "rebuild": definition,
+                # 没有权限以原 DEFINER 建立时以当前用户建立
+                "fallback": _MYSQL_DEFINER.sub("", definition, count=1),
+            })
+        return objects
+    
+    async def _rebuild_indexes(self, indexes: List[Dict[str, Any]]):
+        if len(indexes) > 1:
+            table = self.target.quote_identifier(self.table_name)
+            prefix = f"ALTER TABLE {table} "
+            statement = prefix + ", ".join(item["rebuild"][len(prefix):] for item in indexes)
+            try:
+                await self.target.execute(statement)
+                return
+            except Exception as e:
+                # 例如 InnoDB 不允许一条语句建立多个全文索引，改为逐个建立
+                logger.warning(f"一次建立 {len(indexes)} 个索引失败，改为逐个建立: {str(e)}")
+        await super()._rebuild_indexes(indexes)
+    
+    async def _execute_fallback(self, item: Dict[str, Any]):
+        if item["kind"] != "constraint":
+            return await super()._execute_fallback(item)
+        async with self.target.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+                try:
+                    await cursor.execute(item["fallback"])
+                finally:
+                    await cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+class SQLServerObjectManager(TargetObjectManager):
+    """SQL Server：禁用非聚集索引、外键/CHECK约束和触发器，定义保留在系统目录中，导入后各索引在独立连接上并发重建"""
+    
+    async def _capture(self) -> List[Dict[str, Any]]:
+        table = self.target.quote_identifier(self.table_name)
+        objects = []
+        
+        indexes = await self.target.fetch_all(
+            "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND type = 2 "
+            "AND is_primary_key = 0 AND is_unique = 0 AND is_disabled = 0",
+            (self.table_name,)
+        )
+        for (name,) in indexes:
+            quoted = self.target.quote_identifier(name)
+            objects.append({
+                "kind": "index",
+                "name": name,
+                "disable": f"ALTER INDEX {quoted} ON {table} DISABLE",
+                "rebuild": f"ALTER INDEX {quoted} ON {table} REBUILD",
+            })
+        
+        constraints = await self.target.fetch_all(
+            "SELECT name FROM sys.foreign_keys WHERE parent_object_id = OBJECT_ID(?) AND is_disabled = 0 "
+            "UNION ALL "
+            "SELECT name FROM sys.check_constraints WHERE parent_object_id = OBJECT_ID(?) AND is_disabled = 0",
+            (self.table_name, self.table_name)
+        )
+        for (name,) in constraints:
+            quoted = self.target.quote_identifier(name)
+            objects.append({
+                "kind": "constraint",
+                "name": name,
+                "disable": f"ALTER TABLE {table} NOCHECK CONSTRAINT {quoted}",
+                "rebuild": f"ALTER TABLE {table} WITH CHECK CHECK CONSTRAINT {quoted}",
+                # 重新启用但不校验已有数据（约束标记为不受信任）
+                "fallback": f"ALTER TABLE {table} CHECK CONSTRAINT {quoted}",
+            })
+        
+        triggers = await self.target.fetch_all(
+            "SELECT name FROM sys.triggers WHERE parent_id = OBJECT_ID(?) AND is_disabled = 0",
+            (self.table_name,)
+        )
+        for (name,) in triggers:
+            quoted = self.target.quote_identifier(name)
+            objects.append({
+                "kind": "trigger",
+                "name": name,
+                "disable": f"DISABLE TRIGGER {quoted} ON {table}",
+                "rebuild": f"ENABLE TRIGGER {quoted} ON {table}",
+            })
+        return objects
+    
+    async def _rebuild_indexes(self, indexes: List[Dict[str, Any]]):
+        # 离线重建非聚集索引只对表加共享锁，多个索引可以同时重建
+        semaphore = asyncio.Semaphore(self.parallelism)
+        
+        async def rebuild(item: Dict[str, Any]):
+            async with semaphore:
+                await self._rebuild_one(item)
+        
+        await asyncio.gather(*(rebuild(item) for item in indexes))
+
+
+class SQLiteObjectManager(TargetObjectManager):
+    """SQLite：删除普通索引和触发器，导入后按 sqlite_master 中记录的原语句重建
+    
+    SQLite的外键只在连接开启 PRAGMA foreign_keys 时检查，写入连接未开启，不需要处理。
+    """
+    
+    async def _capture(self) -> List[Dict[str, Any]]:
+        rows = await self.target.fetch_all(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (self.table_name,)
+        )
+        objects = []
+        for kind, name, sql in rows:
+            if kind == "index" and re.match(r"^\s*CREATE\s+UNIQUE\b", sql, re.IGNORECASE):
+                continue
+            objects.append({
+                "kind": kind,
+                "name": name,
+                "disable": f"DROP {kind.upper()} {self.target.quote_identifier(name)}",
+                "rebuild": sql,
+            })
+        return objects
+
+
+def create_object_manager(target: DatabaseConnection, table_name: str,
+                          parallelism: int = 1) -> TargetObjectManager:
+    """按目标库类型选择索引/约束/触发器的处理方式"""
+    if target.db_type == DatabaseType.MYSQL:
+        return MySQLObjectManager(target, table_name, parallelism)
+    if target.db_type == DatabaseType.SQLSERVER:
+        return SQLServerObjectManager(target, table_name, parallelism)
+    if target.db_type == DatabaseType.SQLITE:
+        # SQLite同一时刻只允许一个写事务，索引只能逐个建立
+        return SQLiteObjectManager(target, table_name, 1)
+    return TargetObjectManager(target, table_name, parallelism)
\ No newline at end of file
@@ -0,0 +1,481 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import MigrationJob, MigrationTask, TaskStatus, DataSource
+from app.schemas.schemas import MigrationJobCreate, MigrationJobUpdate
+from app.services.datasource_service import DataSourceService
+from app.services.migration_service import MigrationTaskService
+from app.services.progress_tracker import progress_tracker
+from app.services.spill import SpillStore, task_spill_dir
+from app.services.task_scheduler import task_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 同一作业的调度由多个工作协程的任务结束回调触发，串行执行
+_dispatch_locks: Dict[int, asyncio.Lock] = {}
+
+_ACTIVE = (TaskStatus.QUEUED, TaskStatus.RUNNING)
+
+
+class MigrationJobService:
+    """多表迁移作业管理服务
+    
+    启动作业时从源库目录一次读取各表的外键和估算行数，为每个表创建一个迁移任务。
+    被引用的表完成后引用它的表才开始复制；没有依赖关系的表同时复制，同时执行的表数不超过
+    max_parallel_tables，优先调度自身及下游依赖链行数最多的表，缩短作业总耗时。
+    每个表的任务结束时重新调度并汇总作业进度。
+    """
+    
+    @staticmethod
+    async def create_job(db: AsyncSession, job: MigrationJobCreate) -> MigrationJob:
+        """创建迁移作业"""
+        values = job.dict()
+        values["tables"] = MigrationJobService._dump_tables(values["tables"])
+        db_job = MigrationJob(**values)
+        db.add(db_job)
+        await db.commit()
+        await db.refresh(db_job)
+        return db_job
+    
+    @staticmethod
+    async def get_job(db: AsyncSession, job_id: int) -> Optional[MigrationJob]:
+        """获取单个迁移作业"""
+        result = await db.execute(select(MigrationJob).where(MigrationJob.id == job_id))
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def get_jobs(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[MigrationJob]:
+        """获取迁移作业列表"""
+        result = await db.execute(select(MigrationJob).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    @staticmethod
+    async def update_job(db: AsyncSession, job_id: int, job_update: MigrationJobUpdate) -> Optional[MigrationJob]:
+        """更新迁移作业，只能修改尚未启动的作业"""
+        db_job = await MigrationJobService.get_job(db, job_id)
+        if not db_job:
+            return None
+        if db_job.status != TaskStatus.PENDING:
+            raise ValueError("作业已启动，不能修改")
+        
+        update_data = job_update.dict(exclude_unset=True)
+        if "tables" in update_data:
+            update_data["tables"] = MigrationJobService._dump_tables(update_data["tables"])
+        for field, value in update_data.items():
+            setattr(db_job, field, value)
+        
+        await db.commit()
+        await db.refresh(db_job)
+        return db_job
+    
+    @staticmethod
+    async def delete_job(db: AsyncSession, job_id: int) -> bool:
+        """删除迁移作业及其各表的任务"""
+        db_job = await MigrationJobService.get_job(db, job_id)
+        if not db_job:
+            return False
+        if await MigrationJobService._has_active_tasks(db, job_id):
+            raise ValueError("作业还有正在排队或执行的表，请先取消作业")
+        
+        task_ids = (await db.execute(select(MigrationTask.id).where(MigrationTask.job_id == job_id))).scalars().all()
+        await db.execute(delete(MigrationTask).where(MigrationTask.job_id == job_id))
+        await db.execute(delete(MigrationJob).where(MigrationJob.id == job_id))
+        await db.commit()
+        _dispatch_locks.pop(job_id, None)
+        for task_id in task_ids:
+            SpillStore.remove_directory(task_spill_dir(task_id))
+        return True
+    
+    @staticmethod
+    async def start_job(db: AsyncSession, job_id: int) -> bool:
+        """启动迁移作业：读取源库目录生成执行计划，为每个表创建任务并开始调度"""
+        job = await MigrationJobService.get_job(db, job_id)
+        if not job or job.status != TaskStatus.PENDING:
+            return False
+        source_ds = await db.get(DataSource, job.source_id)
+        if not source_ds or not await db.get(DataSource, job.target_id):
+            raise ValueError("源数据源或目标数据源不存在")
+        
+        source_conn = DataSourceService.connect(source_ds)
+        tables = json.loads(job.tables) if job.tables else None
+        catalog = await source_conn.get_catalog(tables)
+        if tables:
+            missing = set(tables) - {table["name"] for table in catalog}
+            if missing:
+                raise ValueError(f"源库中不存在表: {', '.join(sorted(missing))}")
+        if not catalog:
+            raise ValueError("源库中没有可迁移的表")
+        plan = MigrationJobService.plan_tables(catalog)
+        
+        for entry in plan["tables"]:
+            task = MigrationTask(
+                name=f"{job.name} - {entry['table']}"[:100],
+                source_id=job.source_id,
+                target_id=job.target_id,
+                source_table=entry["table"],
+                target_table=entry["table"],
+                job_id=job.id,
+                batch_size=job.batch_size,
+                parallelism=job.parallelism,
+                priority=job.priority,
+                cancel_policy=job.cancel_policy,
+                migrate_structure=job.migrate_structure,
+                exact_count=job.exact_count,
+                load_mode=job.load_mode,
+                status=TaskStatus.PENDING
+            )
+            db.add(task)
+            await db.flush()
+            entry["task_id"] = task.id
+        
+        job.plan = json.dumps(plan)
+        job.status = TaskStatus.RUNNING
+        job.started_at = datetime.now()
+        job.completed_at = None
+        job.error_message = None
+        job.total_rows = sum(entry["row_estimate"] for entry in plan["tables"])
+        job.processed_rows = 0
+        job.progress = 0
+        await db.commit()
+        
+        logger.info(f"迁移作业 {job_id} 开始，共 {len(plan['tables'])} 个表")
+        await MigrationJobService.dispatch(job_id)
+        return True
+    
+    @staticmethod
+    async def cancel_job(db: AsyncSession, job_id: int) -> bool:
+        """取消迁移作业：不再调度新的表，正在排队或执行的表按各自的取消策略停止"""
+        job = await MigrationJobService.get_job(db, job_id)
+        if not job or job.status != TaskStatus.RUNNING:
+            return False
+        
+        job.status = TaskStatus.CANCELLED
+        job.completed_at = datetime.now()
+        await db.commit()
+        
+        result = await db.execute(
+            select(MigrationTask.id).where(MigrationTask.job_id == job_id, MigrationTask.status.in_(_ACTIVE))
+        )
+        for task_id in result.scalars().all():
+            await MigrationTaskService.cancel_task(db, task_id)
+        return True
+    
+    @staticmethod
+    async def resume_job(db: AsyncSession, job_id: int) -> bool:
+        """继续执行失败、取消或被中断的作业
+        
+        有检查点的表从检查点继续，尚未写入任何数据的表重新开始；
+        没有检查点但已写入部分数据的表（没有主键）无法续传，作业结束时仍为失败。
+        """
+        job = await MigrationJobService.get_job(db, job_id)
+        if not job or not job.plan or job.status not in (TaskStatus.RESUMABLE, TaskStatus.FAILED, TaskStatus.CANCELLED):
+            return False
+        
+        result = await db.execute(
+            select(MigrationTask).where(
+                MigrationTask.job_id == job_id,
+                MigrationTask.status.in_((TaskStatus.RESUMABLE, TaskStatus.FAILED, TaskStatus.CANCELLED))
+            )
+        )
+        for task in result.scalars().all():
+            checkpoint = json.loads(task.checkpoint) if task.checkpoint else None
+            if checkpoint and checkpoint.get("key_column"):
+                task.status = TaskStatus.PENDING
+            elif not task.processed_rows:
+                task.status = TaskStatus.PENDING
+                task.checkpoint = None
+                task.last_key = None
+            else:
+                logger.warning(f"迁移作业 {job_id} 的表 {task.source_table} 没有可用的检查点，无法续传")
+        
+        job.status = TaskStatus.RUNNING
+        job.error_message = None
+        job.completed_at = None
+        await db.commit()
+        
+        await MigrationJobService.dispatch(job_id)
+        return True
+    
+    @staticmethod
+    async def dispatch(job_id: int):
+        """调度作业中依赖已满足的表，并汇总作业进度；没有表在执行时结束作业"""
+        lock = _dispatch_locks.setdefault(job_id, asyncio.Lock())
+        async with lock:
+            submitted = await MigrationJobService._dispatch(job_id)
+        for task in submitted:
+            await task_scheduler.submit(task.id, task.priority or 0)
+    
+    @staticmethod
+    async def _dispatch(job_id: int) -> List[MigrationTask]:
+        async with AsyncSessionLocal() as db:
+            job = await MigrationJobService.get_job(db, job_id)
+            if not job or not job.plan:
+                _dispatch_locks.pop(job_id, None)
+                return []
+            plan = json.loads(job.plan)
+            result = await db.execute(select(MigrationTask).where(MigrationTask.job_id == job_id))
+            tasks = {task.id: task for task in result.scalars().all()}
+            status = {
+                entry["table"]: tasks[entry["task_id"]].status if entry["task_id"] in tasks else None
+                for entry in plan["tables"]
+            }
+            active = sum(1 for task in tasks.values() if task.status in _ACTIVE)
+            
+            submitted = []
+            if job.status == TaskStatus.RUNNING:
+                limit = job.max_parallel_tables or settings.MIGRATION_JOB_PARALLEL_TABLES
+                # 计划中的表已按调度优先级排序
+                for entry in plan["tables"]:
+                    if active >= limit:
+                        break
+                    task = tasks.get(entry["task_id"])
+                    if task is None or task.status != TaskStatus.PENDING:
+                        continue
+                    if any(status.get(dependency) != TaskStatus.COMPLETED for dependency in entry["depends_on"]):
+                        continue
+                    task.status = TaskStatus.QUEUED
+                    task.error_message = None
+                    task.completed_at = None
+                    submitted.append(task)
+                    active += 1
+            
+            MigrationJobService._roll_up(job, plan, tasks)
+            if active == 0:
+                # 没有表在排队或执行，不会再有任务结束回调调度这个作业；再次启动或续传时重新建立锁
+                _dispatch_locks.pop(job_id, None)
+                if job.status == TaskStatus.RUNNING:
+                    MigrationJobService._finish(job, plan, tasks)
+            await db.commit()
+            return submitted
+    
+    @staticmethod
+    def _roll_up(job: MigrationJob, plan: Dict[str, Any], tasks: Dict[int, MigrationTask]):
+        """按各表行数汇总作业进度，尚未开始的表使用估算行数"""
+        total_rows = processed_rows = 0
+        for entry in plan["tables"]:
+            task = tasks.get(entry["task_id"])
+            if task is None:
+                continue
+            total_rows += task.total_rows or entry["row_estimate"]
+            processed_rows += task.processed_rows or 0
+        job.total_rows = max(total_rows, processed_rows)
+        job.processed_rows = processed_rows
+        job.progress = min(100, processed_rows * 100 // job.total_rows) if job.total_rows else 0
+    
+    @staticmethod
+    def _finish(job: MigrationJob, plan: Dict[str, Any], tasks: Dict[int, MigrationTask]):
+        failed, blocked = [], []
+        for entry in plan["tables"]:
+            task = tasks.get(entry["task_id"])
+            if task is None or task.status in (TaskStatus.FAILED, TaskStatus.CANCELLED, TaskStatus.RESUMABLE):
+                failed.append(entry["table"])
+            elif task.status == TaskStatus.PENDING:
+                blocked.append(entry["table"])
+        
+        job.completed_at = datetime.now()
+        if not failed and not blocked:
+            job.status = TaskStatus.COMPLETED
+            job.progress = 100
+            logger.info(f"迁移作业 {job.id} 完成，共复制 {job.processed_rows} 行")
+            return
+        messages = []
+        if failed:
+            messages.append(f"表 {', '.join(failed)} 迁移失败")
+        if blocked:
+            messages.append(f"表 {', '.join(blocked)} 依赖的表未完成，未执行")
+        job.status = TaskStatus.FAILED
+        job.error_message = "；".join(messages)
+        logger.error(f"迁移作业 {job.id} 失败: {job.error_message}")
+    
+    @staticmethod
+    async def on_task_finished(task_id: int):
+        """调度器的任务结束回调：任务属于作业时重新调度该作业"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(MigrationTask.job_id).where(MigrationTask.id == task_id))
+            job_id = result.scalar_one_or_none()
+        if job_id is not None:
+            await MigrationJobService.dispatch(job_id)
+    
+    @staticmethod
+    async def mark_interrupted_jobs():
+        """服务启动时把上次执行中被中断的作业标记为可续传"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(MigrationJob).where(MigrationJob.status == TaskStatus.RUNNING))
+            jobs = result.scalars().all()
+            for job in jobs:
+                job.status = TaskStatus.RESUMABLE
+                job.error_message = "服务重启时作业被中断，可继续执行"
+            await db.commit()
+            if jobs:
+                logger.info(f"已将 {len(jobs)} 个中断的迁移作业标记为可续传")
+    
+    @staticmethod
+    async def get_job_progress(db: AsyncSession, job_id: int) -> Optional[Dict[str, Any]]:
+        """获取作业进度：作业汇总以及每个表的状态，执行中的表使用内存中的实时进度"""
+        job = await MigrationJobService.get_job(db, job_id)
+        if not job:
+            return None
+        plan = json.loads(job.plan) if job.plan else {"tables": [], "cycles": []}
+        result = await db.execute(select(MigrationTask).where(MigrationTask.job_id == job_id))
+        tasks = {task.id: task for task in result.scalars().all()}
+        
+        tables = []
+        total_rows = processed_rows = 0
+        for entry in plan["tables"]:
+            task = tasks.get(entry["task_id"])
+            if task is None:
+                continue
+            live = progress_tracker.get(task.id) if task.status == TaskStatus.RUNNING else None
+            table_total = live.total_rows if live else (task.total_rows or entry["row_estimate"])
+            table_processed = live.processed_rows if live else task.processed_rows
+            total_rows += table_total
+            processed_rows += table_processed
+            tables.append({
+                "table": entry["table"],
+                "task_id": task.id,
+                "status": task.status,
+                "depends_on": entry["depends_on"],
+                "progress": live.progress if live else task.progress,
+                "total_rows": table_total,
+                "processed_rows": table_processed,
+                "error_message": task.error_message
+            })
+        
+        total_rows = max(total_rows, processed_rows)
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "progress": 100 if job.status == TaskStatus.COMPLETED else (
+                min(100, processed_rows * 100 // total_rows) if total_rows else 0
+            ),
+            "total_rows": total_rows,
+            "processed_rows": processed_rows,
+            "tables_completed": sum(1 for table in tables if table["status"] == TaskStatus.COMPLETED),
+            "tables_total": len(tables),
+            "cycles": plan["cycles"],
+            "tables": tables,
+            "started_at": job.started_at,
+            "completed_at": job.completed_at,
+            "error_message": job.error_message
+        }
+    
+    @staticmethod
+    def plan_tables(catalog: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """根据源库目录生成执行计划
+        
+        表之间的依赖来自外键（只考虑作业内的表，忽略自引用）；循环依赖中的表互相之间的依赖被忽略，
+        记录在 cycles 中。调度优先级为表自身估算行数加上依赖它的表中优先级最高者，即下游最长依赖链的行数。
+        """
+        names = {table["name"].lower(): table["name"] for table in catalog}
+        estimates = {table["name"]: table["row_estimate"] or 0 for table in catalog}
+        depends_on: Dict[str, set] = {}
+        for table in catalog:
+            referenced = {names.get(fk["referenced_table"].lower()) for fk in table.get("foreign_keys", [])}
+            depends_on[table["name"]] = {name for name in referenced if name and name != table["name"]}
+        
+        cycles = [sorted(component) for component in _strongly_connected(depends_on) if len(component) > 1]
+        for component in cycles:
+            logger.warning(
+                f"表 {', '.join(component)} 之间存在循环外键依赖，按无依赖处理，"
+                "建议使用 deferred 写入方式以免外键检查失败"
+            )
+            for name in component:
+                depends_on[name] -= set(component)
+        
+        dependents: Dict[str, List[str]] = {name: [] for name in depends_on}
+        for name, dependencies in depends_on.items():
+            for dependency in dependencies:
+                dependents[dependency].append(name)
+        
+        # 去掉循环后依赖关系无环，按拓扑序的逆序（先处理下游的表）计算优先级
+        remaining = {name: len(dependencies) for name, dependencies in depends_on.items()}
+        topological = [name for name, count in remaining.items() if count == 0]
+        for name in topological:
+            for child in dependents[name]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    topological.append(child)
+        rank: Dict[str, int] = {}
+        for name in reversed(topological):
+            rank[name] = estimates[name] + max([rank[child] for child in dependents[name]], default=0)
+        ordered = sorted(depends_on, key=lambda name: (-rank[name], -estimates[name], name))
+        return {
+            "tables": [
+                {
+                    "table": name,
+                    "depends_on": sorted(depends_on[name]),
+                    "row_estimate": estimates[name],
+                    "rank": rank[name],
+                    "task_id": None
+                }
+                for name in ordered
+            ],
+            "cycles": cycles,
+        }
+    
+    @staticmethod
+    async def _has_active_tasks(db: AsyncSession, job_id: int) -> bool:
+        result = await db.execute(
+            select(MigrationTask.id).where(MigrationTask.job_id == job_id, MigrationTask.status.in_(_ACTIVE))
+        )
+        return result.first() is not None
+    
+    @staticmethod
+    def _dump_tables(tables: Optional[List[str]]) -> Optional[str]:
+        if not tables:
+            return None
+        names = list(dict.fromkeys(name.strip() for name in tables if name and name.strip()))
+        return json.dumps(names) if names else None
+
+
+def _strongly_connected(graph: Dict[str, Iterable[str]]) -> List[List[str]]:
+    """Tarjan 算法求有向图的强连通分量（迭代实现，避免表很多时递归过深）"""
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack = set()
+    components: List[List[str]] = []
+    counter = 0
+    
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            child = next(children, None)
+            if child is not None:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    """数据源元数据（表列表、表结构）的进程内缓存
+    
+    键为 (数据源ID, 类别, 表名)，每项最多保留 ttl 秒，总数超过 max_entries 时淘汰最久未使用的项。
+    同一个键同时只有一个加载协程访问远端数据库，其他请求等待同一结果；
+    数据源被修改或删除时按数据源失效，失效前已开始的加载结果不会写入缓存。
+    """
+    
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 键 -> (值, 过期时间)，按最近使用排序
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._loading: Dict[Tuple, asyncio.Future] = {}
+        self._generations: Dict[int, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+    
+    async def get_or_load(self, datasource_id: int, kind: str, table_name: Optional[str],
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """返回缓存的值，不存在或已过期时调用 loader 加载；loader 返回None或抛出异常时不缓存"""
+        if not self.enabled:
+            return await loader()
+        
+        key = (datasource_id, kind, table_name)
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+            del self._entries[key]
+        
+        self._misses += 1
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        
+        generation = self._generations.get(datasource_id, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            if value is not None and self._generations.get(datasource_id, 0) == generation:
+                self._put(key, value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+    
+    def get(self, datasource_id: int, kind: str, table_name: Optional[str]) -> Any:
+        """返回未过期的缓存值，不存在时返回None，不触发加载"""
+        key = (datasource_id, kind, table_name)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[0]
+    
+    def put(self, datasource_id: int, kind: str, table_name: Optional[str], value: Any):
+        """直接写入缓存，例如把批量读取的目录信息拆分为各表的缓存项"""
+        if self.enabled and value is not None:
+            self._put((datasource_id, kind, table_name), value)
+    
+    def _put(self, key: Tuple, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+    
+    def invalidate(self, datasource_id: int, table_name: Optional[str] = None):
+        """使数据源的缓存失效；指定表名时只失效该表的结构和数据源的表列表"""
+        # 失效前已开始的加载可能读到旧数据，其结果不再写入缓存
+        self._generations[datasource_id] = self._generations.get(datasource_id, 0) + 1
+        if table_name is None:
+            keys = [key for key in self._entries if key[0] == datasource_id]
+        else:
+            keys = [
+                key for key in self._entries
+                if key[0] == datasource_id and (key[2] is None or key[2] == table_name)
+            ]
+        for key in keys:
+            del self._entries[key]
+        if keys:
+            logger.debug(f"数据源 {datasource_id} 的元数据缓存已失效 {len(keys)} 项")
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存状态统计"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "loading": len(self._loading),
+        }
+
+
+metadata_cache = MetadataCache(
+    ttl=settings.METADATA_CACHE_TTL,
+    max_entries=settings.METADATA_CACHE_MAX_ENTRIES
+)
\ No newline at end of file
@@ -0,0 +1,594 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Optional, Callable, Awaitable, Any, List, Dict, Sequence
+
+from app.core.config import settings
+from app.models.models import DatabaseType
+from app.services.batch_sizer import AdaptiveBatchSizer, estimate_row_bytes
+from app.services.bulk_writers import create_bulk_writer
+from app.services.columnar import ColumnBatch
+from app.services.database_service import DatabaseConnection, complete_uninterrupted
+from app.services.filters import RowFilter
+from app.services.index_manager import TargetObjectManager, create_object_manager
+from app.services.schema_translator import SchemaTranslator
+from app.services.spill import SpillQueue, SpillStore
+from app.services.transform import TransformPlan
+
+logger = logging.getLogger(__name__)
+
+
+# 读取协程放入队列的结束标记：数据已读完 / 因取消提前停止
+_END = object()
+_STOPPED = object()
+
+
+class MigrationCancelled(Exception):
+    """迁移任务被取消（已写入的批次均已提交）"""
+
+
+class KeyRange:
+    """主键区间 (lower, upper]，lower 为 None 表示从头开始，upper 为 None 表示直到末尾"""
+    
+    def __init__(self, index: int, lower: Any, upper: Any):
+        self.index = index
+        self.lower = lower
+        self.upper = upper
+        self.last_key = lower
+        self.rows = 0
+        self.done = False
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "lower": self.lower,
+            "upper": self.upper,
+            "last_key": self.last_key,
+            "rows": self.rows,
+            "done": self.done,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KeyRange":
+        key_range = cls(data["index"], data.get("lower"), data.get("upper"))
+        key_range.last_key = data.get("last_key")
+        key_range.rows = data.get("rows", 0)
+        key_range.done = data.get("done", False)
+        return key_range
+
+
+class MigrationEngine:
+    """数据迁移执行引擎：按批次读取源表并批量写入目标表
+    
+    源表有单列主键时按主键范围分页（keyset），大表再把主键空间切成多个区间，
+    每个区间由独立的读写连接并行复制；没有可用主键时退化为服务端流式游标顺序读取。
+    总行数可以是统计信息估算值（total_rows_exact=False），复制过程中按已覆盖的主键范围修正。
+    每写入 checkpoint_interval 批保存一次检查点，传入检查点时从各区间记录的位置继续。
+    每个区间内读取和写入由两个协程经容量为 queue_depth 的队列流水线执行，
+    内存占用不超过约 (queue_depth + 2) 批；batch_size 为初始批大小，复制过程中按每批耗时和数据量自动调整。
+    load_mode 为 deferred 时，目标表已有的二级索引、约束和触发器在复制前删除或禁用，复制结束后重建；
+    没有可用主键的表无法续传，进程意外退出后被删除的对象无从恢复，不使用 deferred 方式。
+    有列转换计划（transform）时，每批数据在写入前按列整体转换。
+    sync_mode 为 incremental 时按目标表的键插入或更新，本次同步的水位区间（watermark_window）随检查点保存。
+    指定 spill_dir 且开启落盘时，队列已满后读取的批次写入该目录下的段文件，读取不再等待写入；
+    复制中断时未提交的批次保留在段文件中，续传时先重放这些批次再继续读取源表。
+    """
+    
+    def __init__(self, source: DatabaseConnection, target: DatabaseConnection,
+                 source_table: str, target_table: str,
+                 row_filter: Optional[RowFilter] = None,
+                 batch_size: Optional[int] = None,
+                 parallelism: Optional[int] = None,
+                 total_rows: int = 0,
+                 total_rows_exact: bool = True,
+                 start_key: Any = None,
+                 processed_rows: int = 0,
+                 on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                 cancel_event: Optional[asyncio.Event] = None,
+                 checkpoint: Optional[Dict[str, Any]] = None,
+                 on_checkpoint: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 checkpoint_interval: Optional[int] = None,
+                 migrate_structure: bool = False,
+                 load_mode: str = "append",
+                 transform: Optional[TransformPlan] = None,
+                 sync_mode: str = "full",
+                 watermark_window: Optional[Dict[str, Any]] = None,
+                 spill_dir: Optional[str] = None):
+        self.source = source
+        self.target = target
+        self.source_table = source_table
+        self.target_table = target_table
+        # 结构化过滤条件，编译为参数化SQL下推到源库的计数、区间规划和分批读取
+        self.row_filter = row_filter
+        self.filter_plan: Optional[Dict[str, Any]] = None
+        self.batch_size = batch_size or settings.MIGRATION_BATCH_SIZE
+        self.queue_depth = max(1, settings.MIGRATION_QUEUE_DEPTH)
+        # 每个区间各占用一个源连接和一个目标连接，并发度不超过连接池上限
+        self.parallelism = max(1, min(parallelism or settings.MIGRATION_PARALLELISM,
+                                      settings.DATASOURCE_POOL_MAX_SIZE))
+        if target.db_type == DatabaseType.SQLITE:
+            # SQLite同一时刻只允许一个写事务，并行写入只会互相等待锁
+            self.parallelism = 1
+        # 内存预算按同时驻留内存的批数（每个区间最多 queue_depth + 2 批）分摊到单批
+        self.sizer = AdaptiveBatchSizer(
+            self.batch_size,
+            memory_budget=settings.MIGRATION_MEMORY_BUDGET_MB * 1024 * 1024 // ((self.queue_depth + 2) * self.parallelism)
+        )
+        self.total_rows = total_rows
+        # total_rows 来自统计信息估算时，复制过程中按已覆盖的主键范围修正
+        self.total_rows_exact = total_rows_exact
+        self.estimated_rows = total_rows
+        self.key_bounds: Optional[tuple] = None
+        self.on_progress = on_progress
+        # 续传时从 start_key 之后开始读取，已处理行数在此基础上累加
+        self.start_key = start_key
+        self.processed_rows = processed_rows
+        self.key_column: Optional[str] = None
+        self.ranges: List[KeyRange] = []
+        self._progress_lock = asyncio.Lock()
+        # 取消请求在批次之间检查：当前批次写完并提交后停止读取
+        self.cancel_event = cancel_event or asyncio.Event()
+        self.resume_from = checkpoint
+        self.on_checkpoint = on_checkpoint
+        self.checkpoint_interval = max(1, checkpoint_interval or settings.MIGRATION_CHECKPOINT_INTERVAL)
+        self._batches_since_checkpoint = 0
+        # 开始复制前目标表已有的行数，用于核对检查点中的目标表行数
+        self.target_rows_before: Optional[int] = None
+        # 按目标库类型选择批量写入方式
+        self.writer = create_bulk_writer(target, target_table)
+        self.started_at: Optional[float] = None
+        self.read_seconds = 0.0
+        # 目标表由本次迁移创建时，二级索引推迟到数据导入完成后再建立
+        self.migrate_structure = migrate_structure
+        self.deferred_indexes: List[str] = []
+        self.index_errors: List[str] = []
+        # deferred 导入方式下记录并暂时删除/禁用目标表的索引、约束和触发器
+        self.load_mode = load_mode
+        if sync_mode == "incremental" and load_mode == "deferred":
+            # 按键更新依赖目标表的唯一索引，增量数据量也不值得删除再重建索引
+            logger.info(f"表 {target_table} 为增量同步，忽略 deferred 导入方式")
+            self.load_mode = "append"
+        self.target_objects: Optional[TargetObjectManager] = None
+        # mapping_config 编译得到的列转换计划，为空时源列原样写入
+        self.transform = transform
+        self.transform_seconds = 0.0
+        # 增量同步：本次复制的水位区间，续传时沿用检查点中的区间
+        self.sync_mode = sync_mode
+        self.watermark_window = watermark_window
+        # 目标写入跟不上源读取时暂存批次的段文件目录
+        self.spill = SpillStore(spill_dir) if spill_dir and settings.MIGRATION_SPILL_ENABLED else None
+    
+    @property
+    def last_key(self) -> Any:
+        """可用于续传的位置，只有单区间顺序复制时才有意义"""
+        if len(self.ranges) == 1:
+            return self.ranges[0].last_key
+        return None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    def checkpoint(self) -> Dict[str, Any]:
+        """当前复制状态：各区间位置、已提交行数和目标表应有的行数"""
+        return {
+            "key_column": self.key_column,
+            "last_key": self.last_key,
+            "rows_committed": self.processed_rows,
+            "target_rows": (self.target_rows_before or 0) + self.processed_rows,
+            "ranges": [key_range.to_dict() for key_range in self.ranges],
+            "deferred_indexes": self.deferred_indexes,
+            "target_objects": self.target_objects.to_dict() if self.target_objects else None,
+            "watermark": self.watermark_window,
+        }
+    
+    def metrics(self) -> Dict[str, Any]:
+        """本次执行的读写耗时和吞吐量"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        rows = self.writer.rows
+        return {
+            "rows": rows,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+            "read_seconds": round(self.read_seconds, 3),
+            "transform_seconds": round(self.transform_seconds, 3),
+            "write": self.writer.stats(),
+            "batch_size": self.sizer.stats(),
+            "spill": self.spill.stats() if self.spill else None,
+            "deferred_indexes": len(self.deferred_indexes),
+            "index_errors": self.index_errors,
+            "target_objects": self.target_objects.stats() if self.target_objects else None,
+            "filter": self.filter_plan,
+            "total_rows": self.total_rows,
+            "total_rows_exact": self.total_rows_exact,
+        }
+    
+    async def resolve_key_column(self) -> Optional[str]:
+        """确定用于分页的主键列，只有单列主键可用"""
+        primary_key = await self.source.get_primary_key(self.source_table)
+        if len(primary_key) == 1:
+            return primary_key[0]
+        if primary_key:
+            logger.info(f"表 {self.source_table} 为复合主键 {primary_key}，使用流式游标读取")
+        else:
+            logger.info(f"表 {self.source_table} 没有主键，使用流式游标读取")
+        return None
+    
+    async def plan_filter(self):
+        """检查过滤条件能否使用源表索引，不能时每批读取可能需要扫描大量不满足条件的行"""
+        if self.row_filter is None:
+            return
+        indexes = [index["columns"] for index in await self.source.get_table_indexes(self.source_table)]
+        primary_key = await self.source.get_primary_key(self.source_table)
+        if primary_key:
+            indexes.append(primary_key)
+        self.filter_plan = self.row_filter.index_plan(indexes)
+        self.filter_plan["condition"] = repr(self.row_filter)
+        if self.filter_plan["indexed"] is False:
+            logger.warning(
+                f"表 {self.source_table} 的过滤条件 {self.row_filter!r} 无法使用源表索引"
+                f"（涉及列 {', '.join(self.filter_plan['columns'])}），计数和读取可能需要扫描全表，"
+                f"可以在源表上为这些列建立索引"
+            )
+        elif self.filter_plan["indexed"]:
+            logger.info(f"表 {self.source_table} 的过滤条件可以使用以 {', '.join(self.filter_plan['index_columns'])} 开头的索引")
+    
+    async def plan_ranges(self) -> List[KeyRange]:
+        """把主键空间切分为若干区间：整数主键按最小/最大值等分，其他类型按行偏移抽样分位点"""
+        parts = self.parallelism
+        if self.start_key is not None or parts <= 1 or self.total_rows < parts * self.batch_size:
+            return [KeyRange(0, self.start_key, None)]
+        
+        low, high = await self.source.get_key_range(self.source_table, self.key_column, self.row_filter)
+        self.key_bounds = (low, high)
+        if low is None or low == high:
+            return [KeyRange(0, None, None)]
+        
+        if isinstance(low, int) and isinstance(high, int):
+            boundaries = [low + (high - low) * i // parts for i in range(1, parts)]
+        else:
+            offsets = [self.total_rows * i // parts for i in range(1, parts)]
+            boundaries = await self.source.get_key_quantiles(
+                self.source_table, self.key_column, offsets, self.row_filter
+            )
+        boundaries = sorted(set(boundaries))
+        
+        lowers = [None] + boundaries
+        uppers = boundaries + [None]
+        return [KeyRange(index, lower, upper) for index, (lower, upper) in enumerate(zip(lowers, uppers))]
+    
+    async def run(self) -> int:
+        """执行数据复制，返回写入的总行数"""
+        self.started_at = time.monotonic()
+        if self.spill is not None and not self.resume_from:
+            # 不续传时上次执行留下的段文件已无用
+            self.spill.clear()
+        if self.resume_from:
+            self.deferred_indexes = self.resume_from.get("deferred_indexes", [])
+        elif self.migrate_structure:
+            translator = SchemaTranslator(self.source, self.target)
+            self.deferred_indexes = await translator.ensure_target_table(
+                self.source_table, self.target_table, self.transform
+            )
+        if self.sync_mode == "incremental":
+            self.writer = create_bulk_writer(self.target, self.target_table, upsert_keys=await self._upsert_keys())
+        self.key_column = await self.resolve_key_column()
+        await self.plan_filter()
+        
+        if self.key_column:
+            if self.resume_from and self.resume_from.get("key_column") == self.key_column:
+                await self._restore_ranges()
+            else:
+                self.target_rows_before = await self.target.get_table_count(self.target_table)
+                self.ranges = await self.plan_ranges()
+            if not self.total_rows_exact and self.key_bounds is None:
+                # 主键两端的值由索引直接得到，用于按已覆盖的主键范围修正估算行数
+                self.key_bounds = await self.source.get_key_range(self.source_table, self.key_column)
+        
+        await self._disable_target_objects()
+        try:
+            if self.key_column:
+                pending = [key_range for key_range in self.ranges if not key_range.done]
+                if len(pending) == 1:
+                    await self._copy_range(pending[0])
+                elif pending:
+                    logger.info(f"表 {self.source_table} 按主键 {self.key_column} 切分为 {len(pending)} 个区间并行复制")
+                    await self._run_together(*(self._copy_range(key_range) for key_range in pending))
+            else:
+                await self._copy_by_stream()
+        finally:
+            # 复制失败或取消时同样恢复目标表原有的索引、约束和触发器
+            if self.target_objects is not None and self.target_objects.disabled:
+                self.index_errors.extend(await complete_uninterrupted(self.target_objects.rebuild()))
+        
+        if self.cancelled:
+            logger.info(f"表 {self.source_table} 的复制已取消，已写入 {self.processed_rows} 行")
+            raise MigrationCancelled()
+        
+        await self._create_deferred_indexes()
+        if self.spill is not None:
+            self.spill.cleanup()
+        
+        metrics = self.metrics()
+        logger.info(
+            f"表 {self.source_table} -> {self.target_table} 复制完成: "
+            f"{self.processed_rows} 行, 耗时 {metrics['elapsed_seconds']:.1f} 秒, "
+            f"写入方式 {self.writer.name}, 写入 {metrics['write']['rows_per_second']} 行/秒"
+        )
+        return self.processed_rows
+    
+    async def _restore_ranges(self):
+        """从检查点恢复各区间位置
+        
+        检查点之后、任务中断之前可能还有已提交的批次，按目标表中实际存在的主键把位置校正到最后一条已写入的行，
+        避免重复写入。
+        """
+        checkpoint = self.resume_from
+        self.ranges = [KeyRange.from_dict(data) for data in checkpoint.get("ranges", [])]
+        if not self.ranges:
+            self.ranges = [KeyRange(0, checkpoint.get("last_key"), None)]
+        self.processed_rows = checkpoint.get("rows_committed", 0)
+        self.target_rows_before = checkpoint.get("target_rows", self.processed_rows) - self.processed_rows
+        
+        if self.sync_mode == "incremental":
+            # 目标表中本来就有这些主键的旧版本行，无法据此判断检查点之后写到了哪里；
+            # 按键更新可以重复执行，从检查点位置重新写入即可
+            logger.info(f"表 {self.source_table} 从检查点恢复增量同步，已写入 {self.processed_rows} 行")
+            return
+        target_key = self.transform.key_column(self.key_column) if self.transform else self.key_column
+        if target_key is None:
+            logger.warning(f"主键 {self.key_column} 在目标表中被删除或转换，无法核对检查点之后已写入的行")
+        for key_range in self.ranges:
+            if key_range.done or target_key is None:
+                continue
+            rows, max_key = await self.target.get_key_range_stats(
+                self.target_table, target_key, key_range.last_key, key_range.upper
+            )
+            if rows:
+                logger.info(f"区间 {key_range.index} 在检查点之后已写入 {rows} 行，从主键 {max_key} 之后继续")
+                key_range.last_key = max_key
+                key_range.rows += rows
+                self.processed_rows += rows
+        logger.info(f"表 {self.source_table} 从检查点恢复，已写入 {self.processed_rows} 行")
+    
+    async def _upsert_keys(self) -> List[str]:
+        """增量同步判断行是否已存在的键：目标表主键，没有主键时使用第一个唯一索引"""
+        keys = await self.target.get_primary_key(self.target_table)
+        if not keys:
+            unique = [index["columns"] for index in await self.target.get_table_indexes(self.target_table) if index["is_unique"]]
+            keys = unique[0] if unique else []
+        if not keys:
+            raise ValueError(f"增量同步需要目标表 {self.target_table} 有主键或唯一索引")
+        return keys
+    
+    async def _disable_target_objects(self):
+        """deferred 导入方式：记录目标表的二级索引、约束和触发器并删除或禁用
+        
+        续传时检查点中的对象仍处于删除/禁用状态则沿用记录的定义，不再重新读取；
+        删除/禁用后立即保存检查点，进程意外退出后续传仍能按原定义重建。
+        """
+        if self.load_mode != "deferred":
+            return
+        if not self.key_column:
+            # 没有主键的任务不能续传，删除的对象定义即使保存在检查点中也没有机会用于重建
+            logger.warning(f"源表 {self.source_table} 没有可用于续传的主键，目标表 {self.target_table} 不使用 deferred 导入方式")
+            self.load_mode = "append"
+            return
+        self.target_objects = create_object_manager(self.target, self.target_table, self.parallelism)
+        saved = (self.resume_from or {}).get("target_objects")
+        if saved and saved.get("state") == "disabled":
+            self.target_objects.load(saved)
+            logger.info(f"目标表 {self.target_table} 的 {len(self.target_objects.objects)} 个索引/约束/触发器仍处于删除或禁用状态，导入后重建")
+            return
+        
+        await self.target_objects.capture()
+        if not self.target_objects.objects:
+            return
+        await self.target_objects.disable()
+        if self.on_checkpoint:
+            async with self._progress_lock:
+                await self.on_checkpoint(self.checkpoint())
+    
+    async def _create_deferred_indexes(self):
+        """数据导入完成后建立二级索引，单个索引失败只记录错误，不影响已导入的数据"""
+        for statement in self.deferred_indexes:
+            started = time.monotonic()
+            try:
+                await self.target.execute(statement)
+                logger.info(f"已建立索引（{time.monotonic() - started:.1f} 秒）: {statement}")
+            except Exception as e:
+                logger.error(f"建立索引失败: {statement}: {str(e)}")
+                self.index_errors.append(f"{statement}: {str(e)}")
+    
+    @staticmethod
+    async def _run_together(*coros):
+        """并发执行，任一协程失败时取消其余协程并抛出第一个原始异常"""
+        try:
+            async with asyncio.TaskGroup() as group:
+                for coro in coros:
+                    group.create_task(coro)
+        except ExceptionGroup as errors:
+            raise errors.exceptions[0]
+    
+    async def _copy_range(self, key_range: KeyRange):
+        """按主键分页复制一个区间：读取协程和写入协程经有界队列并行工作
+        
+        上次执行留下了从区间位置开始的段文件时先写入这些批次，读取从最后一个段文件的批末主键之后开始；
+        复制失败时队列中尚未提交的批次写入段文件，供续传时重放。
+        """
+        queue = SpillQueue(self.queue_depth, self.spill, key_range.index, key_range.last_key)
+        if self.spill is not None and self.resume_from:
+            queue.preload(self.spill.recover(key_range.index, key_range.last_key))
+        async with self.source.acquire() as source_conn, self.target.acquire() as target_conn:
+            await self.writer.prepare(target_conn)
+            try:
+                await self._run_together(
+                    self._read_range(source_conn, key_range, queue, queue.position),
+                    self._write_from_queue(target_conn, queue, key_range)
+                )
+            except Exception:
+                await complete_uninterrupted(queue.persist())
+                raise
+    
+    async def _read_range(self, source_conn, key_range: KeyRange, queue: SpillQueue, read_key: Any):
+        """读取协程：WHERE pk > 读取位置 AND pk <= upper ORDER BY pk LIMIT n，队列满且不能落盘时等待写入"""
+        key_index = None
+        exhausted = False
+        while not self.cancelled:
+            batch_size = self.sizer.size
+            read_started = time.monotonic()
+            try:
+                columns, rows = await self.source.fetch_keyset_batch(
+                    source_conn, self.source_table, self.key_column, read_key,
+                    batch_size, self.row_filter, upper_key=key_range.upper
+                )
+            except Exception as e:
+                # 读取超时：缩小批大小后重新读取同一位置
+                if self.sizer.shrink(e):
+                    continue
+                raise
+            read_elapsed = time.monotonic() - read_started
+            self.read_seconds += read_elapsed
+            if not rows:
+                exhausted = True
+                break
+            if key_index is None:
+                key_index = columns.index(self.key_column)
+            
+            read_key = rows[-1][key_index]
+            await queue.put((columns, self._to_batch(columns, rows), read_key, read_elapsed))
+            if len(rows) < batch_size:
+                exhausted = True
+                break
+        await queue.put(_END if exhausted else _STOPPED)
+    
+    async def _write_from_queue(self, target_conn, queue: SpillQueue, key_range: Optional[KeyRange] = None):
+        """写入协程：逐批写入队列中的数据，区间位置只在批次提交后前移
+        
+        取消后继续取出并丢弃队列中的批次，直到读取协程停止，避免读取协程阻塞在已满的队列上。
+        """
+        discarded = False
+        while True:
+            item = await queue.get()
+            if item is _END or item is _STOPPED:
+                if key_range is not None and item is _END and not discarded:
+                    key_range.done = True
+                return
+            if self.cancelled:
+                discarded = True
+                continue
+            
+            columns, rows, last_key, read_elapsed = item
+            if self.transform is not None:
+                transform_started = time.monotonic()
+                columns, rows = self.transform.apply(columns, rows)
+                self.transform_seconds += time.monotonic() - transform_started
+            write_started = time.monotonic()
+            written = await self._write_batch(target_conn, columns, rows)
+            # 读写流水线并行，每批的节拍取决于较慢的一方
+            self.sizer.record(written, max(read_elapsed, time.monotonic() - write_started), estimate_row_bytes(rows))
+            if key_range is not None:
+                key_range.rows += written
+                key_range.last_key = last_key
+            queue.task_done()
+            await self._add_progress(written)
+    
+    @staticmethod
+    def _to_batch(columns: List[str], rows: List[Sequence]):
+        """读取的行立即转为按列存放的批，等待写入期间数值列不保留逐值的Python对象"""
+        if settings.MIGRATION_COLUMNAR_BATCHES:
+            return ColumnBatch.from_rows(columns, rows)
+        return rows
+    
+    async def _write_batch(self, target_conn, columns: List[str], rows: List[Sequence]) -> int:
+        """写入一批；超时或语句过大时缩小批大小，把这一批按新的大小拆开重新写入"""
+        try:
+            return await self.writer.write(target_conn, columns, rows)
+        except Exception as e:
+            if len(rows) <= 1 or not self.sizer.shrink(e):
+                raise
+        written = 0
+        for start in range(0, len(rows), self.sizer.size):
+            written += await self._write_batch(target_conn, columns, rows[start:start + self.sizer.size])
+        return written
+    
+    async def _copy_by_stream(self):
+        """没有可用主键时使用服务端流式游标顺序读取，读写同样经有界队列并行"""
+        queue = SpillQueue(self.queue_depth, self.spill)
+        async with self.target.acquire() as target_conn:
+            await self.writer.prepare(target_conn)
+            try:
+                await self._run_together(
+                    self._read_stream(queue),
+                    self._write_from_queue(target_conn, queue)
+                )
+            finally:
+                # 流式读取无法续传，段文件不保留
+                if self.spill is not None:
+                    self.spill.cleanup()
+    
+    async def _read_stream(self, queue: SpillQueue):
+        # 游标中途出错无法重读，流式读取只按每批耗时调整之后的读取量
+        batches = self.source.iter_batches(self.source_table, lambda: self.sizer.size, self.row_filter)
+        exhausted = True
+        async with aclosing(batches):
+            read_started = time.monotonic()
+            async for columns, rows in batches:
+                read_elapsed = time.monotonic() - read_started
+                self.read_seconds += read_elapsed
+                if self.cancelled:
+                    exhausted = False
+                    break
+                await queue.put((columns, self._to_batch(columns, rows), None, read_elapsed))
+                read_started = time.monotonic()
+        await queue.put(_END if exhausted else _STOPPED)
+    
+    def _key_coverage(self) -> Optional[float]:
+        """已复制的主键范围占整个主键空间的比例，只有整数主键可以计算"""
+        if not self.key_bounds or not self.ranges:
+            return None
+        low, high = self.key_bounds
+        if not isinstance(low, int) or not isinstance(high, int) or isinstance(low, bool) or high <= low:
+            return None
+        
+        def clamp(value: Any, default: int) -> int:
+            return default if value is None else min(max(value, low), high)
+        
+        # 第一个区间之前的主键（续传时的 start_key 之前）已在之前的执行中复制
+        covered = clamp(self.ranges[0].lower, low) - low
+        for key_range in self.ranges:
+            lower = clamp(key_range.lower, low)
+            upper = clamp(key_range.upper, high)
+            position = upper if key_range.done else clamp(key_range.last_key, lower)
+            covered += max(0, position - lower)
+        return min(1.0, covered / (high - low))
+    
+    def _refine_total(self):
+        """估算的总行数随复制进度修正
+        
+        已覆盖比例 f：没有过滤条件时总数 = 已复制行数 + 统计估算 × (1 - f)，随 f 趋近 1 逐渐变为实际行数；
+        有过滤条件时统计信息只是全表行数，按已复制行数 / f 外推。总数不小于已复制行数。
+        """
+        if self.total_rows_exact:
+            return
+        fraction = self._key_coverage()
+        estimate = self.total_rows
+        if fraction is not None and fraction > 0:
+            if self.row_filter is None:
+                estimate = self.processed_rows + self.estimated_rows * (1 - fraction)
+            elif fraction >= 0.01:
+                estimate = self.processed_rows / fraction
+        self.total_rows = max(int(estimate), self.processed_rows)
+    
+    async def _add_progress(self, written: int):
+        self.processed_rows += written
+        # 多个区间共用同一个进度回调，串行调用
+        async with self._progress_lock:
+            self._refine_total()
+            if self.on_progress:
+                await self.on_progress(self.processed_rows, self.total_rows)
+            self._batches_since_checkpoint += 1
+            if self.on_checkpoint and self._batches_since_checkpoint >= self.checkpoint_interval:
+                self._batches_since_checkpoint = 0
+                await self.on_checkpoint(self.checkpoint())
\ No newline at end of file
@@ -1,14 +1,27 @@
 import asyncio
 import json
 import logging
-from datetime import datetime
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
 from typing import Optional, Dict, Any, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.models.models import MigrationTask, TaskStatus, DataSource
 from app.schemas.schemas import MigrationTaskCreate, MigrationTaskUpdate
-from app.services.database_service import DatabaseConnection
+from app.services.database_service import DatabaseConnection, complete_uninterrupted
+from app.services.datasource_service import DataSourceService
+from app.services.migration_engine import MigrationEngine, MigrationCancelled
+from app.services.metadata_cache import metadata_cache
+from app.services.progress_tracker import progress_tracker
+from app.services.task_scheduler import task_scheduler
+from app.services.filters import RowFilter, combine_filters
+from app.services.spill import SpillStore, task_spill_dir
+from app.services.transform import TransformPlan
+from app.services.verification import ChecksumVerifier
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +32,10 @@ class MigrationTaskService:
     @staticmethod
     async def create_task(db: AsyncSession, task: MigrationTaskCreate) -> MigrationTask:
         """创建迁移任务"""
+        # 提前检查 mapping_config 和 filter_condition，格式错误时抛出 ValueError
+        TransformPlan.parse(task.mapping_config)
+        RowFilter.parse(task.filter_condition)
+        MigrationTaskService._check_sync_mode(task.sync_mode, task.watermark_column)
         db_task = MigrationTask(**task.dict())
         db.add(db_task)
         await db.commit()
@@ -47,6 +64,20 @@ class MigrationTaskService:
             return None
         
         update_data = task_update.dict(exclude_unset=True)
+        if "mapping_config" in update_data:
+            TransformPlan.parse(update_data["mapping_config"])
+        if "filter_condition" in update_data:
+            RowFilter.parse(update_data["filter_condition"])
+        if "sync_mode" in update_data or "watermark_column" in update_data:
+            MigrationTaskService._check_sync_mode(
+                update_data.get("sync_mode", db_task.sync_mode),
+                update_data.get("watermark_column", db_task.watermark_column)
+            )
+        if update_data.get("watermark") is not None:
+            try:
+                json.loads(update_data["watermark"])
+            except ValueError:
+                raise ValueError("watermark 必须是JSON")
         for field, value in update_data.items():
             setattr(db_task, field, value)
         
@@ -54,131 +85,565 @@ class MigrationTaskService:
         await db.refresh(db_task)
         return db_task
     
+    @staticmethod
+    def _check_sync_mode(sync_mode: Optional[str], watermark_column: Optional[str]):
+        if sync_mode == "incremental" and not watermark_column:
+            raise ValueError("增量同步（sync_mode=incremental）需要指定水位列 watermark_column")
+    
     @staticmethod
     async def delete_task(db: AsyncSession, task_id: int) -> bool:
         """删除迁移任务"""
         result = await db.execute(delete(MigrationTask).where(MigrationTask.id == task_id))
         await db.commit()
+        # 失败任务留下的段文件不再有用
+        SpillStore.remove_directory(task_spill_dir(task_id))
         return result.rowcount > 0
     
     @staticmethod
     async def start_task(db: AsyncSession, task_id: int) -> bool:
-        """启动迁移任务"""
+        """启动迁移任务
+        
+        增量同步任务在上次同步结束后可以再次启动，复制上次水位之后的新数据；校验任务结束后可以再次启动重新校验。
+        """
         task = await MigrationTaskService.get_task(db, task_id)
-        if not task or task.status != TaskStatus.PENDING:
+        if not task:
+            return False
+        # 升级前保存的旧式SQL条件在加入队列前报错，不等到执行时才失败
+        RowFilter.parse(task.filter_condition)
+        repeatable = task.sync_mode == "incremental" or task.task_type == "verification"
+        if repeatable and task.status in (
+            TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED, TaskStatus.RESUMABLE
+        ):
+            # 未完成的上次同步没有更新水位，新的一次同步会重新复制这些行
+            task.total_rows = 0
+            task.processed_rows = 0
+            task.last_key = None
+            task.error_message = None
+            task.completed_at = None
+        elif task.status != TaskStatus.PENDING:
             return False
         
-        task.status = TaskStatus.RUNNING
-        task.started_at = datetime.now()
+        task.status = TaskStatus.QUEUED
         task.progress = 0
+        task.checkpoint = None
+        task.checkpoint_at = None
+        await db.commit()
+        
+        # 加入调度队列，由调度器按优先级和并发上限执行
+        await task_scheduler.submit(task_id, task.priority or 0)
+        return True
+    
+    @staticmethod
+    async def resume_task(db: AsyncSession, task_id: int) -> bool:
+        """从检查点继续执行中断、失败或已取消的迁移任务"""
+        task = await MigrationTaskService.get_task(db, task_id)
+        if not task or task.status not in (TaskStatus.RESUMABLE, TaskStatus.FAILED, TaskStatus.CANCELLED):
+            return False
+        if not task.checkpoint or not json.loads(task.checkpoint).get("key_column"):
+            # 没有主键的表按流式游标顺序读取，无法确定续传位置
+            return False
+        RowFilter.parse(task.filter_condition)
+        
+        task.status = TaskStatus.QUEUED
+        task.error_message = None
+        task.completed_at = None
         await db.commit()
         
-        # 异步执行迁移任务
-        asyncio.create_task(MigrationTaskService._execute_task(db, task_id))
+        await task_scheduler.submit(task_id, task.priority or 0)
         return True
     
     @staticmethod
     async def cancel_task(db: AsyncSession, task_id: int) -> bool:
         """取消迁移任务"""
         task = await MigrationTaskService.get_task(db, task_id)
-        if not task or task.status != TaskStatus.RUNNING:
+        if not task or task.status not in (TaskStatus.QUEUED, TaskStatus.RUNNING):
             return False
         
+        if task.status == TaskStatus.QUEUED:
+            task_scheduler.remove(task_id)
+        elif task_scheduler.cancel(task_id, task.cancel_policy or settings.MIGRATION_CANCEL_POLICY):
+            # 执行协程在停止后记录取消状态和停止位置
+            return True
+        
         task.status = TaskStatus.CANCELLED
         task.completed_at = datetime.now()
         await db.commit()
         return True
     
     @staticmethod
-    async def _execute_task(db: AsyncSession, task_id: int):
-        """执行迁移任务"""
+    async def run_task(task_id: int):
+        """调度器执行入口：把排队中的任务置为运行中并执行"""
+        async with AsyncSessionLocal() as db:
+            task = await MigrationTaskService.get_task(db, task_id)
+            if not task or task.status != TaskStatus.QUEUED:
+                return
+            
+            task.status = TaskStatus.RUNNING
+            task.started_at = datetime.now()
+            await db.commit()
+            task_type = task.task_type
+        
+        if task_type == "verification":
+            await MigrationTaskService._execute_verification(task_id)
+        else:
+            await MigrationTaskService._execute_task(task_id)
+    
+    @staticmethod
+    async def fail_timed_out_task(task_id: int):
+        """任务执行超时被调度器终止后，记录失败状态"""
+        async with AsyncSessionLocal() as db:
+            task = await MigrationTaskService.get_task(db, task_id)
+            if not task or task.status != TaskStatus.RUNNING:
+                return
+            
+            task.status = TaskStatus.FAILED
+            task.error_message = f"任务执行超时（超过 {settings.TASK_TIMEOUT} 秒）"
+            task.completed_at = datetime.now()
+            await db.commit()
+    
+    @staticmethod
+    async def mark_interrupted_tasks():
+        """服务启动时把上次运行中被中断的任务标记为可续传"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(MigrationTask).where(MigrationTask.status == TaskStatus.RUNNING))
+            tasks = result.scalars().all()
+            for task in tasks:
+                task.status = TaskStatus.RESUMABLE
+                task.error_message = "服务重启时任务被中断，可从检查点继续执行"
+            await db.commit()
+            if tasks:
+                logger.info(f"已将 {len(tasks)} 个中断的迁移任务标记为可续传")
+    
+    @staticmethod
+    async def check_filter_conditions():
+        """服务启动时找出 filter_condition 无法使用的任务（如升级前保存的旧式SQL条件），记录警告"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MigrationTask.id, MigrationTask.filter_condition)
+                .where(MigrationTask.filter_condition.isnot(None))
+                .order_by(MigrationTask.id)
+            )
+            rows = result.all()
+        invalid = []
+        for task_id, filter_condition in rows:
+            try:
+                RowFilter.parse(filter_condition)
+            except ValueError:
+                invalid.append(str(task_id))
+        if invalid:
+            logger.warning(
+                f"迁移任务 {', '.join(invalid)} 的 filter_condition 不是有效的结构化条件，修改为JSON条件前无法启动；"
+                f"旧式SQL条件可以开启 MIGRATION_ALLOW_RAW_FILTER 继续使用"
+            )
+    
+    @staticmethod
+    async def restore_queue():
+        """服务启动时把仍处于排队状态的任务重新加入调度队列"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MigrationTask)
+                .where(MigrationTask.status == TaskStatus.QUEUED)
+                .order_by(MigrationTask.id)
+            )
+            for task in result.scalars().all():
+                await task_scheduler.submit(task.id, task.priority or 0)
+    
+    @staticmethod
+    async def _update_task(task_id: int, **values):
+        """在独立的短事务中更新任务字段，执行过程中不长期占用元数据库会话"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(MigrationTask).where(MigrationTask.id == task_id).values(**values))
+            await db.commit()
+    
+    @staticmethod
+    async def flush_progress(task_id: int, processed_rows: int, total_rows: int, progress: int):
+        """进度刷新协程的写入入口，任务已结束时不覆盖最终结果"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(MigrationTask)
+                .where(MigrationTask.id == task_id, MigrationTask.status == TaskStatus.RUNNING)
+                .values(processed_rows=processed_rows, total_rows=total_rows, progress=progress)
+            )
+            await db.commit()
+    
+    @staticmethod
+    async def _fail_task(task_id: int, error_message: str, **values):
+        await MigrationTaskService._update_task(
+            task_id,
+            status=TaskStatus.FAILED,
+            error_message=error_message,
+            completed_at=datetime.now(),
+            **values
+        )
+    
+    @staticmethod
+    async def _load_task(task_id: int):
+        """读取任务及其源、目标数据源，读取完即关闭会话"""
+        async with AsyncSessionLocal() as db:
+            task = await MigrationTaskService.get_task(db, task_id)
+            if not task:
+                return None, None, None
+            source_ds = await db.get(DataSource, task.source_id)
+            target_ds = await db.get(DataSource, task.target_id)
+            return task, source_ds, target_ds
+    
+    @staticmethod
+    async def _execute_task(task_id: int):
+        """执行迁移任务
+        
+        执行过程不持有请求或调度器的会话：任务配置在开始时一次读出，
+        实时进度只更新内存中的进度表，由刷新协程节流写入；检查点每隔若干批在独立的短事务中写入。
+        """
+        engine = None
+        cancel_event = task_scheduler.cancel_event(task_id)
         try:
-            # 重新获取任务（在新的会话中）
-            async with db.begin():
-                result = await db.execute(select(MigrationTask).where(MigrationTask.id == task_id))
-                task = result.scalar_one_or_none()
-                
-                if not task or task.status != TaskStatus.RUNNING:
-                    return
-                
-                # 获取源和目标数据源
-                source_result = await db.execute(select(DataSource).where(DataSource.id == task.source_id))
-                source_ds = source_result.scalar_one_or_none()
-                
-                target_result = await db.execute(select(DataSource).where(DataSource.id == task.target_id))
-                target_ds = target_result.scalar_one_or_none()
-                
-                if not source_ds or not target_ds:
-                    task.status = TaskStatus.FAILED
-                    task.error_message = "源数据源或目标数据源不存在"
-                    task.completed_at = datetime.now()
-                    await db.commit()
-                    return
-                
-                # 创建数据库连接
-                source_conn = DatabaseConnection(
-                    db_type=source_ds.db_type,
-                    host=source_ds.host,
-                    port=source_ds.port,
-                    database=source_ds.database,
-                    username=source_ds.username,
-                    password=source_ds.password
+            task, source_ds, target_ds = await MigrationTaskService._load_task(task_id)
+            if not task or task.status != TaskStatus.RUNNING:
+                return
+            
+            if not source_ds or not target_ds:
+                await MigrationTaskService._fail_task(task_id, "源数据源或目标数据源不存在")
+                return
+            
+            # 创建数据库连接
+            source_conn = DataSourceService.connect(source_ds)
+            target_conn = DataSourceService.connect(target_ds)
+            
+            # 测试连接
+            if not await source_conn.test_connection():
+                await MigrationTaskService._fail_task(task_id, "源数据源连接失败")
+                return
+            
+            if not await target_conn.test_connection():
+                await MigrationTaskService._fail_task(task_id, "目标数据源连接失败")
+                return
+            
+            checkpoint = MigrationTaskService._load_checkpoint(task.checkpoint)
+            row_filter = RowFilter.parse(task.filter_condition)
+            watermark_window = None
+            if task.sync_mode == "incremental":
+                # 续传时沿用检查点中的水位区间，否则从上次成功同步的水位到源表当前的最大值
+                watermark_window = (checkpoint or {}).get("watermark") or \
+                    await MigrationTaskService._watermark_window(source_conn, task, row_filter)
+                row_filter = combine_filters(row_filter, MigrationTaskService._watermark_filter(watermark_window))
+            
+            # 获取源表记录数：默认读取统计信息估算，精确计数需要任务或全局配置开启
+            total_rows, total_rows_exact = await MigrationTaskService._count_source_rows(source_conn, task, row_filter)
+            
+            if total_rows == 0:
+                await MigrationTaskService._update_task(
+                    task_id,
+                    status=TaskStatus.COMPLETED,
+                    total_rows=0,
+                    progress=100,
+                    completed_at=datetime.now()
                 )
-                
-                target_conn = DatabaseConnection(
-                    db_type=target_ds.db_type,
-                    host=target_ds.host,
-                    port=target_ds.port,
-                    database=target_ds.database,
-                    username=target_ds.username,
-                    password=target_ds.password
+                return
+            await MigrationTaskService._update_task(task_id, total_rows=total_rows)
+            
+            async def on_progress(processed_rows: int, estimated_total: int):
+                progress_tracker.update(task_id, processed_rows, estimated_total)
+            
+            async def on_checkpoint(checkpoint: Dict[str, Any]):
+                await MigrationTaskService._update_task(
+                    task_id,
+                    last_key=MigrationTaskService._dump_key(checkpoint.get("last_key")),
+                    checkpoint=MigrationTaskService._dump_checkpoint(checkpoint),
+                    checkpoint_at=datetime.now()
                 )
-                
-                # 测试连接
-                if not await source_conn.test_connection():
-                    task.status = TaskStatus.FAILED
-                    task.error_message = "源数据源连接失败"
-                    task.completed_at = datetime.now()
-                    await db.commit()
-                    return
-                
-                if not await target_conn.test_connection():
-                    task.status = TaskStatus.FAILED
-                    task.error_message = "目标数据源连接失败"
-                    task.completed_at = datetime.now()
-                    await db.commit()
-                    return
-                
-                # 获取源表记录数
-                total_rows = await source_conn.get_table_count(task.source_table, task.filter_condition)
-                task.total_rows = total_rows
-                await db.commit()
-                
-                if total_rows == 0:
-                    task.status = TaskStatus.COMPLETED
-                    task.progress = 100
-                    task.completed_at = datetime.now()
-                    await db.commit()
-                    return
-                
-                # 执行数据迁移（这里简化处理，实际应该分批处理）
-                # 这里只是更新进度，实际的数据迁移逻辑需要根据具体需求实现
-                task.processed_rows = total_rows
-                task.progress = 100
-                task.status = TaskStatus.COMPLETED
-                task.completed_at = datetime.now()
-                await db.commit()
+            
+            # 分批复制数据：有检查点时从检查点继续，否则从任务记录的续传位置之后继续
+            start_key = MigrationTaskService._load_key(task.last_key) if not checkpoint else None
+            engine = MigrationEngine(
+                source=source_conn,
+                target=target_conn,
+                source_table=task.source_table,
+                target_table=task.target_table,
+                row_filter=row_filter,
+                batch_size=task.batch_size,
+                parallelism=task.parallelism,
+                total_rows=total_rows,
+                total_rows_exact=total_rows_exact,
+                start_key=start_key,
+                processed_rows=checkpoint["rows_committed"] if checkpoint else (task.processed_rows if start_key is not None else 0),
+                on_progress=on_progress,
+                cancel_event=cancel_event,
+                checkpoint=checkpoint,
+                on_checkpoint=on_checkpoint,
+                migrate_structure=bool(task.migrate_structure),
+                load_mode=MigrationTaskService._load_mode(task),
+                transform=TransformPlan.parse(task.mapping_config),
+                sync_mode=task.sync_mode or "full",
+                watermark_window=watermark_window,
+                spill_dir=task_spill_dir(task_id)
+            )
+            progress_tracker.track(task_id, total_rows, engine.processed_rows, total_rows_exact)
+            processed_rows = await engine.run()
+            
+            await MigrationTaskService._update_task(
+                task_id,
+                processed_rows=processed_rows,
+                # 复制完成后已处理行数就是实际行数，不再保留估算值
+                total_rows=max(total_rows, processed_rows) if total_rows_exact else processed_rows,
+                progress=100,
+                status=TaskStatus.COMPLETED,
+                completed_at=datetime.now(),
+                metrics=json.dumps(engine.metrics()),
+                # 所有批次都已提交，水位前移到本次同步的上界
+                **({"watermark": json.dumps(watermark_window["high"])} if watermark_window else {})
+            )
+        
+        except MigrationCancelled:
+            # rollback策略的中断请求可能恰好在这里到达，记录取消状态的写入不能被打断
+            await complete_uninterrupted(MigrationTaskService._mark_cancelled(task_id, engine))
+        
+        except asyncio.CancelledError:
+            # 按rollback策略取消时执行协程被直接中断，正在写入的批次已回滚；
+            # 超时或服务关闭引起的中断由超时回调或下次启动时记录状态，这里只保存已提交的行数和检查点以便续传
+            if cancel_event.is_set():
+                await complete_uninterrupted(MigrationTaskService._mark_cancelled(task_id, engine))
+            elif engine is not None:
+                await complete_uninterrupted(
+                    MigrationTaskService._update_task(task_id, **MigrationTaskService._final_state(engine))
+                )
+            raise
                 
         except Exception as e:
             logger.error(f"迁移任务执行失败: {str(e)}")
-            async with db.begin():
-                result = await db.execute(select(MigrationTask).where(MigrationTask.id == task_id))
-                task = result.scalar_one_or_none()
-                if task:
-                    task.status = TaskStatus.FAILED
-                    task.error_message = str(e)
-                    task.completed_at = datetime.now()
-                    await db.commit()
+            await MigrationTaskService._fail_task(task_id, str(e), **MigrationTaskService._final_state(engine))
+        
+        finally:
+            progress_tracker.finish(task_id)
+            if engine is not None:
+                # 目标表可能被新建或修改了索引，缓存的表列表和表结构不再准确
+                metadata_cache.invalidate(task.target_id, task.target_table)
+    
+    @staticmethod
+    async def _execute_verification(task_id: int):
+        """执行校验任务：两端按主键区间计算行数和校验和，结果写入 verification_result，有不一致时任务失败"""
+        verifier = None
+        cancel_event = task_scheduler.cancel_event(task_id)
+        try:
+            task, source_ds, target_ds = await MigrationTaskService._load_task(task_id)
+            if not task or task.status != TaskStatus.RUNNING:
+                return
+            if not source_ds or not target_ds:
+                await MigrationTaskService._fail_task(task_id, "源数据源或目标数据源不存在")
+                return
+            
+            source_conn = DataSourceService.connect(source_ds)
+            target_conn = DataSourceService.connect(target_ds)
+            row_filter = RowFilter.parse(task.filter_condition)
+            # 行数只用于切分区间和显示进度，估算值即可
+            total_rows = await source_conn.estimate_row_count(task.source_table)
+            if not total_rows:
+                total_rows = await source_conn.get_table_count(task.source_table, row_filter)
+            await MigrationTaskService._update_task(task_id, total_rows=total_rows)
+            
+            async def on_progress(processed_rows: int, estimated_total: int):
+                progress_tracker.update(task_id, processed_rows, estimated_total)
+            
+            verifier = ChecksumVerifier(
+                source=source_conn,
+                target=target_conn,
+                source_table=task.source_table,
+                target_table=task.target_table,
+                row_filter=row_filter,
+                parallelism=task.parallelism,
+                total_rows=total_rows,
+                on_progress=on_progress,
+                cancel_event=cancel_event
+            )
+            progress_tracker.track(task_id, total_rows, 0, False)
+            result = await verifier.run()
+            
+            values = {
+                "processed_rows": result["source_rows"],
+                "total_rows": result["source_rows"],
+                "progress": 100,
+                "completed_at": datetime.now(),
+                "verification_result": json.dumps(result, default=str),
+            }
+            if result["matched"]:
+                await MigrationTaskService._update_task(task_id, status=TaskStatus.COMPLETED, error_message=None, **values)
+            else:
+                await MigrationTaskService._update_task(
+                    task_id,
+                    status=TaskStatus.FAILED,
+                    error_message=(
+                        f"源表与目标表不一致：{len(result['mismatched_ranges'])} 个主键区间"
+                        f"{'（已截断）' if result['mismatches_truncated'] else ''}，"
+                        f"源表 {result['source_rows']} 行，目标表 {result['target_rows']} 行"
+                    ),
+                    **values
+                )
+        
+        except MigrationCancelled:
+            await complete_uninterrupted(MigrationTaskService._mark_cancelled(task_id, None))
+        
+        except asyncio.CancelledError:
+            if cancel_event.is_set():
+                await complete_uninterrupted(MigrationTaskService._mark_cancelled(task_id, None))
+            raise
+        
+        except Exception as e:
+            logger.error(f"校验任务执行失败: {str(e)}")
+            values = {"verification_result": json.dumps(verifier.result(), default=str)} if verifier else {}
+            await MigrationTaskService._fail_task(task_id, str(e), **values)
+        
+        finally:
+            progress_tracker.finish(task_id)
+    
+    @staticmethod
+    async def _count_source_rows(source_conn: DatabaseConnection, task: MigrationTask,
+                                 row_filter: Optional[RowFilter]) -> tuple:
+        """源表行数，返回 (行数, 是否精确)
+        
+        默认读取系统目录中的统计信息，不扫描表；统计信息不可用或为0（可能尚未收集）时退回 COUNT(*)。
+        """
+        exact = task.exact_count if task.exact_count is not None else settings.MIGRATION_EXACT_COUNT
+        # 增量同步只复制水位之后的少量行，整表的统计信息与之无关
+        if not exact and task.sync_mode != "incremental":
+            estimate = await source_conn.estimate_row_count(task.source_table)
+            if estimate:
+                logger.info(f"源表 {task.source_table} 按统计信息估算 {estimate} 行，复制过程中修正")
+                return estimate, False
+        return await source_conn.get_table_count(task.source_table, row_filter), True
+    
+    @staticmethod
+    async def _watermark_window(source_conn: DatabaseConnection, task: MigrationTask,
+                                row_filter: Optional[RowFilter]) -> Dict[str, Any]:
+        """本次增量同步的水位区间 (low, high]
+        
+        low 为上次成功同步的水位，为空（首次同步）时不限下界；high 为开始时源表中水位列的最大值，
+        复制过程中新写入或修改的行留给下一次同步。
+        """
+        low = json.loads(task.watermark) if task.watermark else None
+        window = {"column": task.watermark_column, "low": low, "high": None}
+        condition = combine_filters(row_filter, MigrationTaskService._watermark_filter(window))
+        _, high = await source_conn.get_key_range(task.source_table, task.watermark_column, condition)
+        window["high"] = MigrationTaskService._encode_value(high) if high is not None else low
+        logger.info(f"表 {task.source_table} 增量同步水位区间: ({low}, {window['high']}]")
+        return window
+    
+    @staticmethod
+    def _watermark_filter(window: Dict[str, Any]) -> Optional[RowFilter]:
+        """水位区间对应的过滤条件；首次同步不限下界也不限上界，水位列为NULL的行同样复制"""
+        if window["low"] is None:
+            return None
+        conditions = [{"column": window["column"], "op": ">", "value": MigrationTaskService._decode_value(window["low"])}]
+        if window["high"] is not None:
+            conditions.append({"column": window["column"], "op": "<=", "value": MigrationTaskService._decode_value(window["high"])})
+        return RowFilter({"and": conditions})
+    
+    @staticmethod
+    def _encode_value(value: Any) -> Any:
+        """水位或主键值转为可保存为JSON的形式，日期时间、小数、二进制和UUID记录类型以便原样还原后作为参数绑定"""
+        if isinstance(value, datetime):
+            return {"type": "datetime", "value": value.isoformat()}
+        if isinstance(value, date):
+            return {"type": "date", "value": value.isoformat()}
+        if isinstance(value, time):
+            return {"type": "time", "value": value.isoformat()}
+        if isinstance(value, Decimal):
+            return {"type": "decimal", "value": str(value)}
+        if isinstance(value, (bytes, bytearray)):
+            return {"type": "bytes", "value": bytes(value).hex()}
+        if isinstance(value, uuid.UUID):
+            return {"type": "uuid", "value": str(value)}
+        return value
+    
+    @staticmethod
+    def _decode_value(data: Any) -> Any:
+        if isinstance(data, dict) and "type" in data:
+            value = data["value"]
+            if data["type"] == "datetime":
+                return datetime.fromisoformat(value)
+            if data["type"] == "date":
+                return date.fromisoformat(value)
+            if data["type"] == "time":
+                return time.fromisoformat(value)
+            if data["type"] == "decimal":
+                return Decimal(value)
+            if data["type"] == "bytes":
+                return bytes.fromhex(value)
+            if data["type"] == "uuid":
+                return uuid.UUID(value)
+        return data
+    
+    @staticmethod
+    def _dump_key(value: Any) -> Optional[str]:
+        """续传位置（主键值）保存为带类型的JSON"""
+        return json.dumps(MigrationTaskService._encode_value(value)) if value is not None else None
+    
+    @staticmethod
+    def _load_key(text: Optional[str]) -> Any:
+        return MigrationTaskService._decode_value(json.loads(text)) if text else None
+    
+    @staticmethod
+    def _dump_checkpoint(checkpoint: Dict[str, Any]) -> str:
+        """检查点保存为JSON，其中的主键值（续传位置和各区间的边界、位置）按类型编码"""
+        encode = MigrationTaskService._encode_value
+        data = dict(checkpoint, last_key=encode(checkpoint.get("last_key")))
+        data["ranges"] = [
+            dict(key_range, **{name: encode(key_range.get(name)) for name in ("lower", "upper", "last_key")})
+            for key_range in checkpoint.get("ranges", [])
+        ]
+        return json.dumps(data, default=str)
+    
+    @staticmethod
+    def _load_checkpoint(text: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not text:
+            return None
+        decode = MigrationTaskService._decode_value
+        checkpoint = json.loads(text)
+        checkpoint["last_key"] = decode(checkpoint.get("last_key"))
+        checkpoint["ranges"] = [
+            dict(key_range, **{name: decode(key_range.get(name)) for name in ("lower", "upper", "last_key")})
+            for key_range in checkpoint.get("ranges", [])
+        ]
+        return checkpoint
+    
+    @staticmethod
+    def _load_mode(task: MigrationTask) -> str:
+        """目标表写入方式：任务的 load_mode 优先，其次是 mapping_config 中的 load_mode，最后是全局配置"""
+        if task.load_mode:
+            return task.load_mode
+        try:
+            mapping_config = json.loads(task.mapping_config) if task.mapping_config else {}
+        except ValueError:
+            mapping_config = {}
+        if isinstance(mapping_config, dict) and mapping_config.get("load_mode") in ("append", "deferred"):
+            return mapping_config["load_mode"]
+        return settings.MIGRATION_LOAD_MODE
+    
+    @staticmethod
+    async def _mark_cancelled(task_id: int, engine: Optional[MigrationEngine]):
+        """记录任务已取消以及停止时已提交的行数和续传位置"""
+        await MigrationTaskService._update_task(
+            task_id,
+            status=TaskStatus.CANCELLED,
+            completed_at=datetime.now(),
+            **MigrationTaskService._final_state(engine)
+        )
+        if engine is not None:
+            logger.info(f"迁移任务 {task_id} 已取消，停止时已写入 {engine.processed_rows} 行，续传位置 {engine.last_key}")
+    
+    @staticmethod
+    def _final_state(engine: Optional[MigrationEngine]) -> Dict[str, Any]:
+        """任务停止时需要保存的已提交行数、续传位置、执行统计和最终检查点"""
+        if engine is None:
+            return {}
+        values = {
+            "processed_rows": engine.processed_rows,
+            "last_key": MigrationTaskService._dump_key(engine.last_key),
+            "metrics": json.dumps(engine.metrics()),
+        }
+        # 已开始按主键复制时检查点才有意义
+        if engine.key_column and engine.ranges:
+            values["checkpoint"] = MigrationTaskService._dump_checkpoint(engine.checkpoint())
+            values["checkpoint_at"] = datetime.now()
+        return values
     
     @staticmethod
     async def get_task_progress(db: AsyncSession, task_id: int) -> Optional[Dict[str, Any]]:
@@ -187,12 +652,18 @@ class MigrationTaskService:
         if not task:
             return None
         
+        # 运行中的任务直接返回内存中的实时进度
+        live = progress_tracker.get(task.id) if task.status == TaskStatus.RUNNING else None
         return {
             "task_id": task.id,
             "status": task.status,
-            "progress": task.progress,
-            "total_rows": task.total_rows,
-            "processed_rows": task.processed_rows,
+            "progress": live.progress if live else task.progress,
+            "total_rows": live.total_rows if live else task.total_rows,
+            "total_rows_estimated": (not live.total_rows_exact) if live else None,
+            "processed_rows": live.processed_rows if live else task.processed_rows,
+            "rows_per_second": round(live.rows_per_second, 1) if live else None,
+            "queue_position": task_scheduler.queue_position(task.id),
+            "checkpoint_at": task.checkpoint_at,
             "started_at": task.started_at,
             "completed_at": task.completed_at,
             "error_message": task.error_message
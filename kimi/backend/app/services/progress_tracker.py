@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TaskProgress:
+    """单个运行中任务的实时进度"""
+    
+    def __init__(self, task_id: int, total_rows: int, processed_rows: int = 0, total_rows_exact: bool = True):
+        self.task_id = task_id
+        self.total_rows = total_rows
+        # 总行数为统计信息估算值时随复制进度修正
+        self.total_rows_exact = total_rows_exact
+        self.processed_rows = processed_rows
+        self.started_at = time.monotonic()
+        self.started_rows = processed_rows
+        self.flushed_rows = processed_rows
+        self.flushed_at = self.started_at
+    
+    @property
+    def progress(self) -> int:
+        """进度百分比"""
+        if self.total_rows <= 0:
+            return 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+    
+    @property
+    def dirty(self) -> bool:
+        return self.processed_rows != self.flushed_rows
+    
+    @property
+    def unflushed_percent(self) -> float:
+        """上次写入元数据库后新增的进度百分比"""
+        if self.total_rows <= 0:
+            return 0
+        return (self.processed_rows - self.flushed_rows) * 100 / self.total_rows
+    
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0:
+            return 0
+        return (self.processed_rows - self.started_rows) / elapsed
+
+
+class ProgressTracker:
+    """运行中任务的内存进度表
+    
+    复制循环每批只更新内存中的计数，不等待元数据库；后台刷新协程把进度写回 migration_tasks 表，
+    同一任务距上次写入超过 flush_interval 秒或进度变化达到 flush_percent 个百分点时才写入一次。
+    """
+    
+    def __init__(self, flush_interval: float, flush_percent: float):
+        self.flush_interval = flush_interval
+        self.flush_percent = flush_percent
+        self._tasks: Dict[int, TaskProgress] = {}
+        self._flush: Optional[Callable[[int, int, int, int], Awaitable[None]]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flushes = 0
+    
+    async def start(self, flush: Callable[[int, int, int, int], Awaitable[None]]):
+        """启动后台刷新协程；flush(task_id, processed_rows, total_rows, progress) 负责写入元数据库"""
+        self._flush = flush
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run_flusher(), name="progress-flusher")
+    
+    async def stop(self):
+        """停止刷新协程，并把尚未写入的进度写入一次"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush_due(force=True)
+    
+    def track(self, task_id: int, total_rows: int, processed_rows: int = 0,
+              total_rows_exact: bool = True) -> TaskProgress:
+        """开始跟踪任务进度"""
+        progress = TaskProgress(task_id, total_rows, processed_rows, total_rows_exact)
+        self._tasks[task_id] = progress
+        return progress
+    
+    def update(self, task_id: int, processed_rows: int, total_rows: Optional[int] = None):
+        """更新已处理行数（以及修正后的总行数），不做任何IO"""
+        progress = self._tasks.get(task_id)
+        if progress is None:
+            return
+        progress.processed_rows = processed_rows
+        if total_rows is not None:
+            progress.total_rows = total_rows
+        if progress.unflushed_percent >= self.flush_percent and self._wakeup is not None:
+            self._wakeup.set()
+    
+    def get(self, task_id: int) -> Optional[TaskProgress]:
+        return self._tasks.get(task_id)
+    
+    def finish(self, task_id: int):
+        """停止跟踪任务，最终状态由任务执行代码自行写入"""
+        self._tasks.pop(task_id, None)
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tracked": len(self._tasks),
+            "flushes": self._flushes,
+        }
+    
+    async def _run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_due()
+    
+    async def _flush_due(self, force: bool = False):
+        now = time.monotonic()
+        due: List[TaskProgress] = [
+            progress for progress in list(self._tasks.values())
+            if progress.dirty and (
+                force
+                or now - progress.flushed_at >= self.flush_interval
+                or progress.unflushed_percent >= self.flush_percent
+            )
+        ]
+        for progress in due:
+            processed_rows = progress.processed_rows
+            try:
+                await self._flush(progress.task_id, processed_rows, progress.total_rows, progress.progress)
+            except Exception as e:
+                logger.warning(f"写入迁移任务 {progress.task_id} 的进度失败: {str(e)}")
+                continue
+            progress.flushed_rows = processed_rows
+            progress.flushed_at = time.monotonic()
+            self._flushes += 1
+
+
+progress_tracker = ProgressTracker(
+    flush_interval=settings.MIGRATION_PROGRESS_FLUSH_INTERVAL,
+    flush_percent=settings.MIGRATION_PROGRESS_FLUSH_PERCENT
+)
\ No newline at end of file
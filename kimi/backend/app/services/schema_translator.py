@@ -0,0 +1,447 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from app.models.models import DatabaseType
+from app.services.database_service import DatabaseConnection
+from app.services.transform import TransformPlan
+
+logger = logging.getLogger(__name__)
+
+_TYPE_PATTERN = re.compile(r"^\s*([a-z_][a-z0-9_ ]*?)\s*(?:\((.*)\))?\s*((?:unsigned|zerofill|\s)*)$", re.IGNORECASE)
+_NUMBER_PATTERN = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$")
+_CURRENT_TIMESTAMP_DEFAULTS = {
+    "current_timestamp", "current_timestamp()", "now()", "getdate()", "sysdatetime()",
+    "getutcdate()", "sysutcdatetime()", "localtimestamp", "localtimestamp()", "datetime('now')",
+}
+
+
+class ColumnType:
+    """与方言无关的列类型：类别 + 长度/精度"""
+    
+    def __init__(self, kind: str, length: Optional[int] = None, precision: Optional[int] = None,
+                 scale: Optional[int] = None, unsigned: bool = False):
+        self.kind = kind
+        self.length = length  # None 表示不限长度
+        self.precision = precision
+        self.scale = scale
+        self.unsigned = unsigned
+    
+    @property
+    def is_numeric(self) -> bool:
+        return self.kind in ("bool", "tinyint", "smallint", "int", "bigint", "decimal", "float", "double")
+
+
+# 源库类型名 -> 类别，长度/精度从类型参数中读取
+_MYSQL_KINDS = {
+    "tinyint": "tinyint", "smallint": "smallint", "mediumint": "int", "int": "int", "integer": "int",
+    "bigint": "bigint", "bool": "bool", "boolean": "bool", "bit": "bit",
+    "decimal": "decimal", "numeric": "decimal", "dec": "decimal", "fixed": "decimal",
+    "float": "float", "double": "double", "double precision": "double", "real": "double",
+    "char": "char", "varchar": "varchar",
+    "tinytext": "text", "text": "text", "mediumtext": "text", "longtext": "text",
+    "binary": "binary", "varbinary": "varbinary",
+    "tinyblob": "blob", "blob": "blob", "mediumblob": "blob", "longblob": "blob",
+    "date": "date", "time": "time", "datetime": "datetime", "timestamp": "datetime",
+    "year": "smallint", "json": "json", "enum": "enum", "set": "enum",
+}
+_SQLSERVER_KINDS = {
+    "bit": "bool", "tinyint": "tinyint", "smallint": "smallint", "int": "int", "bigint": "bigint",
+    "decimal": "decimal", "numeric": "decimal", "money": "money", "smallmoney": "smallmoney",
+    "real": "float", "float": "double",
+    "char": "char", "nchar": "char", "varchar": "varchar", "nvarchar": "varchar",
+    "text": "text", "ntext": "text", "xml": "text", "sql_variant": "text",
+    "binary": "binary", "varbinary": "varbinary", "image": "blob",
+    "timestamp": "rowversion", "rowversion": "rowversion",
+    "date": "date", "time": "time", "datetime": "datetime", "datetime2": "datetime",
+    "smalldatetime": "datetime", "datetimeoffset": "datetimeoffset",
+    "uniqueidentifier": "uuid",
+}
+_SQLITE_KINDS = {
+    "tinyint": "tinyint", "smallint": "smallint", "mediumint": "int", "int2": "smallint", "int8": "bigint",
+    "bigint": "bigint", "unsigned big int": "bigint", "integer": "bigint", "int": "bigint",
+    "boolean": "bool", "bool": "bool",
+    "decimal": "decimal", "numeric": "decimal",
+    "real": "double", "double": "double", "double precision": "double", "float": "double",
+    "char": "char", "nchar": "char", "character": "char", "native character": "char",
+    "varchar": "varchar", "nvarchar": "varchar", "varying character": "varchar",
+    "text": "text", "clob": "text", "json": "json",
+    "blob": "blob", "binary": "binary", "varbinary": "varbinary",
+    "date": "date", "time": "time", "datetime": "datetime", "timestamp": "datetime",
+    "uuid": "uuid",
+}
+_SOURCE_KINDS = {
+    DatabaseType.MYSQL: _MYSQL_KINDS,
+    DatabaseType.SQLSERVER: _SQLSERVER_KINDS,
+    DatabaseType.SQLITE: _SQLITE_KINDS,
+}
+
+
+class SchemaTranslator:
+    """把源表结构（get_table_schema 的结果）翻译为目标库方言的建表语句
+    
+    同方言迁移时原样保留源列类型；跨方言时先解析为与方言无关的类型再按目标库渲染。
+    自增列（is_auto_increment）在MySQL中为 AUTO_INCREMENT、SQL Server中为 IDENTITY(1,1)，
+    SQLite中为 INTEGER 单列主键（rowid 别名）。
+    二级索引的建表语句单独生成，以便在批量导入完成后再创建。
+    """
+    
+    def __init__(self, source: DatabaseConnection, target: DatabaseConnection):
+        self.source = source
+        self.target = target
+        self.source_type = source.db_type
+        self.target_type = target.db_type
+    
+    def parse_type(self, data_type: str) -> ColumnType:
+        """解析源库类型字符串，如 int(11) unsigned、nvarchar(max)、decimal(10,2)"""
+        match = _TYPE_PATTERN.match(data_type or "")
+        if not match:
+            return ColumnType("text")
+        name = " ".join(match.group(1).lower().split())
+        args = [arg.strip() for arg in (match.group(2) or "").split(",") if arg.strip()]
+        unsigned = "unsigned" in (match.group(3) or "").lower()
+        numbers = [int(arg) for arg in args if arg.isdigit()]
+        
+        kind = _SOURCE_KINDS.get(self.source_type, {}).get(name)
+        if kind is None and self.source_type == DatabaseType.SQLITE:
+            kind = self._sqlite_affinity(name)
+        if kind is None:
+            logger.warning(f"未识别的列类型 {data_type}，按文本处理")
+            return ColumnType("text")
+        
+        if kind == "tinyint" and self.source_type == DatabaseType.MYSQL and numbers == [1]:
+            return ColumnType("bool")
+        if kind == "tinyint" and self.source_type == DatabaseType.SQLSERVER:
+            # SQL Server 的 tinyint 取值 0~255
+            return ColumnType("tinyint", unsigned=True)
+        if kind == "bit":
+            return ColumnType("bool") if not numbers or numbers[0] == 1 else ColumnType("bigint", unsigned=True)
+        if kind == "money":
+            return ColumnType("decimal", precision=19, scale=4)
+        if kind == "smallmoney":
+            return ColumnType("decimal", precision=10, scale=4)
+        if kind == "rowversion":
+            return ColumnType("binary", length=8)
+        if kind == "enum":
+            # 枚举/集合的取值列表无法跨方言表达，按字符串保存
+            return ColumnType("varchar", length=255)
+        if kind in ("char", "varchar", "binary", "varbinary"):
+            # 未写长度时 char/binary 为 1，varchar 视为不限长度；max 同样为不限长度
+            default_length = None if kind in ("varchar", "varbinary") else 1
+            return ColumnType(kind, length=numbers[0] if numbers else default_length)
+        if kind == "decimal":
+            return ColumnType(
+                "decimal",
+                precision=numbers[0] if numbers else None,
+                scale=numbers[1] if len(numbers) > 1 else (0 if numbers else None),
+                unsigned=unsigned
+            )
+        if kind in ("time", "datetime", "datetimeoffset"):
+            if numbers:
+                return ColumnType(kind, precision=numbers[0])
+            if self.source_type == DatabaseType.SQLSERVER and name == "datetime":
+                return ColumnType(kind, precision=3)
+            if self.source_type == DatabaseType.SQLSERVER and name == "smalldatetime":
+                return ColumnType(kind, precision=0)
+            return ColumnType(kind, precision=0 if self.source_type == DatabaseType.MYSQL else None)
+        return ColumnType(kind, unsigned=unsigned)
+    
+    @staticmethod
+    def _sqlite_affinity(name: str) -> str:
+        """SQLite按声明类型中的关键字决定列亲和性"""
+        if "int" in name:
+            return "bigint"
+        if "char" in name or "clob" in name or "text" in name:
+            return "text"
+        if not name or "blob" in name:
+            return "blob"
+        if "real" in name or "floa" in name or "doub" in name:
+            return "double"
+        return "decimal"
+    
+    def render_type(self, column_type: ColumnType, is_primary_key: bool = False) -> str:
+        """按目标库方言输出列类型"""
+        if self.target_type == DatabaseType.MYSQL:
+            return self._render_mysql(column_type, is_primary_key)
+        if self.target_type == DatabaseType.SQLSERVER:
+            return self._render_sqlserver(column_type, is_primary_key)
+        return self._render_sqlite(column_type)
+    
+    @staticmethod
+    def _render_mysql(t: ColumnType, is_primary_key: bool) -> str:
+        unsigned = " unsigned" if t.unsigned else ""
+        if t.kind == "bool":
+            return "tinyint(1)"
+        if t.kind in ("tinyint", "smallint", "int", "bigint"):
+            return t.kind + unsigned
+        if t.kind == "decimal":
+            if t.precision is None:
+                return "decimal(38,10)"
+            return f"decimal({min(t.precision, 65)},{min(t.scale or 0, 30)}){unsigned}"
+        if t.kind in ("float", "double"):
+            return t.kind
+        if t.kind in ("char", "varchar"):
+            if t.kind == "char" and t.length is not None and t.length <= 255:
+                return f"char({t.length})"
+            if t.length is not None and t.length <= 16383:
+                return f"varchar({t.length})"
+            # 主键不能是 TEXT 类型
+            return "varchar(255)" if is_primary_key else "longtext"
+        if t.kind == "text":
+            return "varchar(255)" if is_primary_key else "longtext"
+        if t.kind in ("binary", "varbinary"):
+            if t.kind == "binary" and t.length is not None and t.length <= 255:
+                return f"binary({t.length})"
+            if t.length is not None and t.length <= 65535:
+                return f"varbinary({t.length})"
+            return "varbinary(255)" if is_primary_key else "longblob"
+        if t.kind == "blob":
+            return "varbinary(255)" if is_primary_key else "longblob"
+        if t.kind == "date":
+            return "date"
+        if t.kind in ("time", "datetime"):
+            precision = 6 if t.precision is None else min(t.precision, 6)
+            return f"{t.kind}({precision})" if precision else t.kind
+        if t.kind == "datetimeoffset":
+            return "varchar(34)"
+        if t.kind == "json":
+            return "json"
+        if t.kind == "uuid":
+            return "char(36)"
+        return "longtext"
+    
+    @staticmethod
+    def _render_sqlserver(t: ColumnType, is_primary_key: bool) -> str:
+        if t.kind == "bool":
+            return "bit"
+        if t.kind == "tinyint":
+            return "tinyint" if t.unsigned else "smallint"
+        if t.kind == "smallint":
+            return "int" if t.unsigned else "smallint"
+        if t.kind == "int":
+            return "bigint" if t.unsigned else "int"
+        if t.kind == "bigint":
+            return "decimal(20,0)" if t.unsigned else "bigint"
+        if t.kind == "decimal":
+            if t.precision is None:
+                return "decimal(38,10)"
+            precision = min(t.precision, 38)
+            return f"decimal({precision},{min(t.scale or 0, precision)})"
+        if t.kind == "float":
+            return "real"
+        if t.kind == "double":
+            return "float"
+        if t.kind in ("char", "varchar", "text", "json"):
+            if t.kind in ("char", "varchar") and t.length is not None and t.length <= 4000:
+                return f"n{t.kind}({t.length})"
+            # 索引键最长900字节
+            return "nvarchar(450)" if is_primary_key else "nvarchar(max)"
+        if t.kind in ("binary", "varbinary", "blob"):
+            if t.kind != "blob" and t.length is not None and t.length <= 8000:
+                return f"{t.kind}({t.length})"
+            return "varbinary(900)" if is_primary_key else "varbinary(max)"
+        if t.kind == "date":
+            return "date"
+        if t.kind == "time":
+            return f"time({min(t.precision, 7)})" if t.precision is not None else "time"
+        if t.kind == "datetime":
+            return f"datetime2({min(t.precision, 7)})" if t.precision is not None else "datetime2"
+        if t.kind == "datetimeoffset":
+            return f"datetimeoffset({min(t.precision, 7)})" if t.precision is not None else "datetimeoffset"
+        if t.kind == "uuid":
+            return "uniqueidentifier"
+        return "nvarchar(max)"
+    
+    @staticmethod
+    def _render_sqlite(t: ColumnType) -> str:
+        if t.kind in ("tinyint", "smallint", "int", "bigint"):
+            # 单列 INTEGER 主键即 rowid，其余整数列同样使用 INTEGER
+            return "INTEGER"
+        if t.kind == "bool":
+            return "BOOLEAN"
+        if t.kind == "decimal":
+            return f"NUMERIC({t.precision},{t.scale or 0})" if t.precision is not None else "NUMERIC"
+        if t.kind in ("float", "double"):
+            return "REAL"
+        if t.kind in ("char", "varchar"):
+            return f"{t.kind.upper()}({t.length})" if t.length is not None else "TEXT"
+        if t.kind in ("binary", "varbinary", "blob"):
+            return "BLOB"
+        if t.kind in ("date", "time", "datetime"):
+            return t.kind.upper()
+        if t.kind == "uuid":
+            return "CHAR(36)"
+        return "TEXT"
+    
+    def translate_type(self, data_type: str, is_primary_key: bool = False) -> str:
+        """源列类型 -> 目标列类型，同方言时原样保留"""
+        if self.source_type == self.target_type and data_type:
+            return data_type
+        return self.render_type(self.parse_type(data_type), is_primary_key)
+    
+    def translate_default(self, default_value: Any, data_type: str) -> Optional[str]:
+        """把源库的默认值翻译为目标库的 DEFAULT 子句内容，无法翻译的表达式返回None"""
+        if default_value is None:
+            return None
+        text = self._strip_parentheses(str(default_value).strip())
+        lowered = text.lower()
+        
+        if lowered in ("", "null"):
+            return None
+        if lowered in _CURRENT_TIMESTAMP_DEFAULTS or lowered.startswith("current_timestamp("):
+            return "CURRENT_TIMESTAMP"
+        
+        column_type = self.parse_type(data_type)
+        if _NUMBER_PATTERN.match(text):
+            return text if column_type.is_numeric else self._quote_literal(text)
+        if re.match(r"^b'[01]+'$", lowered):
+            return str(int(text[2:-1], 2))
+        if re.match(r"^n?'.*'$", lowered, re.DOTALL):
+            value = text[text.index("'") + 1:-1].replace("''", "'")
+            return self._quote_literal(value)
+        if self.source_type == DatabaseType.MYSQL:
+            # DESCRIBE 返回的字符串默认值不带引号
+            return self._quote_literal(text)
+        logger.warning(f"默认值 {default_value} 是表达式，无法翻译到目标库，已忽略")
+        return None
+    
+    @staticmethod
+    def _strip_parentheses(text: str) -> str:
+        """去掉包住整个表达式的外层括号：SQL Server 的默认值形如 ((0))、('abc')、(getdate())"""
+        while text.startswith("(") and text.endswith(")"):
+            depth = 0
+            for position, char in enumerate(text):
+                depth += 1 if char == "(" else -1 if char == ")" else 0
+                if depth == 0 and position < len(text) - 1:
+                    # 形如 (1)+(2)，外层括号并不成对
+                    return text
+            text = text[1:-1].strip()
+        return text
+    
+    def _quote_literal(self, value: str) -> str:
+        prefix = "N" if self.target_type == DatabaseType.SQLSERVER else ""
+        return prefix + "'" + value.replace("'", "''") + "'"
+    
+    def column_definition(self, column: Dict[str, Any], auto_increment: bool = False) -> str:
+        """单列定义：名称、类型、自增属性、可空性、默认值"""
+        data_type = self.translate_type(column["data_type"], column.get("is_primary_key", False))
+        parts = [self.target.quote_identifier(column["column_name"]), data_type]
+        if auto_increment and self.target_type == DatabaseType.SQLSERVER:
+            parts.append("IDENTITY(1,1)")
+        if not column.get("is_nullable", True) or column.get("is_primary_key"):
+            parts.append("NOT NULL")
+        if auto_increment and self.target_type == DatabaseType.MYSQL:
+            parts.append("AUTO_INCREMENT")
+        if auto_increment:
+            # 自增列不能同时有默认值
+            return " ".join(parts)
+        default = self.translate_default(column.get("default_value"), column["data_type"])
+        if default is not None and self.target_type == DatabaseType.MYSQL:
+            default = self._mysql_default(column["column_name"], data_type, default)
+        if default is not None:
+            parts.append(f"DEFAULT {default}")
+        return " ".join(parts)
+    
+    @staticmethod
+    def _mysql_default(column_name: str, data_type: str, default: str) -> Optional[str]:
+        """MySQL对默认值的限制：TEXT/BLOB/JSON 列不能有默认值，CURRENT_TIMESTAMP 只能用于时间列且精度一致"""
+        lowered = data_type.lower()
+        if lowered.endswith(("text", "blob", "json")):
+            logger.warning(f"MySQL的 {data_type} 列不支持默认值，已忽略列 {column_name} 的默认值")
+            return None
+        if default == "CURRENT_TIMESTAMP":
+            if not lowered.startswith(("datetime", "timestamp")):
+                logger.warning(f"MySQL的 {data_type} 列不支持 CURRENT_TIMESTAMP 默认值，已忽略列 {column_name} 的默认值")
+                return None
+            precision = re.search(r"\((\d+)\)", lowered)
+            if precision:
+                return f"CURRENT_TIMESTAMP({precision.group(1)})"
+        return default
+    
+    def _auto_increment_column(self, schema: List[Dict[str, Any]], primary_key: List[str]) -> Optional[str]:
+        """目标表中保留自增属性的列：每个表最多一个，且必须是整数列
+        
+        MySQL要求自增列是索引的第一列，这里只在它是主键第一列时保留；
+        SQLite只有 INTEGER 单列主键会自动分配值，且该列的类型总是渲染为 INTEGER。
+        """
+        columns = [column for column in schema if column.get("is_auto_increment")]
+        if not columns:
+            return None
+        column = columns[0]
+        name = column["column_name"]
+        column_type = self.parse_type(column["data_type"])
+        integer = column_type.kind in ("tinyint", "smallint", "int", "bigint")
+        if self.target_type == DatabaseType.SQLSERVER:
+            # 无符号 bigint 渲染为 decimal(20,0)，同样可以作为标识列
+            integer = integer or (column_type.kind == "decimal" and column_type.scale == 0)
+            supported = integer
+        elif self.target_type == DatabaseType.MYSQL:
+            supported = integer and primary_key[:1] == [name]
+        else:
+            supported = integer and primary_key == [name]
+        if not supported:
+            logger.warning(f"列 {name}（{column['data_type']}）在目标库中无法保持自增属性，按普通列建立")
+            return None
+        return name
+    
+    def create_table_sql(self, table_name: str, schema: List[Dict[str, Any]]) -> str:
+        """建表语句：列定义和主键，不含二级索引"""
+        primary_key = [column["column_name"] for column in schema if column.get("is_primary_key")]
+        auto_increment = self._auto_increment_column(schema, primary_key)
+        lines = [
+            self.column_definition(column, auto_increment is not None and column["column_name"] == auto_increment)
+            for column in schema
+        ]
+        if primary_key:
+            lines.append(f"PRIMARY KEY ({', '.join(self.target.quote_identifier(name) for name in primary_key)})")
+        sql = f"CREATE TABLE {self.target.quote_identifier(table_name)} (\n    " + ",\n    ".join(lines) + "\n)"
+        if self.target_type == DatabaseType.MYSQL:
+            sql += " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        return sql
+    
+    def create_index_sql(self, table_name: str, index: Dict[str, Any]) -> str:
+        """二级索引建立语句"""
+        name = index["index_name"]
+        if name.lower().startswith("sqlite_autoindex"):
+            # SQLite为UNIQUE约束自动生成的索引名不能用于建立索引
+            name = f"ux_{table_name}_{'_'.join(index['columns'])}"
+        elif self.target_type == DatabaseType.SQLITE:
+            # SQLite的索引名在整个库内唯一
+            name = name if table_name in name else f"{table_name}_{name}"
+        unique = "UNIQUE " if index.get("is_unique") else ""
+        columns = ", ".join(self.target.quote_identifier(column) for column in index["columns"])
+        return (
+            f"CREATE {unique}INDEX {self.target.quote_identifier(name)} "
+            f"ON {self.target.quote_identifier(table_name)} ({columns})"
+        )
+    
+    async def ensure_target_table(self, source_table: str, target_table: str,
+                                  transform: Optional[TransformPlan] = None) -> List[str]:
+        """目标表不存在时按源表结构建表，返回需要在数据导入后执行的建索引语句
+        
+        有列转换计划时按转换后的列建表，包含被删除或被表达式替换的列的索引不再建立。
+        目标表已存在时不做任何改动，返回空列表。
+        """
+        if await self.target.table_exists(target_table):
+            return []
+        
+        schema = await self.source.get_table_schema(source_table)
+        if not schema:
+            raise ValueError(f"无法读取源表 {source_table} 的结构")
+        if transform is not None:
+            schema = transform.map_schema(schema, self.source_type)
+        create_sql = self.create_table_sql(target_table, schema)
+        logger.info(f"创建目标表 {target_table}:\n{create_sql}")
+        await self.target.execute(create_sql)
+        
+        indexes = await self.source.get_table_indexes(source_table)
+        statements = []
+        for index in indexes:
+            if transform is not None:
+                columns = transform.map_index_columns(index["columns"])
+                if columns is None:
+                    logger.info(f"索引 {index['index_name']} 包含被删除或替换的列，不在目标表上建立")
+                    continue
+                index = dict(index, columns=columns)
+            statements.append(self.create_index_sql(target_table, index))
+        return statements
\ No newline at end of file
@@ -0,0 +1,423 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import uuid
+import zlib
+from array import array
+from collections import deque
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.columnar import Column, ColumnBatch
+
+logger = logging.getLogger(__name__)
+
+# 段文件压缩级别：落盘发生在写入跟不上读取时，压缩速度比压缩率重要
+_COMPRESS_LEVEL = 1
+_SUFFIX = ".seg"
+# 段文件中数值列缓冲区允许的 array 类型码
+_TYPECODES = {"int": "q", "float": "d", "bool": "b"}
+
+
+def _spill_root() -> str:
+    return settings.MIGRATION_SPILL_DIR or os.path.join(tempfile.gettempdir(), "migration_spill")
+
+
+def task_spill_dir(task_id: int) -> str:
+    """任务的段文件目录"""
+    return os.path.join(_spill_root(), f"task_{task_id}")
+
+
+def _private_directory(path: str, create: bool = True) -> bool:
+    """确认目录只有当前用户可以访问，不存在时以 0700 权限创建，返回目录是否存在
+    
+    默认目录位于所有用户都可写的临时目录下，其他用户可能预先建立同名目录并放入段文件，
+    目录已存在但属主不是当前用户、权限对其他用户开放或是符号链接时拒绝使用。
+    """
+    try:
+        if create:
+            os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    if os.name == "nt":
+        return True
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(
+            f"段文件目录 {path} 的属主或权限不安全（要求属于当前用户且权限为 0700），拒绝使用"
+        )
+    return True
+
+
+def _encode_value(value: Any) -> Any:
+    """json 不能直接表示的值编码为 {"$": 类型, "v": 值}"""
+    if isinstance(value, Decimal):
+        return {"$": "decimal", "v": str(value)}
+    if isinstance(value, datetime):
+        return {"$": "datetime", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {"$": "date", "v": value.isoformat()}
+    if isinstance(value, time):
+        return {"$": "time", "v": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"$": "timedelta", "v": [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$": "bytes", "v": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, uuid.UUID):
+        return {"$": "uuid", "v": str(value)}
+    raise TypeError(f"段文件不支持类型 {type(value).__name__} 的值")
+
+
+_DECODERS = {
+    "decimal": Decimal,
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": time.fromisoformat,
+    "timedelta": lambda parts: timedelta(days=parts[0], seconds=parts[1], microseconds=parts[2]),
+    "bytes": base64.b64decode,
+    "uuid": uuid.UUID,
+}
+
+
+def _decode_value(node: Dict[str, Any]) -> Any:
+    if node.keys() == {"$", "v"} and node["$"] in _DECODERS:
+        return _DECODERS[node["$"]](node["v"])
+    return node
+
+
+def _dumps(data: Any) -> bytes:
+    return json.dumps(data, default=_encode_value, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    return json.loads(data, object_hook=_decode_value)
+
+
+def _encode_batch(rows: Any) -> Dict[str, Any]:
+    """批数据转为可以用 json 表示的结构：列批的数值列保存缓冲区的原始字节，行列表逐行保存"""
+    if not isinstance(rows, ColumnBatch):
+        return {"rows": [list(row) for row in rows]}
+    columns = []
+    for column in rows.columns:
+        if column.kind == "object":
+            columns.append({"kind": "object", "values": list(column.values)})
+            continue
+        columns.append({
+            "kind": column.kind,
+            "values": base64.b64encode(column.values.tobytes()).decode("ascii"),
+            "nulls": base64.b64encode(bytes(column.nulls)).decode("ascii") if column.nulls is not None else None,
+        })
+    return {"names": rows.names, "length": rows.length, "columns": columns}
+
+
+def _decode_batch(data: Dict[str, Any]) -> Any:
+    if "rows" in data:
+        return [tuple(row) for row in data["rows"]]
+    columns = []
+    for column in data["columns"]:
+        kind = column["kind"]
+        if kind == "object":
+            columns.append(Column(column["values"]))
+            continue
+        values = array(_TYPECODES[kind])
+        values.frombytes(base64.b64decode(column["values"]))
+        nulls = bytearray(base64.b64decode(column["nulls"])) if column["nulls"] is not None else None
+        columns.append(Column(values, nulls, kind))
+    return ColumnBatch(data["names"], columns, data["length"])
+
+
+class Segment:
+    """一个落盘的批次：区间序号、批次之前的读取位置（after）、批末主键和行数"""
+    
+    __slots__ = ("path", "range_index", "after", "last_key", "rows", "size")
+    
+    def __init__(self, path: str, range_index: Optional[int], after: Any, last_key: Any, rows: int, size: int):
+        self.path = path
+        self.range_index = range_index
+        self.after = after
+        self.last_key = last_key
+        self.rows = rows
+        self.size = size
+    
+    def meta(self) -> Dict[str, Any]:
+        return {"range": self.range_index, "after": self.after, "last_key": self.last_key, "rows": self.rows}
+
+
+class SpillStore:
+    """一个任务的段文件目录
+    
+    每个段文件第一行是批次的位置信息（json），其后是 zlib 压缩的批数据（json，数值列为缓冲区的原始字节），
+    读取时不会执行文件中的任何代码；先写临时文件再改名，目录中只会出现完整的段文件。
+    段文件目录及其上级的段文件根目录只允许当前用户访问。段文件在对应批次写入目标表并提交后删除，
+    写入失败时留在目录中作为恢复日志，续传时从检查点位置开始按位置首尾相接重放。
+    所有段文件占用的磁盘不超过 max_bytes（最多超出正在写入的一个段）。
+    """
+    
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else settings.MIGRATION_SPILL_MAX_MB * 1024 * 1024
+        self.used = 0
+        self.peak = 0
+        self.segments_written = 0
+        self.bytes_written = 0
+        self.rows_written = 0
+        self.segments_replayed = 0
+        self.rows_replayed = 0
+        self.full_waits = 0
+        self._sequence = 0
+    
+    @property
+    def has_space(self) -> bool:
+        return self.used < self.max_bytes
+    
+    def clear(self):
+        """删除目录中的所有段文件（不续传的新一次执行）"""
+        self.remove_directory(self.directory)
+        self.used = 0
+    
+    def cleanup(self):
+        """任务完成后删除段文件目录"""
+        self.remove_directory(self.directory)
+        self.used = 0
+    
+    @staticmethod
+    def remove_directory(directory: str):
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    async def write(self, item: tuple, range_index: Optional[int], after: Any) -> Segment:
+        """把一批数据写入新的段文件"""
+        self._sequence += 1
+        prefix = "s" if range_index is None else f"r{range_index:04d}"
+        path = os.path.join(self.directory, f"{prefix}_{self._sequence:08d}{_SUFFIX}")
+        segment = Segment(path, range_index, after, item[2], len(item[1]), 0)
+        segment.size = await asyncio.to_thread(self._write_file, path, segment.meta(), item)
+        self.used += segment.size
+        self.peak = max(self.peak, self.used)
+        self.segments_written += 1
+        self.bytes_written += segment.size
+        self.rows_written += segment.rows
+        return segment
+    
+    def _ensure_directory(self, create: bool) -> bool:
+        """检查（并按需创建）段文件根目录和任务目录，返回任务目录是否存在"""
+        root = os.path.dirname(os.path.abspath(self.directory))
+        if create:
+            os.makedirs(os.path.dirname(root), exist_ok=True)
+        if not _private_directory(root, create):
+            return False
+        return _private_directory(self.directory, create)
+    
+    def _write_file(self, path: str, meta: Dict[str, Any], item: tuple) -> int:
+        self._ensure_directory(create=True)
+        columns, rows, last_key, read_elapsed = item
+        payload = zlib.compress(_dumps({
+            "columns": columns, "batch": _encode_batch(rows), "last_key": last_key, "read_elapsed": read_elapsed,
+        }), _COMPRESS_LEVEL)
+        temporary = path + ".tmp"
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(_dumps(meta) + b"\n")
+            file.write(payload)
+        os.replace(temporary, path)
+        return os.path.getsize(path)
+    
+    async def read(self, segment: Segment) -> tuple:
+        return await asyncio.to_thread(self._read_file, segment.path)
+    
+    @staticmethod
+    def _read_file(path: str) -> tuple:
+        with open(path, "rb") as file:
+            file.readline()
+            data = _loads(zlib.decompress(file.read()))
+        return data["columns"], _decode_batch(data["batch"]), data["last_key"], data["read_elapsed"]
+    
+    def remove(self, segment: Segment):
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
+        self.used = max(0, self.used - segment.size)
+    
+    def recover(self, range_index: int, position: Any) -> List[Segment]:
+        """区间上次执行留下的段文件中，从 position 开始首尾相接的部分，其余段文件删除"""
+        segments = self._scan(f"r{range_index:04d}_")
+        by_after = {}
+        for segment in segments:
+            by_after.setdefault(repr(segment.after), segment)
+        chain: List[Segment] = []
+        segment = by_after.get(repr(position))
+        while segment is not None and segment not in chain:
+            chain.append(segment)
+            segment = by_after.get(repr(segment.last_key))
+        for segment in segments:
+            if segment not in chain:
+                self.remove(segment)
+        if chain:
+            logger.info(
+                f"区间 {range_index} 从段文件恢复 {len(chain)} 批 {sum(segment.rows for segment in chain)} 行，"
+                f"之后从主键 {chain[-1].last_key} 继续读取源表"
+            )
+        return chain
+    
+    def _scan(self, prefix: str) -> List[Segment]:
+        """读取目录中指定前缀的段文件的位置信息，无法读取的段文件删除"""
+        if not self._ensure_directory(create=False):
+            return []
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            if not name.startswith(prefix) or not name.endswith(_SUFFIX):
+                continue
+            try:
+                with open(path, "rb") as file:
+                    meta = _loads(file.readline())
+                size = os.path.getsize(path)
+                self._sequence = max(self._sequence, int(name[len(prefix):-len(_SUFFIX)]))
+            except Exception as e:
+                logger.warning(f"段文件 {path} 无法读取，已删除: {str(e)}")
+                os.remove(path)
+                continue
+            segments.append(Segment(path, meta["range"], meta["after"], meta["last_key"], meta["rows"], size))
+            self.used += size
+        self.peak = max(self.peak, self.used)
+        return segments
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments_written": self.segments_written,
+            "rows_written": self.rows_written,
+            "bytes_written": self.bytes_written,
+            "peak_bytes": self.peak,
+            "max_bytes": self.max_bytes,
+            "segments_replayed": self.segments_replayed,
+            "rows_replayed": self.rows_replayed,
+            "full_waits": self.full_waits,
+        }
+
+
+class SpillQueue:
+    """读写流水线的队列：内存中最多 maxsize 批，已满时后续批次写入段文件而不是让读取协程等待
+    
+    队列元素为 (列名, 批数据, 批末主键, 读取耗时) 元组，结束标记等其他对象始终留在内存中；
+    内存和磁盘中的批次按放入顺序取出。没有 store 或磁盘用量达到上限时与有界队列相同，读取协程等待写入。
+    get 取出的批次写入并提交后调用 task_done 删除其段文件。
+    """
+    
+    def __init__(self, maxsize: int, store: Optional[SpillStore] = None,
+                 range_index: Optional[int] = None, position: Any = None):
+        self.maxsize = maxsize
+        self.store = store
+        self.range_index = range_index
+        # 最后放入的批次的批末主键，即下一批之前的读取位置
+        self.position = position
+        # (元素, 段文件, 批次之前的读取位置)：段文件为 None 的元素在内存中
+        self._entries: Deque[tuple] = deque()
+        self._in_memory = 0
+        self._current: Optional[tuple] = None
+        self._changed = asyncio.Condition()
+    
+    def preload(self, segments: List[Segment]):
+        """放入上次执行留下的段文件，排在新读取的批次之前"""
+        for segment in segments:
+            self._entries.append((None, segment, segment.after))
+            self.store.segments_replayed += 1
+            self.store.rows_replayed += segment.rows
+        if segments:
+            self.position = segments[-1].last_key
+    
+    async def put(self, item: Any):
+        if not isinstance(item, tuple):
+            async with self._changed:
+                self._entries.append((item, None, None))
+                self._changed.notify_all()
+            return
+        
+        after, self.position = self.position, item[2]
+        async with self._changed:
+            if self.store is not None and self._in_memory >= self.maxsize and not self.store.has_space:
+                self.store.full_waits += 1
+            while self._in_memory >= self.maxsize and not (self.store is not None and self.store.has_space):
+                await self._changed.wait()
+            if self._in_memory < self.maxsize:
+                self._entries.append((item, None, after))
+                self._in_memory += 1
+                self._changed.notify_all()
+                return
+        # 同一队列只有一个读取协程放入，段文件写完后再入队不会打乱顺序
+        try:
+            segment = await self.store.write(item, self.range_index, after)
+        except TypeError as e:
+            # 批中有段文件无法表示的值，这一批留在内存中，等待写入协程取走前面的批次
+            logger.warning(f"区间 {self.range_index} 的批次无法写入段文件，留在内存中: {str(e)}")
+            async with self._changed:
+                while self._in_memory >= self.maxsize:
+                    await self._changed.wait()
+                self._entries.append((item, None, after))
+                self._in_memory += 1
+                self._changed.notify_all()
+            return
+        async with self._changed:
+            self._entries.append((None, segment, after))
+            self._changed.notify_all()
+    
+    async def get(self) -> Any:
+        async with self._changed:
+            while not self._entries:
+                await self._changed.wait()
+            entry = self._entries.popleft()
+            if entry[1] is None and isinstance(entry[0], tuple):
+                self._in_memory -= 1
+            self._changed.notify_all()
+        item, segment, after = entry
+        if segment is not None:
+            item = await self.store.read(segment)
+        self._current = (item, segment, after)
+        return item
+    
+    def task_done(self):
+        """最近取出的批次已提交，删除其段文件"""
+        if self._current is None:
+            return
+        segment = self._current[1]
+        self._current = None
+        if segment is not None:
+            self.store.remove(segment)
+    
+    async def persist(self):
+        """写入失败后把尚未提交的内存批次也写入段文件，与已落盘的批次一起构成从提交位置开始的恢复日志
+        
+        磁盘用量达到上限后不再写入，恢复日志在此处中断，续传时其后的数据重新从源表读取。
+        """
+        if self.store is None or self.range_index is None:
+            return
+        entries = ([self._current] if self._current is not None else []) + list(self._entries)
+        self._current = None
+        self._entries.clear()
+        self._in_memory = 0
+        persisted = 0
+        for item, segment, after in entries:
+            if segment is not None or not isinstance(item, tuple):
+                continue
+            if not self.store.has_space:
+                break
+            try:
+                await self.store.write(item, self.range_index, after)
+            except TypeError:
+                break
+            persisted += 1
+        if persisted:
+            logger.info(f"区间 {self.range_index} 复制中断，{persisted} 批未提交的数据已写入段文件")
\ No newline at end of file
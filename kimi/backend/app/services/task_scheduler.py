@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TaskScheduler:
+    """进程内迁移任务调度器
+    
+    待执行任务放在优先级队列中（priority 越大越先执行，相同优先级先进先出），
+    由固定数量的工作协程取出执行，同时运行的任务数不超过 max_concurrent，
+    单个任务运行超过 timeout 秒会被取消。
+    正在执行的任务在注册表中保留句柄和取消信号，用于取消任务。
+    """
+    
+    def __init__(self, max_concurrent: int, timeout: float):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}
+        self._counter = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancel_events: Dict[int, asyncio.Event] = {}
+        self._runner: Optional[Callable[[int], Awaitable[None]]] = None
+        self._on_timeout: Optional[Callable[[int], Awaitable[None]]] = None
+        self._on_finished: Optional[Callable[[int], Awaitable[None]]] = None
+    
+    async def start(self, runner: Callable[[int], Awaitable[None]],
+                    on_timeout: Optional[Callable[[int], Awaitable[None]]] = None,
+                    on_finished: Optional[Callable[[int], Awaitable[None]]] = None):
+        """启动工作协程；runner 负责执行单个任务，on_timeout 在任务超时被取消后调用，
+        on_finished 在任务结束（完成、失败、取消或超时）后调用
+        """
+        self._runner = runner
+        self._on_timeout = on_timeout
+        self._on_finished = on_finished
+        self._cond = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker(index), name=f"migration-worker-{index}")
+            for index in range(self.max_concurrent)
+        ]
+        logger.info(f"迁移任务调度器已启动，最大并发任务数 {self.max_concurrent}")
+    
+    async def stop(self):
+        """停止调度器，取消正在执行的任务"""
+        for handle in list(self._running.values()):
+            handle.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, *self._running.values(), return_exceptions=True)
+        self._workers = []
+        self._running.clear()
+        self._cond = None
+    
+    async def submit(self, task_id: int, priority: int = 0) -> bool:
+        """把任务加入等待队列，任务已在队列中或正在执行时返回False
+        
+        调度器尚未启动（或已停止）时任务留在队列中，由 start 启动的工作协程取出执行。
+        """
+        if task_id in self._entries or task_id in self._running:
+            return False
+        entry = [-priority, next(self._counter), task_id]
+        self._entries[task_id] = entry
+        heapq.heappush(self._heap, entry)
+        if self._cond is not None:
+            async with self._cond:
+                self._cond.notify()
+        return True
+    
+    def remove(self, task_id: int) -> bool:
+        """从等待队列中移除任务（惰性删除）"""
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        entry[-1] = None
+        return True
+    
+    def is_queued(self, task_id: int) -> bool:
+        return task_id in self._entries
+    
+    def is_running(self, task_id: int) -> bool:
+        return task_id in self._running
+    
+    def cancel_event(self, task_id: int) -> asyncio.Event:
+        """正在执行的任务的取消信号，执行代码在批次之间检查"""
+        return self._cancel_events.setdefault(task_id, asyncio.Event())
+    
+    def cancel(self, task_id: int, policy: str = "commit") -> bool:
+        """请求取消正在执行的任务
+        
+        commit：设置取消信号，当前批次写完并提交后停止；
+        rollback：同时中断执行协程，正在写入的批次回滚。
+        任务不在本进程中执行时返回False。
+        """
+        handle = self._running.get(task_id)
+        if handle is None:
+            return False
+        self.cancel_event(task_id).set()
+        if policy == "rollback":
+            handle.cancel()
+        return True
+    
+    def queue_position(self, task_id: int) -> Optional[int]:
+        """任务在等待队列中的位置（从1开始），不在队列中时返回None"""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return None
+        return sum(1 for other in self._entries.values() if other[:2] < entry[:2]) + 1
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queued": len(self._entries),
+            "running": len(self._running),
+        }
+    
+    async def _next_task_id(self) -> int:
+        async with self._cond:
+            while True:
+                while self._heap:
+                    task_id = heapq.heappop(self._heap)[-1]
+                    if task_id is not None:
+                        del self._entries[task_id]
+                        return task_id
+                await self._cond.wait()
+    
+    async def _worker(self, index: int):
+        while True:
+            task_id = await self._next_task_id()
+            self._cancel_events[task_id] = asyncio.Event()
+            handle = asyncio.create_task(self._run(task_id), name=f"migration-task-{task_id}")
+            self._running[task_id] = handle
+            try:
+                # asyncio.wait 不会因为任务被取消而抛出异常，工作协程得以继续取下一个任务
+                await asyncio.wait([handle])
+            finally:
+                self._running.pop(task_id, None)
+                self._cancel_events.pop(task_id, None)
+            if self._on_finished:
+                try:
+                    await self._on_finished(task_id)
+                except Exception as e:
+                    logger.error(f"迁移任务 {task_id} 结束后的回调执行异常: {str(e)}")
+    
+    async def _run(self, task_id: int):
+        try:
+            await asyncio.wait_for(self._runner(task_id), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"迁移任务 {task_id} 执行超过 {self.timeout} 秒，已被终止")
+            if self._on_timeout:
+                await self._on_timeout(task_id)
+        except Exception as e:
+            logger.error(f"迁移任务 {task_id} 执行异常: {str(e)}")
+
+
+task_scheduler = TaskScheduler(
+    max_concurrent=settings.MAX_CONCURRENT_TASKS,
+    timeout=settings.TASK_TIMEOUT
+)
\ No newline at end of file
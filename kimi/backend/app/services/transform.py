@@ -0,0 +1,435 @@
+import ast
+import json
+import logging
+import operator
+from datetime import date, datetime
+from decimal import Decimal
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.models.models import DatabaseType
+from app.services.columnar import ColumnBatch
+
+logger = logging.getLogger(__name__)
+
+# 一批数据按列存放：列名 -> 该列所有行的值
+Columns = Dict[str, List[Any]]
+
+
+def _apply(func: Callable, *columns: List[Any]) -> List[Any]:
+    """按列逐元素调用 func，任一输入为 NULL 时结果为 NULL
+    
+    没有 NULL 的列直接交给 map 在C层循环，只有含 NULL 的批次才逐行判断。
+    """
+    if any(None in column for column in columns):
+        return [None if None in values else func(*values) for values in zip(*columns)]
+    return list(map(func, *columns))
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "f", "no", "n")
+    return bool(value)
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _to_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def _to_str(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8")
+    return str(value)
+
+
+def _to_decimal(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _to_json(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+# 类型转换：名称 -> (单值转换函数, 按源库方言写出的列类型)
+_CASTS: Dict[str, Tuple[Callable[[Any], Any], Dict[Optional[DatabaseType], str]]] = {
+    "int": (int, {None: "bigint"}),
+    "float": (float, {None: "double", DatabaseType.SQLSERVER: "float"}),
+    "decimal": (_to_decimal, {None: "decimal(38,10)"}),
+    "str": (_to_str, {None: "text"}),
+    "bool": (_to_bool, {None: "boolean", DatabaseType.SQLSERVER: "bit"}),
+    "date": (_to_date, {None: "date"}),
+    "datetime": (_to_datetime, {None: "datetime"}),
+    "json": (_to_json, {None: "text"}),
+}
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+
+class _Constant:
+    """表达式中的常量，参与运算时才展开为整列"""
+    
+    def __init__(self, value: Any):
+        self.value = value
+
+
+def _column_of(value: Union[List[Any], _Constant], rows: int) -> List[Any]:
+    return [value.value] * rows if isinstance(value, _Constant) else value
+
+
+def _coalesce(rows: int, *values) -> List[Any]:
+    result = list(_column_of(values[0], rows))
+    for value in values[1:]:
+        if None not in result:
+            break
+        result = [current if current is not None else other
+                  for current, other in zip(result, _column_of(value, rows))]
+    return result
+
+
+def _concat(rows: int, *values) -> List[str]:
+    # NULL 按空字符串拼接
+    parts = [
+        ["" if item is None else _to_str(item) for item in _column_of(value, rows)]
+        for value in values
+    ]
+    return reduce(lambda left, right: list(map(operator.add, left, right)), parts)
+
+
+def _substr(text: str, start: int, length: Optional[int] = None) -> str:
+    # 与SQL一致，起始位置从1开始
+    begin = max(start - 1, 0)
+    return text[begin:] if length is None else text[begin:begin + length]
+
+
+# 表达式可调用的函数：名称 -> (函数, 最少参数, 最多参数)，最多参数为 None 表示不限个数
+_FUNCTIONS: Dict[str, Tuple[Callable, int, Optional[int]]] = {
+    "upper": (str.upper, 1, 1),
+    "lower": (str.lower, 1, 1),
+    "trim": (str.strip, 1, 1),
+    "length": (len, 1, 1),
+    "replace": (str.replace, 3, 3),
+    "substr": (_substr, 2, 3),
+    "abs": (abs, 1, 1),
+    "round": (round, 1, 2),
+    "int": (int, 1, 1),
+    "float": (float, 1, 1),
+    "decimal": (_to_decimal, 1, 1),
+    "str": (_to_str, 1, 1),
+    "coalesce": (_coalesce, 1, None),
+    "concat": (_concat, 1, None),
+}
+# 自行处理 NULL 的函数
+_NULL_AWARE_FUNCTIONS = {"coalesce", "concat"}
+# 函数结果的类型，用于为表达式列建表
+_FUNCTION_TYPES = {
+    "upper": "str", "lower": "str", "trim": "str", "replace": "str", "substr": "str", "concat": "str",
+    "str": "str", "length": "int", "int": "int", "float": "float", "decimal": "decimal",
+}
+
+
+class _Expression:
+    """编译后的列表达式：对整批数据按列计算，结果为一列"""
+    
+    def __init__(self, target: str, source: str, allowed_columns: Sequence[str]):
+        self.target = target
+        self.source = source
+        self.columns: List[str] = []
+        self._allowed = set(allowed_columns)
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"列 {target} 的表达式 {source!r} 语法错误: {e.msg}")
+        self._evaluate = self._compile(tree.body)
+    
+    def __call__(self, data: Columns, rows: int) -> List[Any]:
+        try:
+            return _column_of(self._evaluate(data, rows), rows)
+        except (ArithmeticError, TypeError, ValueError) as e:
+            raise ValueError(f"列 {self.target} 的表达式 {self.source!r} 计算失败: {str(e)}")
+    
+    def _compile(self, node: ast.AST) -> Callable[[Columns, int], Any]:
+        if isinstance(node, ast.Constant) and (node.value is None or isinstance(node.value, (str, int, float))):
+            constant = _Constant(node.value)
+            return lambda data, rows: constant
+        
+        if isinstance(node, ast.Name):
+            if node.id not in self._allowed:
+                raise ValueError(f"列 {self.target} 的表达式引用了不存在的源列 {node.id}")
+            if node.id not in self.columns:
+                self.columns.append(node.id)
+            name = node.id
+            return lambda data, rows: data[name]
+        
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._compile(node.operand)
+            func = operator.neg if isinstance(node.op, ast.USub) else operator.pos
+            return lambda data, rows: _apply(func, _column_of(operand(data, rows), rows))
+        
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            func = _BINARY_OPERATORS[type(node.op)]
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            return lambda data, rows: _apply(
+                func, _column_of(left(data, rows), rows), _column_of(right(data, rows), rows)
+            )
+        
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name not in _FUNCTIONS:
+                raise ValueError(f"列 {self.target} 的表达式使用了不支持的函数 {name}")
+            func, min_args, max_args = _FUNCTIONS[name]
+            if len(node.args) < min_args or (max_args is not None and len(node.args) > max_args):
+                raise ValueError(f"列 {self.target} 的表达式中函数 {name} 的参数个数不正确")
+            args = [self._compile(arg) for arg in node.args]
+            if name in _NULL_AWARE_FUNCTIONS:
+                return lambda data, rows: func(rows, *(arg(data, rows) for arg in args))
+            return lambda data, rows: _apply(func, *(_column_of(arg(data, rows), rows) for arg in args))
+        
+        raise ValueError(f"列 {self.target} 的表达式 {self.source!r} 包含不支持的写法: {ast.dump(node)[:60]}")
+
+
+class _BoundPlan:
+    """按源列顺序确定了各输出列来源的转换计划"""
+    
+    def __init__(self, plan: "TransformPlan", source_columns: Sequence[str]):
+        self.source_columns = list(source_columns)
+        missing = [name for name in plan.referenced_columns() if name not in self.source_columns]
+        if missing:
+            raise ValueError(f"mapping_config 引用的源列不存在: {', '.join(missing)}")
+        expressions = {
+            target: _Expression(target, source, self.source_columns)
+            for target, source in plan.expressions.items()
+        }
+        # 输出列：(输出列名, 源列位置 / 常量 / 表达式)
+        self.outputs: List[Tuple[str, Any]] = []
+        for index, name in enumerate(self.source_columns):
+            if name in plan.drop:
+                continue
+            target = plan.rename.get(name, name)
+            self.outputs.append((target, expressions.pop(target, index)))
+        for target, value in plan.constants.items():
+            self.outputs.append((target, _Constant(value)))
+        for target, expression in expressions.items():
+            self.outputs.append((target, expression))
+        self.casts = [_CASTS[plan.casts[target]][0] if target in plan.casts else None for target, _ in self.outputs]
+        self.columns = [target for target, _ in self.outputs]
+    
+    def apply(self, rows: List[Sequence]) -> List[tuple]:
+        count = len(rows)
+        # 行 -> 列：zip 在C层完成转置
+        source = list(map(list, zip(*rows))) if count else [[] for _ in self.source_columns]
+        # 列 -> 行
+        return list(zip(*self.apply_columns(source, count)))
+    
+    def apply_columns(self, source: List[List[Any]], count: int) -> List[List[Any]]:
+        """按列转换：source 为各源列的值列表，返回各输出列的值列表"""
+        data: Columns = dict(zip(self.source_columns, source))
+        
+        output = []
+        for (target, origin), cast in zip(self.outputs, self.casts):
+            if isinstance(origin, int):
+                column = source[origin]
+            elif isinstance(origin, _Constant):
+                column = [origin.value] * count
+            else:
+                column = origin(data, count)
+            if cast is not None:
+                try:
+                    column = _apply(cast, column)
+                except (ArithmeticError, TypeError, ValueError) as e:
+                    raise ValueError(f"列 {target} 的类型转换失败: {str(e)}")
+            output.append(column)
+        return output
+
+
+class TransformPlan:
+    """由 mapping_config 编译得到的列映射和转换计划
+    
+    mapping_config 为JSON对象，支持的键：
+    - rename: {"源列": "目标列"} 重命名
+    - drop: ["源列", ...] 不写入目标表
+    - constants: {"目标列": 值} 增加常量列
+    - expressions: {"目标列": "表达式"} 由源列计算，目标列与已有输出列同名时替换该列；
+      表达式支持 + - * / // %、常量和函数 upper lower trim length replace substr abs round
+      int float decimal str coalesce concat，任一参数为 NULL 时结果为 NULL（coalesce、concat 除外）
+    - casts: {"目标列": "int|float|decimal|str|bool|date|datetime|json"} 写入前转换类型
+    
+    计划在任务开始时解析一次，按第一批数据的列顺序绑定后对每批数据按列整体计算，不逐行构造字典。
+    """
+    
+    _KEYS = {"rename", "drop", "constants", "expressions", "casts"}
+    
+    def __init__(self, rename: Optional[Dict[str, str]] = None, drop: Optional[Sequence[str]] = None,
+                 constants: Optional[Dict[str, Any]] = None, expressions: Optional[Dict[str, str]] = None,
+                 casts: Optional[Dict[str, str]] = None):
+        self.rename = dict(rename or {})
+        self.drop = set(drop or [])
+        self.constants = dict(constants or {})
+        self.expressions = dict(expressions or {})
+        self.casts = dict(casts or {})
+        unknown = [name for name in self.casts.values() if name not in _CASTS]
+        if unknown:
+            raise ValueError(f"mapping_config 中不支持的类型转换: {', '.join(unknown)}，可用: {', '.join(_CASTS)}")
+        for target, source in self.expressions.items():
+            if not isinstance(source, str):
+                raise ValueError(f"列 {target} 的表达式必须是字符串")
+            # 提前检查语法和函数，引用的列在绑定源列时检查
+            _Expression(target, source, self._expression_names(source))
+        self._bound: Dict[Tuple[str, ...], _BoundPlan] = {}
+    
+    @classmethod
+    def parse(cls, mapping_config: Union[str, Dict[str, Any], None]) -> Optional["TransformPlan"]:
+        """解析 mapping_config，没有任何列转换时返回None"""
+        if not mapping_config:
+            return None
+        if isinstance(mapping_config, str):
+            try:
+                mapping_config = json.loads(mapping_config)
+            except ValueError as e:
+                raise ValueError(f"mapping_config 不是有效的JSON: {str(e)}")
+        if not isinstance(mapping_config, dict):
+            raise ValueError("mapping_config 必须是JSON对象")
+        spec = {key: mapping_config[key] for key in cls._KEYS if mapping_config.get(key)}
+        if not spec:
+            return None
+        if not isinstance(spec.get("drop", []), list) or any(
+            not isinstance(spec.get(key, {}), dict) for key in cls._KEYS - {"drop"}
+        ):
+            raise ValueError("mapping_config 格式错误：drop 为列表，rename/constants/expressions/casts 为对象")
+        return cls(**spec)
+    
+    @staticmethod
+    def _expression_names(source: str) -> List[str]:
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError:
+            return []
+        functions = {node.func.id for node in ast.walk(tree)
+                     if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+        return [node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id not in functions]
+    
+    def referenced_columns(self) -> List[str]:
+        """计划中引用的源列"""
+        names = list(self.rename) + list(self.drop)
+        for source in self.expressions.values():
+            names.extend(self._expression_names(source))
+        return list(dict.fromkeys(names))
+    
+    def bind(self, source_columns: Sequence[str]) -> _BoundPlan:
+        key = tuple(source_columns)
+        bound = self._bound.get(key)
+        if bound is None:
+            bound = _BoundPlan(self, source_columns)
+            self._bound[key] = bound
+        return bound
+    
+    def apply(self, columns: Sequence[str],
+              rows: Union[List[Sequence], ColumnBatch]) -> Tuple[List[str], Union[List[tuple], ColumnBatch]]:
+        """转换一批数据，返回 (目标列名列表, 行列表)；按列存放的批直接按列转换，返回新的列批"""
+        bound = self.bind(columns)
+        if isinstance(rows, ColumnBatch):
+            output = bound.apply_columns(rows.column_lists(), len(rows))
+            return bound.columns, ColumnBatch.from_lists(bound.columns, output)
+        return bound.columns, bound.apply(rows)
+    
+    def output_column(self, source_column: str) -> Optional[str]:
+        """源列写入目标表时的目标列名，被删除或被表达式替换时返回None"""
+        if source_column in self.drop:
+            return None
+        target = self.rename.get(source_column, source_column)
+        if target in self.expressions:
+            return None
+        return target
+    
+    def key_column(self, source_column: str) -> Optional[str]:
+        """源表主键在目标表中的列名，只有值原样写入（未转换类型）时才能用于核对目标表"""
+        target = self.output_column(source_column)
+        return None if target in self.casts else target
+    
+    def map_schema(self, schema: List[Dict[str, Any]], source_type: DatabaseType) -> List[Dict[str, Any]]:
+        """把源表结构（get_table_schema 的结果）换算为转换后的目标表结构，用于建表"""
+        by_name = {column["column_name"]: column for column in schema}
+        result = []
+        
+        def with_cast(column: Dict[str, Any]) -> Dict[str, Any]:
+            cast = self.casts.get(column["column_name"])
+            if cast:
+                types = _CASTS[cast][1]
+                column["data_type"] = types.get(source_type, types[None])
+                column["default_value"] = None
+            return column
+        
+        for column in schema:
+            name = column["column_name"]
+            if name in self.drop:
+                continue
+            target = self.rename.get(name, name)
+            mapped = dict(column, column_name=target)
+            if target in self.expressions:
+                mapped["default_value"] = None
+                if not mapped.get("is_primary_key"):
+                    mapped["is_nullable"] = True
+            result.append(with_cast(mapped))
+        
+        existing = {column["column_name"] for column in result}
+        for target, value in self.constants.items():
+            if isinstance(value, bool):
+                cast = "bool"
+            elif isinstance(value, int):
+                cast = "int"
+            elif isinstance(value, float):
+                cast = "float"
+            else:
+                cast = "str"
+            types = _CASTS[cast][1]
+            data_type = types.get(source_type, types[None])
+            result.append(with_cast({
+                "column_name": target, "data_type": data_type, "is_nullable": True,
+                "default_value": None, "is_primary_key": False,
+            }))
+        for target, source in self.expressions.items():
+            if target in existing:
+                continue
+            data_type = self._expression_type(source, by_name, source_type)
+            result.append(with_cast({
+                "column_name": target, "data_type": data_type, "is_nullable": True,
+                "default_value": None, "is_primary_key": False,
+            }))
+        return result
+    
+    def _expression_type(self, source: str, by_name: Dict[str, Dict[str, Any]], source_type: DatabaseType) -> str:
+        """表达式列在没有指定类型转换时的列类型：字符串函数为 text，其他沿用表达式中第一个源列的类型"""
+        body = ast.parse(source, mode="eval").body
+        if isinstance(body, ast.Call) and isinstance(body.func, ast.Name):
+            cast = _FUNCTION_TYPES.get(body.func.id)
+            if cast:
+                types = _CASTS[cast][1]
+                return types.get(source_type, types[None])
+        if isinstance(body, ast.Constant) and isinstance(body.value, str):
+            return "text"
+        referenced = [name for name in self._expression_names(source) if name in by_name]
+        return by_name[referenced[0]]["data_type"] if referenced else "text"
+    
+    def map_index_columns(self, columns: Sequence[str]) -> Optional[List[str]]:
+        """索引列换算为目标列名，索引包含被删除或被替换的列时返回None"""
+        mapped = [self.output_column(column) for column in columns]
+        return None if None in mapped else mapped
\ No newline at end of file
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Optional, Callable, Awaitable, Any, List, Dict, Tuple
+
+from app.core.config import settings
+from app.services.database_service import DatabaseConnection
+from app.services.filters import RowFilter
+from app.services.migration_engine import MigrationCancelled
+from app.services.schema_translator import SchemaTranslator
+
+logger = logging.getLogger(__name__)
+
+# 不一致的区间每次细分的份数
+_SPLIT_PARTS = 8
+# 顶层区间数上限：非数值主键的每个切分点需要一次按偏移量抽样的查询
+_MAX_CHUNKS = 256
+# 最多报告的不一致区间数，达到后不再细分和记录，结果标记为已截断
+_MAX_MISMATCHES = 100
+# 源列的类型类别 -> 行校验和中列值的规范化类别（见 database_service.CHECKSUM_KINDS），其余按文本比较
+_CHECKSUM_KINDS = {
+    "bool": "integer", "tinyint": "integer", "smallint": "integer", "int": "integer", "bigint": "integer",
+    "decimal": "decimal", "float": "float", "double": "float",
+    "date": "date", "time": "time", "datetime": "datetime",
+    "binary": "binary", "varbinary": "binary", "blob": "binary",
+    "char": "char", "uuid": "uuid",
+}
+
+
+class ChecksumVerifier:
+    """按主键区间比较源表和目标表，行数据不离开数据库
+    
+    主键空间先切分为每段约 chunk_rows 行的区间，两端各自在数据库端计算每个区间的行数和行校验和；
+    一致的区间直接通过，不一致的区间再细分为 _SPLIT_PARTS 份继续比较，
+    直到区间不超过 leaf_rows 行或无法再分，最终报告不一致的主键区间。
+    两端按源列的类型把列值换算为同样的规范文本后计算校验和，源库和目标库类型不同时同样可以比较。
+    """
+    
+    def __init__(self, source: DatabaseConnection, target: DatabaseConnection,
+                 source_table: str, target_table: str,
+                 row_filter: Optional[RowFilter] = None,
+                 parallelism: Optional[int] = None,
+                 chunk_rows: Optional[int] = None,
+                 leaf_rows: Optional[int] = None,
+                 total_rows: int = 0,
+                 on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                 cancel_event: Optional[asyncio.Event] = None):
+        self.source = source
+        self.target = target
+        self.source_table = source_table
+        self.target_table = target_table
+        # 过滤条件只作用于源表：目标表中多出的行同样报告为不一致
+        self.row_filter = row_filter
+        self.parallelism = max(1, min(parallelism or settings.MIGRATION_PARALLELISM,
+                                      settings.DATASOURCE_POOL_MAX_SIZE))
+        self.chunk_rows = max(1, chunk_rows or settings.MIGRATION_VERIFY_CHUNK_ROWS)
+        self.leaf_rows = max(1, leaf_rows or settings.MIGRATION_VERIFY_LEAF_ROWS)
+        self.total_rows = total_rows
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event or asyncio.Event()
+        self.key_column: Optional[str] = None
+        self.columns: List[str] = []
+        # 各列在行校验和中的规范化类别，与 columns 一一对应
+        self.column_kinds: List[str] = []
+        self.bounds: Tuple[Any, Any] = (None, None)
+        self.chunks = 0
+        self.queries = 0
+        self.source_rows = 0
+        self.target_rows = 0
+        self.mismatches: List[Dict[str, Any]] = []
+        self.truncated = False
+        self.started_at: Optional[float] = None
+        self._semaphore = asyncio.Semaphore(self.parallelism)
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    async def run(self) -> Dict[str, Any]:
+        """执行校验，返回校验结果"""
+        self.started_at = time.monotonic()
+        self.key_column = await self._resolve_key_column()
+        self.columns, self.column_kinds = await self._common_columns()
+        
+        source_low, source_high = await self.source.get_key_range(self.source_table, self.key_column, self.row_filter)
+        target_low, target_high = await self.target.get_key_range(self.target_table, self.key_column)
+        self.bounds = (
+            min((value for value in (source_low, target_low) if value is not None), default=None),
+            max((value for value in (source_high, target_high) if value is not None), default=None),
+        )
+        
+        chunks = await self._plan_chunks()
+        self.chunks = len(chunks)
+        logger.info(f"表 {self.source_table} -> {self.target_table} 按主键 {self.key_column} 切分为 {len(chunks)} 个区间校验")
+        await asyncio.gather(*(self._verify(lower, upper, top=True) for lower, upper in chunks))
+        
+        if self.cancelled:
+            raise MigrationCancelled()
+        result = self.result()
+        logger.info(
+            f"表 {self.source_table} -> {self.target_table} 校验完成: 源表 {self.source_rows} 行, "
+            f"目标表 {self.target_rows} 行, 不一致区间 {len(self.mismatches)} 个, 查询 {self.queries} 次"
+        )
+        return result
+    
+    def result(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "matched": not self.mismatches,
+            "mode": "checksum",
+            "key_column": self.key_column,
+            "columns": self.columns,
+            "source_rows": self.source_rows,
+            "target_rows": self.target_rows,
+            "chunks": self.chunks,
+            "queries": self.queries,
+            "mismatched_ranges": sorted(self.mismatches, key=lambda item: (item["lower"] is not None, item["lower"])),
+            "mismatches_truncated": self.truncated,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+    
+    async def _resolve_key_column(self) -> str:
+        primary_key = await self.source.get_primary_key(self.source_table)
+        if len(primary_key) != 1:
+            raise ValueError(f"数据校验需要源表 {self.source_table} 有单列主键")
+        return primary_key[0]
+    
+    async def _common_columns(self) -> Tuple[List[str], List[str]]:
+        """两表同名的列（按源表顺序）及其规范化类别，只比较这些列"""
+        source_schema = await self.source.get_table_schema(self.source_table)
+        source_columns = [column["column_name"] for column in source_schema]
+        target_columns = {column["column_name"].lower() for column in await self.target.get_table_schema(self.target_table)}
+        if not target_columns:
+            raise ValueError(f"目标表 {self.target_table} 不存在")
+        if self.key_column.lower() not in target_columns:
+            raise ValueError(f"目标表 {self.target_table} 没有主键列 {self.key_column}")
+        skipped = [column for column in source_columns if column.lower() not in target_columns]
+        if skipped:
+            logger.info(f"目标表 {self.target_table} 没有列 {', '.join(skipped)}，校验时不比较这些列")
+        # 两端都按源列的类型规范化，目标列的类型与源列不同（如 decimal 存为 REAL）时仍能比较
+        translator = SchemaTranslator(self.source, self.target)
+        columns = [column for column in source_schema if column["column_name"].lower() in target_columns]
+        kinds = [_CHECKSUM_KINDS.get(translator.parse_type(column["data_type"]).kind, "text") for column in columns]
+        return [column["column_name"] for column in columns], kinds
+    
+    async def _plan_chunks(self) -> List[Tuple[Any, Any]]:
+        """顶层区间：第一个区间不限下界、最后一个区间不限上界，两表中的所有行都落在某个区间内"""
+        low, high = self.bounds
+        if low is None:
+            return [(None, None)]
+        parts = min(_MAX_CHUNKS, max(1, math.ceil(self.total_rows / self.chunk_rows)))
+        boundaries = await self._boundaries(None, None, parts, self.total_rows, True)
+        lowers = [None] + boundaries
+        uppers = boundaries + [None]
+        return list(zip(lowers, uppers))
+    
+    async def _boundaries(self, lower: Any, upper: Any, parts: int, rows: int, on_source: bool) -> List[Any]:
+        """把区间 (lower, upper] 切分为 parts 份的切分点：整数主键按值等分，其他类型按行偏移抽样"""
+        if parts <= 1:
+            return []
+        low = lower if lower is not None else self.bounds[0]
+        high = upper if upper is not None else self.bounds[1]
+        if isinstance(low, int) and isinstance(high, int):
+            if lower is None:
+                # 不限下界的区间包含最小值本身
+                low -= 1
+            boundaries = [low + (high - low) * i // parts for i in range(1, parts)]
+        else:
+            offsets = [rows * i // parts for i in range(1, parts)]
+            if on_source:
+                boundaries = await self.source.get_key_quantiles(
+                    self.source_table, self.key_column, offsets, self.row_filter, lower, upper
+                )
+            else:
+                boundaries = await self.target.get_key_quantiles(
+                    self.target_table, self.key_column, offsets, None, lower, upper
+                )
+        # 切分点必须落在区间内部，否则会产生空区间或重复区间
+        return sorted(
+            value for value in set(boundaries)
+            if (lower is None or value > lower) and (upper is None or value < upper)
+        )
+    
+    async def _checksums(self, lower: Any, upper: Any) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """两端并发计算区间的行数和校验和"""
+        columns = list(zip(self.columns, self.column_kinds))
+        async with self._semaphore:
+            async with self.source.acquire() as source_conn, self.target.acquire() as target_conn:
+                source, target = await asyncio.gather(
+                    self.source.get_chunk_checksum(
+                        source_conn, self.source_table, self.key_column, columns, lower, upper, self.row_filter
+                    ),
+                    self.target.get_chunk_checksum(
+                        target_conn, self.target_table, self.key_column, columns, lower, upper
+                    ),
+                )
+        self.queries += 2
+        return source, target
+    
+    async def _verify(self, lower: Any, upper: Any, top: bool = False):
+        """比较一个区间，不一致时细分后递归比较"""
+        if self.cancelled:
+            return
+        (source_rows, source_sum), (target_rows, target_sum) = await self._checksums(lower, upper)
+        if top:
+            self.source_rows += source_rows
+            self.target_rows += target_rows
+            if self.on_progress:
+                await self.on_progress(self.source_rows, max(self.total_rows, self.source_rows))
+        
+        if source_rows == target_rows and source_sum == target_sum:
+            return
+        
+        rows = max(source_rows, target_rows)
+        if rows > self.leaf_rows and len(self.mismatches) < _MAX_MISMATCHES:
+            parts = min(_SPLIT_PARTS, math.ceil(rows / self.leaf_rows))
+            boundaries = await self._boundaries(lower, upper, parts, rows, source_rows >= target_rows)
+            if boundaries:
+                lowers = [lower] + boundaries
+                uppers = boundaries + [upper]
+                await asyncio.gather(*(self._verify(low, high) for low, high in zip(lowers, uppers)))
+                return
+        
+        if len(self.mismatches) >= _MAX_MISMATCHES:
+            self.truncated = True
+            return
+        self.mismatches.append({
+            "lower": lower,
+            "upper": upper,
+            "source_rows": source_rows,
+            "target_rows": target_rows,
+        })
\ No newline at end of file
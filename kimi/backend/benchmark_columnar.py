@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+数据迁移工具 - 批次存放方式基准测试
+
+比较读取的批次以行元组列表存放和按列存放（ColumnBatch）时：
+- 读写流水线中驻留多批数据的内存占用
+- 转换（mapping_config）、编码 LOAD DATA 文件、完整的转换并写入SQLite流程的吞吐量
+- 按列存放时行列互转的开销
+
+用法: python benchmark_columnar.py [--rows 200000] [--batch-size 5000] [--resident 6]
+"""
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app.models import DatabaseType
+from app.services.bulk_writers import MySQLLoadDataWriter
+from app.services.columnar import ColumnBatch, as_rows
+from app.services.database_service import DatabaseConnection
+from app.services.transform import TransformPlan
+
+COLUMNS = ["id", "qty", "price", "active", "name", "amount", "created_at"]
+
+MAPPING = (
+    '{"rename": {"name": "label"}, "drop": ["amount"], '
+    '"expressions": {"total": "price * qty", "code": "upper(name)"}, "casts": {"qty": "int"}}'
+)
+
+
+def make_rows(count: int, start: int = 0):
+    """生成测试数据：整数、浮点（10% 为NULL）、布尔、字符串、小数和日期时间列"""
+    base = datetime(2024, 1, 1)
+    return [
+        (
+            i,
+            i % 100,
+            None if i % 10 == 0 else i * 0.25,
+            i % 3 == 0,
+            f"name-{i}",
+            Decimal(i) / 100,
+            base + timedelta(seconds=i),
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def measure_memory(batch_size: int, resident: int):
+    """驻留 resident 批数据时额外占用的内存（字节）"""
+    results = {}
+    for name, convert in (("tuples", lambda rows: rows), ("columnar", lambda rows: ColumnBatch.from_rows(COLUMNS, rows))):
+        gc.collect()
+        tracemalloc.start()
+        batches = [convert(make_rows(batch_size, index * batch_size)) for index in range(resident)]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = current
+        del batches
+    return results
+
+
+def timed(func, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_throughput(rows_total: int, batch_size: int):
+    """各阶段处理全部数据的最短耗时（秒）"""
+    batches = [make_rows(batch_size, start) for start in range(0, rows_total, batch_size)]
+    columnar = [ColumnBatch.from_rows(COLUMNS, rows) for rows in batches]
+    plan = TransformPlan.parse(MAPPING)
+    writer = MySQLLoadDataWriter(
+        DatabaseConnection(db_type=DatabaseType.MYSQL, host="localhost", port=3306,
+                           database="benchmark", username="", password=""),
+        "items"
+    )
+    output_columns = plan.bind(COLUMNS).columns
+    
+    def pipeline(to_batch):
+        """读取后的转换 -> 转换 -> 写入SQLite 内存库的完整流程"""
+        conn = sqlite3.connect(":memory:")
+        conn.execute(f"CREATE TABLE items ({', '.join(output_columns)})")
+        query = f"INSERT INTO items VALUES ({', '.join('?' * len(output_columns))})"
+        for rows in batches:
+            _, transformed = plan.apply(COLUMNS, to_batch(rows))
+            conn.executemany(query, as_rows(transformed))
+        conn.commit()
+        conn.close()
+    
+    stages = {
+        "transform": (
+            lambda: [plan.apply(COLUMNS, rows) for rows in batches],
+            lambda: [plan.apply(COLUMNS, batch) for batch in columnar],
+        ),
+        "load_data_encode": (
+            lambda: [writer._encode(rows) for rows in batches],
+            lambda: [writer._encode(batch) for batch in columnar],
+        ),
+        "pipeline_sqlite": (
+            lambda: pipeline(lambda rows: rows),
+            lambda: pipeline(lambda rows: ColumnBatch.from_rows(COLUMNS, rows)),
+        ),
+    }
+    results = {name: (timed(tuples), timed(columns)) for name, (tuples, columns) in stages.items()}
+    # 按列存放额外的转换开销：读取后转置为列、写入前组装为行
+    overhead = {
+        "from_rows": timed(lambda: [ColumnBatch.from_rows(COLUMNS, rows) for rows in batches]),
+        "to_rows": timed(lambda: [batch.to_rows() for batch in columnar]),
+    }
+    return results, overhead
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较行元组列表和按列存放的批次")
+    parser.add_argument("--rows", type=int, default=200000, help="吞吐量测试的总行数")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批行数")
+    parser.add_argument("--resident", type=int, default=6, help="内存测试中同时驻留的批数（queue_depth + 2）")
+    args = parser.parse_args()
+    
+    memory = measure_memory(args.batch_size, args.resident)
+    rows = args.batch_size * args.resident
+    print(f"内存占用（{args.resident} 批 x {args.batch_size} 行）")
+    for name, size in memory.items():
+        print(f"  {name:<10} {size / 1024 / 1024:8.2f} MB  {size / rows:7.1f} 字节/行")
+    print(f"  按列存放为行元组的 {memory['columnar'] / memory['tuples']:.0%}")
+    
+    print(f"\n吞吐量（{args.rows} 行，每批 {args.batch_size} 行，取3次中最快的一次）")
+    print(f"  {'阶段':<18}{'行元组 行/秒':>16}{'按列 行/秒':>16}{'比值':>8}")
+    results, overhead = measure_throughput(args.rows, args.batch_size)
+    for name, (tuples, columns) in results.items():
+        print(f"  {name:<20}{args.rows / tuples:>16,.0f}{args.rows / columns:>16,.0f}{tuples / columns:>8.2f}")
+    print("\n按列存放的转换开销")
+    for name, seconds in overhead.items():
+        print(f"  {name:<20}{args.rows / seconds:>16,.0f} 行/秒")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
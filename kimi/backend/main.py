@@ -6,14 +6,40 @@ import uvicorn
 from app.core.config import settings
 from app.core.database import init_db
 from app.api.routes import api_router
+from app.services.connection_pool import pool_registry
+from app.services.blocking_executor import sqlserver_executor
+from app.services.bulk_writers import bulk_writer_stats
+from app.services.metadata_cache import metadata_cache
+from app.services.migration_service import MigrationTaskService
+from app.services.job_service import MigrationJobService
+from app.services.progress_tracker import progress_tracker
+from app.services.task_scheduler import task_scheduler
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时初始化数据库
     await init_db()
+    # 上次运行中被中断的任务标记为可续传
+    await MigrationTaskService.mark_interrupted_tasks()
+    await MigrationJobService.mark_interrupted_jobs()
+    # 升级前保存的旧式SQL过滤条件默认不再允许使用，启动时提示需要修改的任务
+    await MigrationTaskService.check_filter_conditions()
+    # 运行中任务的进度由刷新协程节流写入元数据库
+    await progress_tracker.start(flush=MigrationTaskService.flush_progress)
+    # 启动迁移任务调度器，并恢复重启前仍在排队的任务；作业中的表结束后调度后续的表
+    await task_scheduler.start(
+        runner=MigrationTaskService.run_task,
+        on_timeout=MigrationTaskService.fail_timed_out_task,
+        on_finished=MigrationJobService.on_task_finished
+    )
+    await MigrationTaskService.restore_queue()
     yield
     # 关闭时的清理工作
+    await task_scheduler.stop()
+    await progress_tracker.stop()
+    await pool_registry.close_all()
+    sqlserver_executor.shutdown()
 
 
 app = FastAPI(
@@ -46,6 +72,18 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "task_scheduler": task_scheduler.stats(),
+        "progress_tracker": progress_tracker.stats(),
+        "sqlserver_executor": sqlserver_executor.stats(),
+        "bulk_writers": bulk_writer_stats(),
+        "datasource_pools": pool_registry.stats(),
+        "metadata_cache": metadata_cache.stats()
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, text
+
+from app.core.database import Base, _ADDED_COLUMNS, _add_missing_columns
+from app.models import MigrationTask
+
+
+def test_add_missing_columns_upgrades_existing_table():
+    """旧版本建立的元数据库补齐后来加入的列，已有的行按模型默认值填充，重复执行不报错"""
+    added = {column_name for table_name, column_name in _ADDED_COLUMNS if table_name == "migration_tasks"}
+    model = Base.metadata.tables["migration_tasks"]
+    old = Table(
+        "migration_tasks", MetaData(),
+        *(Column(column.name, column.type, primary_key=column.primary_key)
+          for column in model.columns if column.name not in added)
+    )
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        old.create(conn)
+        conn.execute(text(
+            "INSERT INTO migration_tasks (id, name, source_id, target_id, source_table, target_table) "
+            "VALUES (1, 'old', 1, 2, 'items', 'items')"
+        ))
+        _add_missing_columns(conn)
+        _add_missing_columns(conn)
+        
+        columns = {column["name"] for column in inspect(conn).get_columns("migration_tasks")}
+        assert columns == {column.name for column in model.columns}
+        row = conn.execute(text("SELECT * FROM migration_tasks")).mappings().one()
+    for column_name in added:
+        default = MigrationTask.__table__.c[column_name].default
+        expected = default.arg if default is not None and default.is_scalar else None
+        assert row[column_name] == (expected.name if hasattr(expected, "name") else expected)
\ No newline at end of file
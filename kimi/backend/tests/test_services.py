@@ -0,0 +1,1135 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import closing
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.database import Base
+from app.models import DatabaseType, DataSource, MigrationJob, MigrationTask, TaskStatus
+from app.services.batch_sizer import AdaptiveBatchSizer, estimate_row_bytes
+from app.services.bulk_writers import (
+    MySQLLoadDataWriter, MySQLMultiRowWriter, SQLiteBulkWriter, SQLServerFastWriter, create_bulk_writer
+)
+from app.services.columnar import ColumnBatch
+from app.services.connection_pool import pool_registry
+from app.services.database_service import DatabaseConnection, canonical_value, complete_uninterrupted, row_checksum
+from app.services.datasource_service import DataSourceService
+from app.services.filters import RowFilter
+from app.services import job_service
+from app.services.job_service import MigrationJobService
+from app.services.metadata_cache import metadata_cache
+from app.services.migration_engine import MigrationCancelled, MigrationEngine
+from app.services.migration_service import MigrationTaskService
+from app.services.schema_translator import SchemaTranslator
+from app.services.spill import SpillStore
+from app.services.task_scheduler import TaskScheduler, task_scheduler
+from app.services.transform import TransformPlan
+from app.services.verification import ChecksumVerifier
+
+
+def _sqlite(path) -> DatabaseConnection:
+    return DatabaseConnection(
+        db_type=DatabaseType.SQLITE, host="", port=0, database=str(path), username="", password=""
+    )
+
+
+def _server(db_type: DatabaseType) -> DatabaseConnection:
+    """只用于生成SQL的服务器数据源，不会建立连接"""
+    return DatabaseConnection(db_type=db_type, host="localhost", port=1, database="test", username="", password="")
+
+
+def _create_items(path, count: int, primary_key: bool = True, start: int = 1):
+    """建立测试表 items(id, name, qty) 并写入 count 行"""
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS items (id INTEGER{' PRIMARY KEY' if primary_key else ''}, name TEXT, qty INTEGER)")
+        conn.executemany(
+            "INSERT INTO items VALUES (?, ?, ?)",
+            [(i, f"name-{i}", i % 7) for i in range(start, start + count)]
+        )
+        conn.commit()
+
+
+def _rows(path, table: str = "items"):
+    with closing(sqlite3.connect(path)) as conn:
+        return sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+
+
+def _run(coro):
+    """执行测试协程，结束后关闭连接池"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await pool_registry.close_all()
+    
+    return asyncio.run(main())
+
+
+async def _wait_until(predicate, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+def test_keyset_copy_and_resume_from_key(tmp_path):
+    """按主键分页复制全部行，从续传位置继续时只复制该主键之后的行"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 1050)
+    _create_items(target, 0, primary_key=False)
+    
+    engine = MigrationEngine(_sqlite(source), _sqlite(target), "items", "items", batch_size=100)
+    assert _run(engine.run()) == 1050
+    assert engine.key_column == "id"
+    assert engine.last_key == 1050
+    assert _rows(target) == _rows(source)
+    
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute("DELETE FROM items WHERE id > 1000")
+        conn.commit()
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items", batch_size=100, start_key=1000, processed_rows=1000
+    )
+    assert _run(engine.run()) == 1050
+    assert _rows(target) == _rows(source)
+
+
+def test_copy_without_primary_key_streams_all_rows(tmp_path):
+    """没有主键的表按流式游标顺序读取全部行"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 250, primary_key=False)
+    _create_items(target, 0, primary_key=False)
+    
+    engine = MigrationEngine(_sqlite(source), _sqlite(target), "items", "items", batch_size=100)
+    assert _run(engine.run()) == 250
+    assert engine.key_column is None
+    assert _rows(target) == _rows(source)
+
+
+def test_columnar_batches_copy_the_same_rows(tmp_path, monkeypatch):
+    """开启按列存放批次时复制结果与按行存放相同"""
+    monkeypatch.setattr("app.core.config.settings.MIGRATION_COLUMNAR_BATCHES", True)
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 300)
+    _create_items(target, 0, primary_key=False)
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute("UPDATE items SET qty = NULL WHERE id % 7 = 0")
+        conn.commit()
+    
+    engine = MigrationEngine(_sqlite(source), _sqlite(target), "items", "items", batch_size=64)
+    assert _run(engine.run()) == 300
+    assert _rows(target) == _rows(source)
+
+
+def test_parallel_ranges_cover_the_key_space(tmp_path):
+    """整数主键按值等分、文本主键按行偏移抽样切分区间，各区间独立复制后目标表与源表一致"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 1000)
+    _create_items(target, 0, primary_key=False)
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute("CREATE TABLE codes (code TEXT PRIMARY KEY, qty INTEGER)")
+        conn.executemany("INSERT INTO codes VALUES (?, ?)", [(f"k{i:05d}", i) for i in range(1000)])
+        conn.commit()
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute("CREATE TABLE codes (code TEXT, qty INTEGER)")
+        # 多个写入连接同时切换 journal_mode 会直接返回 database is locked，这里预先切换
+        conn.execute("PRAGMA journal_mode = WAL")
+    
+    for table in ("items", "codes"):
+        engine = MigrationEngine(_sqlite(source), _sqlite(target), table, table, batch_size=50, total_rows=1000)
+        # SQLite目标库默认不并行写入，这里检查区间切分和多个区间同时复制
+        engine.parallelism = 4
+        assert _run(engine.run()) == 1000
+        ranges = engine.ranges
+        assert len(ranges) == 4
+        assert ranges[0].lower is None and ranges[-1].upper is None
+        assert all(previous.upper == following.lower for previous, following in zip(ranges, ranges[1:]))
+        assert all(key_range.done for key_range in ranges)
+        assert sum(key_range.rows for key_range in ranges) == 1000
+        assert _rows(target, table) == _rows(source, table)
+
+
+def test_scheduler_runs_queued_tasks_by_priority():
+    """同时运行的任务数不超过上限，等待的任务按优先级执行，相同优先级先提交先执行，移出队列的任务不执行"""
+    started = []
+    release = asyncio.Event()
+    
+    async def runner(task_id: int):
+        started.append(task_id)
+        if task_id == 1:
+            await release.wait()
+    
+    async def scenario():
+        scheduler = TaskScheduler(max_concurrent=1, timeout=5)
+        await scheduler.start(runner)
+        try:
+            await scheduler.submit(1)
+            await _wait_until(lambda: scheduler.is_running(1))
+            for task_id, priority in ((2, 0), (3, 5), (4, 0), (5, 5)):
+                assert await scheduler.submit(task_id, priority)
+            assert not await scheduler.submit(1)
+            assert [scheduler.queue_position(task_id) for task_id in (2, 3, 4, 5)] == [3, 1, 4, 2]
+            assert scheduler.remove(4)
+            release.set()
+            await _wait_until(lambda: len(started) == 4 and not scheduler.stats()["running"])
+        finally:
+            await scheduler.stop()
+    
+    asyncio.run(scenario())
+    assert started == [1, 3, 5, 2]
+
+
+def test_scheduler_keeps_tasks_submitted_before_start():
+    """调度器启动前（或停止后）提交的任务留在队列中，启动后执行"""
+    started = []
+    
+    async def runner(task_id: int):
+        started.append(task_id)
+    
+    async def scenario():
+        scheduler = TaskScheduler(max_concurrent=2, timeout=5)
+        assert await scheduler.submit(1)
+        assert await scheduler.submit(2, priority=5)
+        assert scheduler.queue_position(2) == 1
+        await scheduler.start(runner)
+        try:
+            await _wait_until(lambda: len(started) == 2)
+        finally:
+            await scheduler.stop()
+        assert await scheduler.submit(3)
+        await scheduler.start(runner)
+        try:
+            await _wait_until(lambda: len(started) == 3)
+        finally:
+            await scheduler.stop()
+    
+    asyncio.run(scenario())
+    assert started == [2, 1, 3]
+
+
+def test_scheduler_cancels_task_after_timeout():
+    """运行超过 timeout 秒的任务被取消并调用超时回调，工作协程继续执行下一个任务"""
+    timed_out, finished = [], []
+    
+    async def runner(task_id: int):
+        if task_id == 1:
+            await asyncio.sleep(60)
+        finished.append(task_id)
+    
+    async def on_timeout(task_id: int):
+        timed_out.append(task_id)
+    
+    async def scenario():
+        scheduler = TaskScheduler(max_concurrent=1, timeout=0.05)
+        await scheduler.start(runner, on_timeout)
+        try:
+            await scheduler.submit(1)
+            await scheduler.submit(2)
+            await _wait_until(lambda: finished == [2])
+        finally:
+            await scheduler.stop()
+    
+    asyncio.run(scenario())
+    assert timed_out == [1]
+
+
+def test_scheduler_cancel_policies():
+    """commit 策略只设置取消信号由任务自行停止，rollback 策略同时中断执行协程"""
+    outcomes = {}
+    scheduler = TaskScheduler(max_concurrent=2, timeout=5)
+    
+    async def runner(task_id: int):
+        try:
+            if task_id == 2:
+                # 只有中断执行协程才能让这个任务停止
+                await asyncio.sleep(60)
+            while not scheduler.cancel_event(task_id).is_set():
+                await asyncio.sleep(0.01)
+            outcomes[task_id] = "stopped"
+        except asyncio.CancelledError:
+            outcomes[task_id] = "interrupted"
+            raise
+    
+    async def scenario():
+        await scheduler.start(runner)
+        try:
+            await scheduler.submit(1)
+            await scheduler.submit(2)
+            await _wait_until(lambda: scheduler.is_running(1) and scheduler.is_running(2))
+            assert scheduler.cancel(1, "commit")
+            assert scheduler.cancel(2, "rollback")
+            assert not scheduler.cancel(3)
+            await _wait_until(lambda: len(outcomes) == 2 and not scheduler.stats()["running"])
+        finally:
+            await scheduler.stop()
+    
+    asyncio.run(scenario())
+    assert outcomes == {1: "stopped", 2: "interrupted"}
+
+
+def test_complete_uninterrupted_defers_cancellation():
+    """已发出的提交在取消请求到达后仍然完成，取消在提交完成后重新投递"""
+    events = []
+    
+    async def commit():
+        await asyncio.sleep(0.05)
+        events.append("committed")
+        return len(events)
+    
+    async def worker():
+        events.append(await complete_uninterrupted(commit()))
+        await asyncio.sleep(5)
+        events.append("not reached")
+    
+    async def scenario():
+        task = asyncio.create_task(worker())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    
+    asyncio.run(scenario())
+    assert events == ["committed", 1]
+
+
+def test_cancel_stops_after_the_committed_batch(tmp_path):
+    """取消信号在批次之间检查，停止时已提交的批次全部计入已处理行数和续传位置"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 1000)
+    _create_items(target, 0, primary_key=False)
+    cancel_event = asyncio.Event()
+    
+    async def on_progress(processed_rows: int, *args):
+        if processed_rows >= 300:
+            cancel_event.set()
+    
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items",
+        batch_size=100, on_progress=on_progress, cancel_event=cancel_event
+    )
+    with pytest.raises(MigrationCancelled):
+        _run(engine.run())
+    copied = _rows(target)
+    assert 300 <= len(copied) < 1000
+    assert engine.processed_rows == len(copied)
+    assert engine.last_key == copied[-1][0]
+
+
+def test_resume_from_checkpoint_copies_each_row_once(tmp_path):
+    """中断后从检查点续传：检查点之后已提交的批次按目标表中的主键校正，不重复也不遗漏"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 2000)
+    _create_items(target, 0, primary_key=False)
+    with closing(sqlite3.connect(target)) as conn:
+        # 多个写入连接同时切换 journal_mode 会直接返回 database is locked，这里预先切换
+        conn.execute("PRAGMA journal_mode = WAL")
+    checkpoints = []
+    
+    async def on_checkpoint(checkpoint):
+        # 检查点以JSON保存在任务记录中
+        checkpoints.append(MigrationTaskService._load_checkpoint(MigrationTaskService._dump_checkpoint(checkpoint)))
+    
+    async def interrupt(processed_rows: int, *args):
+        if processed_rows >= 900:
+            raise RuntimeError("目标库连接中断")
+    
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items", batch_size=100, total_rows=2000,
+        on_progress=interrupt, on_checkpoint=on_checkpoint, checkpoint_interval=3
+    )
+    engine.parallelism = 4
+    with pytest.raises(RuntimeError):
+        _run(engine.run())
+    copied = len(_rows(target))
+    assert len(checkpoints[-1]["ranges"]) == 4
+    assert checkpoints[-1]["rows_committed"] < copied < 2000
+    
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items", batch_size=100, total_rows=2000,
+        checkpoint=checkpoints[-1], on_checkpoint=on_checkpoint
+    )
+    assert _run(engine.run()) == 2000
+    assert _rows(target) == _rows(source)
+
+
+def _metadata_db(tmp_path, monkeypatch) -> async_sessionmaker:
+    """任务服务使用的临时元数据库，写入源和目标两个SQLite数据源"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}", poolclass=NullPool)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("app.services.migration_service.AsyncSessionLocal", sessions)
+    
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessions() as db:
+            for datasource_id, name in ((1, "source"), (2, "target")):
+                db.add(DataSource(
+                    id=datasource_id, name=name, db_type=DatabaseType.SQLITE, host="", port=0,
+                    database=str(tmp_path / f"{name}.db"), username="", password=""
+                ))
+            await db.commit()
+        await engine.dispose()
+    
+    asyncio.run(create())
+    return sessions
+
+
+def test_timed_out_task_saves_its_checkpoint(tmp_path, monkeypatch):
+    """任务执行超时被终止时保存已提交的行数和检查点，从检查点续传后每行只复制一次"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 100000)
+    _create_items(target, 0, primary_key=False)
+    # 运行期间不定期保存检查点，超时时保存的就是唯一的检查点
+    monkeypatch.setattr("app.core.config.settings.MIGRATION_CHECKPOINT_INTERVAL", 10 ** 6)
+    # 固定批大小，避免批次增大后在超时前复制完成
+    monkeypatch.setattr("app.core.config.settings.MIGRATION_ADAPTIVE_BATCH", False)
+    sessions = _metadata_db(tmp_path, monkeypatch)
+    
+    async def load_task() -> MigrationTask:
+        async with sessions() as db:
+            return await MigrationTaskService.get_task(db, 1)
+    
+    async def time_out():
+        async with sessions() as db:
+            db.add(MigrationTask(
+                id=1, name="items", source_id=1, target_id=2, source_table="items", target_table="items",
+                batch_size=50, parallelism=1, status=TaskStatus.QUEUED
+            ))
+            await db.commit()
+        timed_out = asyncio.Event()
+        
+        async def on_timeout(task_id: int):
+            await MigrationTaskService.fail_timed_out_task(task_id)
+            timed_out.set()
+        
+        scheduler = TaskScheduler(max_concurrent=1, timeout=0.5)
+        await scheduler.start(MigrationTaskService.run_task, on_timeout)
+        try:
+            await scheduler.submit(1)
+            await asyncio.wait_for(timed_out.wait(), 10)
+        finally:
+            await scheduler.stop()
+        return await load_task()
+    
+    task = _run(time_out())
+    assert task.status == TaskStatus.FAILED
+    assert task.checkpoint is not None
+    copied = len(_rows(target))
+    assert 0 < task.processed_rows <= copied < 100000
+    assert MigrationTaskService._load_key(task.last_key) == task.processed_rows
+    
+    async def resume():
+        async with sessions() as db:
+            assert await MigrationTaskService.resume_task(db, 1)
+            # 批大小不影响续传位置，续传时用大批次加快测试
+            (await MigrationTaskService.get_task(db, 1)).batch_size = 10000
+            await db.commit()
+        # 续传请求加入的是全局调度器的队列，这里直接执行
+        task_scheduler.remove(1)
+        await MigrationTaskService.run_task(1)
+        return await load_task()
+    
+    task = _run(resume())
+    assert task.status == TaskStatus.COMPLETED
+    assert task.processed_rows == 100000
+    assert _rows(target) == _rows(source)
+
+
+def test_checkpoint_keys_keep_their_type_through_json():
+    """续传位置和检查点中各区间的主键值按类型保存，续传时还原为原类型作为参数绑定"""
+    for lower, upper, last_key in (
+        (datetime(2024, 1, 1), datetime(2024, 6, 1, 12, 0, 0, 500), datetime(2024, 3, 2, 8, 15)),
+        (Decimal("10.50"), Decimal("99.99"), Decimal("42.10")),
+        (uuid.UUID(int=1), uuid.UUID(int=2 ** 127), uuid.UUID(int=2 ** 64)),
+        (b"\x00", b"\xff\xff", b"\x7f\x01"),
+    ):
+        checkpoint = {
+            "key_column": "id", "last_key": last_key, "rows_committed": 10, "target_rows": 10,
+            "ranges": [{"index": 0, "lower": None, "upper": lower, "last_key": lower, "rows": 5, "done": True},
+                       {"index": 1, "lower": lower, "upper": upper, "last_key": last_key, "rows": 5, "done": False}],
+        }
+        restored = MigrationTaskService._load_checkpoint(MigrationTaskService._dump_checkpoint(checkpoint))
+        assert restored == checkpoint
+        assert [type(key_range["last_key"]) for key_range in restored["ranges"]] == [type(lower)] * 2
+        assert MigrationTaskService._load_key(MigrationTaskService._dump_key(last_key)) == last_key
+    assert MigrationTaskService._dump_key(None) is None and MigrationTaskService._load_key(None) is None
+    # 旧版本按字符串保存的整数和文本主键照常读取
+    assert MigrationTaskService._load_key("1000") == 1000
+    assert MigrationTaskService._load_key('"name-5"') == "name-5"
+
+
+def test_bulk_writer_selection_and_sqlite_write(tmp_path, monkeypatch):
+    """按目标库类型选择写入方式，SQLite整批写入并统计写入量"""
+    monkeypatch.setattr("app.core.config.settings.MYSQL_LOAD_DATA_LOCAL", False)
+    assert type(create_bulk_writer(_server(DatabaseType.MYSQL), "items")) is MySQLMultiRowWriter
+    assert type(create_bulk_writer(_server(DatabaseType.SQLSERVER), "items")) is SQLServerFastWriter
+    monkeypatch.setattr("app.core.config.settings.MYSQL_LOAD_DATA_LOCAL", True)
+    assert type(create_bulk_writer(_server(DatabaseType.MYSQL), "items")) is MySQLLoadDataWriter
+    
+    target = tmp_path / "target.db"
+    _create_items(target, 0)
+    writer = create_bulk_writer(_sqlite(target), "items")
+    assert isinstance(writer, SQLiteBulkWriter)
+    
+    async def write():
+        async with writer.target.acquire() as conn:
+            await writer.prepare(conn)
+            for start in (1, 101):
+                await writer.write(conn, ["id", "name", "qty"], [(i, f"name-{i}", i % 7) for i in range(start, start + 100)])
+    
+    _run(write())
+    assert len(_rows(target)) == 200
+    assert (writer.stats()["rows"], writer.stats()["batches"]) == (200, 2)
+
+
+def test_mysql_multi_row_statements_respect_packet_limit():
+    """多行插入语句按 max_allowed_packet 切分，每行只出现在一条语句中"""
+    writer = MySQLMultiRowWriter(_server(DatabaseType.MYSQL), "items")
+    writer.max_statement_bytes = 1000
+    conn = SimpleNamespace(escape=lambda row: "(" + ",".join(repr(value) for value in row) + ")")
+    rows = [(i, f"name-{i}") for i in range(200)]
+    statements = writer._statements(conn, ["id", "name"], rows)
+    assert len(statements) > 1
+    assert all(len(statement.encode("utf-8")) <= 1000 for statement in statements)
+    assert sum(statement.count("'name-") for statement in statements) == 200
+    assert statements[0].startswith("INSERT INTO `items` (`id`, `name`) VALUES (0,'name-0'),")
+
+
+def test_mysql_load_data_encoding():
+    """LOAD DATA 文件按制表符分隔，NULL写为 \\N，特殊字符转义；含二进制值的批次不能按文本导入"""
+    writer = MySQLLoadDataWriter(_server(DatabaseType.MYSQL), "items")
+    rows = [
+        (1, "a\tb\nc\\d", None, True, Decimal("1.50"), datetime(2024, 1, 2, 3, 4, 5)),
+        (2, "", 1.25, False, None, date(2024, 1, 2)),
+    ]
+    assert writer._encode(rows) == (
+        "1\ta\\tb\\nc\\\\d\t\\N\t1\t1.50\t2024-01-02 03:04:05\n"
+        "2\t\t1.25\t0\t\\N\t2024-01-02\n"
+    ).encode("utf-8")
+    assert writer._encode([(1, b"\x00")]) is None
+
+
+def test_sqlserver_writer_enables_identity_insert_for_identity_columns(monkeypatch):
+    """写入的列包含目标表的标识列时，该批在 IDENTITY_INSERT ON/OFF 之间执行，出错时同样关闭"""
+    target = _server(DatabaseType.SQLSERVER)
+    
+    async def get_identity_columns(table_name):
+        return ["ID"]
+    
+    monkeypatch.setattr(target, "get_identity_columns", get_identity_columns)
+    writer = SQLServerFastWriter(target, "items")
+    asyncio.run(writer.prepare(None))
+    assert writer._identity_insert(["id", "name"]) is True
+    assert writer._identity_insert(["name", "qty"]) is False
+    
+    class Cursor:
+        def __init__(self, fail: bool):
+            self.fail = fail
+            self.fast_executemany = False
+        
+        def execute(self, statement, *params):
+            statements.append(statement)
+        
+        def executemany(self, query, rows):
+            statements.append(query)
+            if self.fail:
+                raise RuntimeError("写入失败")
+        
+        def close(self):
+            pass
+    
+    for fail in (False, True):
+        statements = []
+        conn = SimpleNamespace(autocommit=True, cursor=lambda: Cursor(fail))
+        try:
+            DatabaseConnection._sqlserver_executemany(conn, "INSERT", [(1,)], True, "[items]")
+        except RuntimeError:
+            assert fail
+        assert statements == ["SET IDENTITY_INSERT [items] ON", "INSERT", "SET IDENTITY_INSERT [items] OFF"]
+    statements = []
+    DatabaseConnection._sqlserver_executemany(SimpleNamespace(autocommit=True, cursor=lambda: Cursor(False)), "INSERT", [(1,)])
+    assert statements == ["INSERT"]
+
+
+def test_schema_translator_maps_types_and_defaults_across_dialects():
+    """跨方言时按与方言无关的类型翻译列类型和默认值，同方言时原样保留"""
+    mysql, sqlserver = _server(DatabaseType.MYSQL), _server(DatabaseType.SQLSERVER)
+    to_sqlserver = SchemaTranslator(mysql, sqlserver)
+    assert [to_sqlserver.translate_type(data_type) for data_type in (
+        "int(11) unsigned", "tinyint(1)", "varchar(50)", "decimal(10,2)", "datetime", "longtext", "enum('a','b')"
+    )] == ["bigint", "bit", "nvarchar(50)", "decimal(10,2)", "datetime2(0)", "nvarchar(max)", "nvarchar(255)"]
+    assert to_sqlserver.translate_type("text", is_primary_key=True) == "nvarchar(450)"
+    assert to_sqlserver.translate_default("abc", "varchar(10)") == "N'abc'"
+    
+    to_mysql = SchemaTranslator(sqlserver, mysql)
+    assert [to_mysql.translate_type(data_type) for data_type in (
+        "nvarchar(max)", "uniqueidentifier", "money", "datetime", "bit", "tinyint"
+    )] == ["longtext", "char(36)", "decimal(19,4)", "datetime(3)", "tinyint(1)", "tinyint unsigned"]
+    assert to_mysql.translate_default("((0))", "int") == "0"
+    assert to_mysql.translate_default("(getdate())", "datetime") == "CURRENT_TIMESTAMP"
+    assert to_mysql.translate_default("(N'it''s')", "nvarchar(20)") == "'it''s'"
+    assert to_mysql.column_definition(
+        {"column_name": "created", "data_type": "datetime2(3)", "is_nullable": False, "default_value": "(sysdatetime())"}
+    ) == "`created` datetime(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)"
+    
+    assert SchemaTranslator(mysql, _server(DatabaseType.MYSQL)).translate_type("mediumint(8) unsigned") == "mediumint(8) unsigned"
+
+
+def test_ensure_target_table_creates_table_and_returns_deferred_indexes(tmp_path):
+    """目标表不存在时按源表结构建表，二级索引的语句留到导入之后执行；目标表已存在时不做改动"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, code VARCHAR(20) NOT NULL UNIQUE, "
+            "qty INTEGER DEFAULT 0, price NUMERIC(10,2))"
+        )
+        conn.execute("CREATE INDEX ix_items_qty ON items (qty)")
+    translator = SchemaTranslator(_sqlite(source), _sqlite(target))
+    
+    async def create():
+        first = await translator.ensure_target_table("items", "copied")
+        for statement in first:
+            await translator.target.execute(statement)
+        return first, await translator.ensure_target_table("items", "copied")
+    
+    indexes, again = _run(create())
+    assert len(indexes) == 2 and again == []
+    with closing(sqlite3.connect(target)) as conn:
+        columns = conn.execute("PRAGMA table_info(copied)").fetchall()
+        index_names = {row[1] for row in conn.execute("PRAGMA index_list(copied)")}
+    assert [(column[1], column[2], column[3], column[4], column[5]) for column in columns] == [
+        ("id", "INTEGER", 1, None, 1),
+        ("code", "VARCHAR(20)", 1, None, 0),
+        ("qty", "INTEGER", 0, "0", 0),
+        ("price", "NUMERIC(10,2)", 0, None, 0),
+    ]
+    assert "copied_ix_items_qty" in index_names
+
+
+def test_auto_increment_columns_keep_their_identity_across_dialects(tmp_path):
+    """SQLite的 INTEGER 单列主键读作自增列，建表时翻译为 AUTO_INCREMENT / IDENTITY(1,1)"""
+    source = tmp_path / "source.db"
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("CREATE TABLE pairs (a INTEGER, b INTEGER, PRIMARY KEY (a, b))")
+    schema = _run(_sqlite(source).get_table_schema("items"))
+    assert [column["is_auto_increment"] for column in schema] == [True, False]
+    assert not any(column["is_auto_increment"] for column in _run(_sqlite(source).get_table_schema("pairs")))
+    
+    to_mysql = SchemaTranslator(_sqlite(source), _server(DatabaseType.MYSQL))
+    assert "`id` bigint NOT NULL AUTO_INCREMENT," in to_mysql.create_table_sql("items", schema)
+    to_sqlserver = SchemaTranslator(_sqlite(source), _server(DatabaseType.SQLSERVER))
+    assert "[id] bigint IDENTITY(1,1) NOT NULL," in to_sqlserver.create_table_sql("items", schema)
+    
+    # MySQL的自增列必须是主键第一列，否则按普通列建立
+    mysql = _server(DatabaseType.MYSQL)
+    columns = [
+        {"column_name": "tenant", "data_type": "int", "is_nullable": False, "is_primary_key": True},
+        {"column_name": "id", "data_type": "int", "is_nullable": False, "is_primary_key": True,
+         "is_auto_increment": True},
+    ]
+    assert "AUTO_INCREMENT" not in SchemaTranslator(mysql, mysql).create_table_sql("t", columns)
+    assert "[id] int IDENTITY(1,1) NOT NULL" in SchemaTranslator(mysql, _server(DatabaseType.SQLSERVER)).create_table_sql(
+        "t", columns
+    )
+
+
+def _target_objects(path, table: str = "items"):
+    with closing(sqlite3.connect(path)) as conn:
+        return {
+            name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+                "AND name NOT LIKE 'sqlite_%'",
+                (table,)
+            )
+        }
+
+
+def test_deferred_load_drops_and_rebuilds_target_objects(tmp_path):
+    """deferred 导入方式：删除目标表的普通索引和触发器后立即保存检查点，复制期间不存在，复制结束后按原定义重建"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 500)
+    _create_items(target, 0)
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute("CREATE INDEX ix_items_qty ON items (qty)")
+        conn.execute("CREATE TABLE audit (item_id INTEGER)")
+        conn.execute("CREATE TRIGGER trg_items AFTER INSERT ON items BEGIN INSERT INTO audit VALUES (new.id); END")
+    during, checkpoints = [], []
+    
+    async def on_progress(processed_rows: int, *args):
+        during.append(_target_objects(target))
+    
+    async def on_checkpoint(checkpoint):
+        checkpoints.append(json.loads(json.dumps(checkpoint)))
+    
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items", batch_size=100, load_mode="deferred",
+        on_progress=on_progress, on_checkpoint=on_checkpoint, checkpoint_interval=100
+    )
+    assert _run(engine.run()) == 500
+    assert during and all(objects == set() for objects in during)
+    assert checkpoints[0]["target_objects"]["state"] == "disabled"
+    assert {item["name"] for item in checkpoints[0]["target_objects"]["objects"]} == {"ix_items_qty", "trg_items"}
+    assert _target_objects(target) == {"ix_items_qty", "trg_items"}
+    assert engine.metrics()["target_objects"]["state"] == "restored"
+    assert _rows(target) == _rows(source)
+    assert _rows(target, "audit") == []
+
+
+def test_deferred_load_is_not_used_without_a_primary_key(tmp_path):
+    """没有主键的表不能续传，deferred 导入方式退回为直接写入，目标表的索引在复制期间保持不变"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 300, primary_key=False)
+    _create_items(target, 0, primary_key=False)
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute("CREATE INDEX ix_items_qty ON items (qty)")
+    during = []
+    
+    async def on_progress(processed_rows: int, *args):
+        during.append(_target_objects(target))
+    
+    engine = MigrationEngine(
+        _sqlite(source), _sqlite(target), "items", "items", batch_size=100, load_mode="deferred",
+        on_progress=on_progress
+    )
+    assert _run(engine.run()) == 300
+    assert engine.load_mode == "append" and engine.target_objects is None
+    assert during and all(objects == {"ix_items_qty"} for objects in during)
+    assert _rows(target) == _rows(source)
+
+
+def test_transform_plan_applies_column_mapping():
+    """mapping_config 编译为按列计算的转换计划：重命名、删除、常量、表达式和类型转换，NULL参与运算时结果为NULL"""
+    plan = TransformPlan.parse(json.dumps({
+        "rename": {"name": "label"},
+        "drop": ["secret"],
+        "constants": {"origin": "erp"},
+        "expressions": {"qty": "qty + 1", "code": "upper(coalesce(code, 'none'))", "total": "price * qty"},
+        "casts": {"id": "str"},
+    }))
+    columns, rows = plan.apply(["id", "name", "qty", "price", "code", "secret"], [
+        (1, "a", 2, Decimal("1.50"), "x1", "s"),
+        (2, "b", None, Decimal("2"), None, "t"),
+    ])
+    assert columns == ["id", "label", "qty", "price", "code", "origin", "total"]
+    assert [tuple(row) for row in rows] == [
+        ("1", "a", 3, Decimal("1.50"), "X1", "erp", Decimal("3.00")),
+        ("2", "b", None, Decimal("2"), "NONE", "erp", None),
+    ]
+    # 按列存放的批得到同样的结果
+    columnar_columns, batch = plan.apply(
+        ["id", "name", "qty", "price", "code", "secret"],
+        ColumnBatch.from_rows(["id", "name", "qty", "price", "code", "secret"], [
+            (1, "a", 2, Decimal("1.50"), "x1", "s"),
+            (2, "b", None, Decimal("2"), None, "t"),
+        ])
+    )
+    assert columnar_columns == columns and [tuple(row) for row in batch.to_rows()] == [tuple(row) for row in rows]
+    assert plan.output_column("name") == "label"
+    assert plan.output_column("secret") is None
+    # 类型被转换的主键不能用于核对目标表中已写入的行
+    assert plan.key_column("id") is None
+    assert TransformPlan.parse(None) is None
+    assert TransformPlan.parse('{"load_mode": "deferred"}') is None
+
+
+def test_transform_plan_rejects_unsafe_or_invalid_config():
+    """表达式只允许列、常量、算术运算和白名单函数，引用不存在的源列时在绑定时报错"""
+    for mapping_config in (
+        '{"expressions": {"x": "__import__(\'os\').getcwd()"}}',
+        '{"expressions": {"x": "name.upper()"}}',
+        '{"expressions": {"x": "[name]"}}',
+        '{"casts": {"x": "blob"}}',
+        '{"drop": "name"}',
+        'not json',
+    ):
+        with pytest.raises(ValueError):
+            TransformPlan.parse(mapping_config)
+    plan = TransformPlan.parse('{"expressions": {"x": "missing + 1"}}')
+    with pytest.raises(ValueError):
+        plan.apply(["id"], [(1,)])
+
+
+def test_row_filter_compiles_to_parameterized_sql():
+    """结构化过滤条件编译为带占位符的SQL，值只作为参数传递"""
+    row_filter = RowFilter.parse(json.dumps([
+        {"column": "qty", "op": "in", "value": [1, 2]},
+        {"or": [{"column": "name", "op": "like", "value": "name-1%"}, {"not": {"column": "id", "op": "<", "value": 500}}]},
+    ]))
+    assert row_filter.compile(_server(DatabaseType.MYSQL)) == (
+        "(`qty` IN (%s, %s) AND (`name` LIKE %s OR (NOT `id` < %s)))", [1, 2, "name-1%", 500]
+    )
+    sql, params = RowFilter.parse('{"column": "name", "op": "=", "value": "x\' OR 1=1 --"}').compile(_sqlite("unused.db"))
+    assert (sql, params) == ('"name" = ?', ["x' OR 1=1 --"])
+    assert row_filter.columns() == ["qty", "name", "id"]
+    assert row_filter.index_plan([["id"], ["qty", "name"]])["indexed"] is True
+    assert row_filter.index_plan([["id"]])["indexed"] is False
+    assert RowFilter.parse("  ") is None
+    for filter_condition in (
+        "qty > 1",
+        '{"column": "qty", "op": "regexp", "value": "1"}',
+        '{"column": "qty", "op": "in", "value": []}',
+        '{"column": "qty", "op": "=", "value": null}',
+    ):
+        with pytest.raises(ValueError):
+            RowFilter.parse(filter_condition)
+
+
+def test_copy_with_row_filter_only_copies_matching_rows(tmp_path):
+    """过滤条件下推到源库的计数、区间规划和分批读取"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 1000)
+    _create_items(target, 0, primary_key=False)
+    row_filter = RowFilter.parse('[{"column": "qty", "op": "=", "value": 3}, {"column": "id", "op": "between", "value": [100, 800]}]')
+    
+    engine = MigrationEngine(_sqlite(source), _sqlite(target), "items", "items", row_filter=row_filter, batch_size=20)
+    copied = _run(engine.run())
+    expected = [row for row in _rows(source) if row[2] == 3 and 100 <= row[0] <= 800]
+    assert copied == len(expected)
+    assert _rows(target) == expected
+    assert engine.filter_plan["indexed"] is True
+    assert engine.filter_plan["index_columns"] == ["id"]
+
+
+def test_tasks_with_raw_sql_filters_are_rejected_before_queueing(tmp_path, monkeypatch, caplog):
+    """升级前保存的旧式SQL过滤条件：启动时记录警告，启动任务时直接报错，任务保持原状态"""
+    sessions = _metadata_db(tmp_path, monkeypatch)
+    
+    async def scenario():
+        async with sessions() as db:
+            db.add(MigrationTask(
+                id=1, name="items", source_id=1, target_id=2, source_table="items", target_table="items",
+                filter_condition="qty > 1", status=TaskStatus.PENDING
+            ))
+            await db.commit()
+        await MigrationTaskService.check_filter_conditions()
+        async with sessions() as db:
+            with pytest.raises(ValueError, match="MIGRATION_ALLOW_RAW_FILTER"):
+                await MigrationTaskService.start_task(db, 1)
+        async with sessions() as db:
+            return await MigrationTaskService.get_task(db, 1)
+    
+    assert _run(scenario()).status == TaskStatus.PENDING
+    assert "迁移任务 1 的 filter_condition" in caplog.text
+
+
+def test_job_plan_orders_tables_by_foreign_keys_and_breaks_cycles(tmp_path):
+    """被引用的表排在引用它的表之前，循环依赖的表按无依赖处理并记录在 cycles 中，自引用被忽略"""
+    path = tmp_path / "source.db"
+    sizes = {"customers": 50, "products": 20, "orders": 200, "order_items": 500, "a": 10, "b": 10, "nodes": 5}
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executescript("""
+            CREATE TABLE customers (id INTEGER PRIMARY KEY, ref INTEGER);
+            CREATE TABLE products (id INTEGER PRIMARY KEY, ref INTEGER);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, ref INTEGER REFERENCES customers(id));
+            CREATE TABLE order_items (
+                id INTEGER PRIMARY KEY, ref INTEGER REFERENCES orders(id), product_id INTEGER REFERENCES products(id)
+            );
+            CREATE TABLE a (id INTEGER PRIMARY KEY, ref INTEGER REFERENCES b(id));
+            CREATE TABLE b (id INTEGER PRIMARY KEY, ref INTEGER REFERENCES a(id));
+            CREATE TABLE nodes (id INTEGER PRIMARY KEY, ref INTEGER REFERENCES nodes(id));
+        """)
+        for table, count in sizes.items():
+            conn.executemany(f"INSERT INTO {table} (id) VALUES (?)", [(i,) for i in range(1, count + 1)])
+        conn.commit()
+        # 估算行数来自统计信息
+        conn.execute("ANALYZE")
+        conn.commit()
+    
+    catalog = _run(_sqlite(path).get_catalog())
+    plan = MigrationJobService.plan_tables(catalog)
+    order = [entry["table"] for entry in plan["tables"]]
+    assert order == ["customers", "orders", "products", "order_items", "a", "b", "nodes"]
+    entries = {entry["table"]: entry for entry in plan["tables"]}
+    assert entries["order_items"]["depends_on"] == ["orders", "products"]
+    # 优先级为自身行数加上下游最长依赖链的行数
+    assert entries["customers"]["rank"] == 50 + 200 + 500
+    assert entries["products"]["rank"] == 20 + 500
+    assert plan["cycles"] == [["a", "b"]]
+    assert entries["a"]["depends_on"] == entries["b"]["depends_on"] == entries["nodes"]["depends_on"] == []
+    for entry in plan["tables"]:
+        for dependency in entry["depends_on"]:
+            assert order.index(dependency) < order.index(entry["table"])
+
+
+def test_job_copies_tables_in_dependency_order_and_releases_its_lock(tmp_path, monkeypatch):
+    """作业按外键依赖调度各表的任务，全部完成后作业完成，不再保留作业的调度锁"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 200)
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, item_id INTEGER REFERENCES items (id))")
+        conn.executemany("INSERT INTO orders VALUES (?, ?)", [(i, i % 200 + 1) for i in range(1, 301)])
+        conn.commit()
+    sessions = _metadata_db(tmp_path, monkeypatch)
+    monkeypatch.setattr("app.services.job_service.AsyncSessionLocal", sessions)
+    scheduler = TaskScheduler(max_concurrent=2, timeout=30)
+    monkeypatch.setattr("app.services.job_service.task_scheduler", scheduler)
+    monkeypatch.setattr("app.services.migration_service.task_scheduler", scheduler)
+    
+    async def scenario():
+        async with sessions() as db:
+            db.add(MigrationJob(id=1, name="job", source_id=1, target_id=2, status=TaskStatus.PENDING))
+            await db.commit()
+        await scheduler.start(MigrationTaskService.run_task, on_finished=MigrationJobService.on_task_finished)
+        try:
+            async with sessions() as db:
+                assert await MigrationJobService.start_job(db, 1)
+            for _ in range(200):
+                async with sessions() as db:
+                    job = await MigrationJobService.get_job(db, 1)
+                if job.status != TaskStatus.RUNNING:
+                    return job
+                await asyncio.sleep(0.05)
+        finally:
+            await scheduler.stop()
+    
+    job = _run(scenario())
+    assert job.status == TaskStatus.COMPLETED and job.processed_rows == 500
+    assert [entry["table"] for entry in json.loads(job.plan)["tables"]] == ["items", "orders"]
+    assert _rows(target, "orders") == _rows(source, "orders")
+    assert 1 not in job_service._dispatch_locks
+
+
+def test_incremental_sync_upserts_rows_changed_since_the_watermark(tmp_path):
+    """增量同步只复制水位之后变化的行，按目标表主键插入或更新，重复执行不产生重复行"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    for path in (source, target):
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, version INTEGER)")
+            conn.commit()
+    with closing(sqlite3.connect(source)) as conn:
+        conn.executemany("INSERT INTO items VALUES (?, ?, ?)", [(i, f"name-{i}", i % 10) for i in range(1, 301)])
+        conn.commit()
+    task = SimpleNamespace(source_table="items", watermark_column="version", watermark=None)
+    
+    async def sync():
+        window = await MigrationTaskService._watermark_window(_sqlite(source), task, None)
+        engine = MigrationEngine(
+            _sqlite(source), _sqlite(target), "items", "items",
+            row_filter=MigrationTaskService._watermark_filter(window), batch_size=50,
+            sync_mode="incremental", watermark_window=window
+        )
+        copied = await engine.run()
+        task.watermark = json.dumps(window["high"])
+        return copied
+    
+    assert _run(sync()) == 300
+    assert _rows(target) == _rows(source)
+    
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute("UPDATE items SET name = name || '-changed', version = 10 WHERE id % 3 = 0")
+        conn.executemany("INSERT INTO items VALUES (?, ?, ?)", [(i, f"name-{i}", 11) for i in range(301, 321)])
+        conn.commit()
+    assert _run(sync()) == 100 + 20
+    assert _rows(target) == _rows(source)
+    assert json.loads(task.watermark) == 11
+    # 水位之后没有变化时不复制任何行
+    assert _run(sync()) == 0
+    assert _rows(target) == _rows(source)
+
+
+def test_watermark_values_keep_their_type_through_json():
+    """水位值保存为JSON后按原类型还原，作为参数绑定时与源列类型一致"""
+    for value in (
+        datetime(2024, 5, 1, 12, 30, 15, 250000), date(2024, 5, 1), time(8, 30), Decimal("12.3400"), b"\x00\xff",
+        uuid.UUID("12345678-1234-5678-1234-567812345678"), 42, "v-42"
+    ):
+        encoded = json.loads(json.dumps(MigrationTaskService._encode_value(value)))
+        assert MigrationTaskService._decode_value(encoded) == value
+        assert type(MigrationTaskService._decode_value(encoded)) is type(value)
+
+
+def test_checksum_verification_narrows_down_mismatched_ranges(tmp_path):
+    """区间校验和不一致时细分比较，报告修改、缺失和多出的行所在的主键区间"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    _create_items(source, 2000)
+    _create_items(target, 2000)
+    
+    def verify():
+        return _run(ChecksumVerifier(
+            _sqlite(source), _sqlite(target), "items", "items", chunk_rows=500, leaf_rows=10, total_rows=2000
+        ).run())
+    
+    result = verify()
+    assert result["matched"] is True
+    assert result["mode"] == "checksum"
+    assert (result["source_rows"], result["target_rows"]) == (2000, 2000)
+    assert result["mismatched_ranges"] == []
+    
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute("UPDATE items SET name = 'changed' WHERE id = 123")
+        conn.execute("UPDATE items SET qty = NULL WHERE id = 1500")
+        conn.execute("DELETE FROM items WHERE id = 777")
+        conn.execute("INSERT INTO items VALUES (2500, 'extra', 1)")
+        conn.commit()
+    result = verify()
+    assert result["matched"] is False
+    assert (result["source_rows"], result["target_rows"]) == (2000, 2000)
+    ranges = result["mismatched_ranges"]
+    for key in (123, 1500, 777, 2500):
+        assert any(
+            (item["lower"] is None or item["lower"] < key) and (item["upper"] is None or key <= item["upper"])
+            for item in ranges
+        )
+    assert len(ranges) == 4
+    # 细分后的区间不超过 leaf_rows 行（最后一个区间不限上界）
+    assert all(item["upper"] - item["lower"] <= 10 for item in ranges if item["upper"] is not None)
+
+
+def test_checksum_compares_canonical_values_across_storage_formats(tmp_path):
+    """行校验和按源列类型比较规范文本：小数末尾的0、时间格式、定长字符串的尾部空格和存储类型不影响结果"""
+    source, target = tmp_path / "source.db", tmp_path / "target.db"
+    with closing(sqlite3.connect(source)) as conn:
+        conn.execute(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, price NUMERIC(10,2), ratio REAL, "
+            "created DATETIME, code CHAR(5), data BLOB, note TEXT)"
+        )
+        conn.execute("INSERT INTO items VALUES (1, 1.5, 0.1, '2024-01-02 03:04:05', 'ab', x'0aff', NULL)")
+        conn.execute("INSERT INTO items VALUES (2, 2, 1e-9, '2024-01-02 03:04:05.123456', 'cd', NULL, '')")
+        conn.commit()
+    with closing(sqlite3.connect(target)) as conn:
+        conn.execute(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, price TEXT, ratio TEXT, "
+            "created TEXT, code TEXT, data BLOB, note TEXT)"
+        )
+        conn.execute("INSERT INTO items VALUES (1, '1.50', '0.1000000001', '2024-01-02T03:04:05', 'ab   ', x'0aff', NULL)")
+        conn.execute("INSERT INTO items VALUES (2, '2.00', '0', '2024-01-02 03:04:05.123', 'cd   ', NULL, '')")
+        conn.commit()
+    
+    def verify():
+        return _run(ChecksumVerifier(_sqlite(source), _sqlite(target), "items", "items", total_rows=2).run())
+    
+    assert verify()["matched"] is True
+    with closing(sqlite3.connect(target)) as conn:
+        # NULL 与空串不同
+        conn.execute("UPDATE items SET note = '' WHERE id = 1")
+        conn.commit()
+    assert verify()["matched"] is False
+    
+    # MySQL和SQL Server在数据库端按同样的规则计算：规范文本以 | 连接并追加NULL标记，取UTF-16LE编码的MD5前4字节
+    expected = int.from_bytes(hashlib.md5("1|1.5||ab|0aff||000001".encode("utf-16-le")).digest()[:4], "big")
+    assert row_checksum("integer,decimal,text,char,binary,text", 1, Decimal("1.50"), "", "ab  ", b"\n\xff", None) == expected
+    assert [canonical_value(kind, value) for kind, value in (
+        ("decimal", Decimal("100")), ("decimal", Decimal("-0.00")), ("float", 1 / 3), ("integer", True),
+        ("datetime", datetime(2024, 1, 2, 3, 4, 5, 678999)), ("time", time(1, 2, 3)),
+        ("uuid", "A1B2C3D4-0000-0000-0000-000000000000"), ("date", "2024-01-02 00:00:00"),
+    )] == [
+        "100", "0", "0.333333", "1", "2024-01-02 03:04:05.678", "01:02:03.000",
+        "a1b2c3d4-0000-0000-0000-000000000000", "2024-01-02",
+    ]
+
+
+def test_adaptive_batch_sizer_adjusts_within_limits():
+    """整批耗时低于目标时加性增大，超过1.5倍目标时减半，不超过内存预算和上下限，超时错误缩小为1/4"""
+    sizer = AdaptiveBatchSizer(1000, min_size=100, max_size=2000, target_seconds=1.0, memory_budget=1_000_000, enabled=True)
+    sizer.record(1000, 0.2, 100_000)
+    assert sizer.size == 1250
+    # 不足一批说明数据已读完，不据此增大
+    sizer.record(600, 0.1, 60_000)
+    assert sizer.size == 1250
+    sizer.record(1250, 1.2, 125_000)
+    assert sizer.size == 1250
+    sizer.record(1250, 2.0, 125_000)
+    assert sizer.size == 625
+    for _ in range(10):
+        sizer.record(sizer.size, 0.1, sizer.size * 100)
+    assert sizer.size == 2000
+    # 每行1000字节时内存预算只容纳1000行
+    sizer.record(2000, 0.1, 2_000_000)
+    assert sizer.size == 1000
+    
+    assert sizer.shrink(TimeoutError())
+    assert sizer.size == 250
+    assert not sizer.shrink(ValueError("duplicate key"))
+    assert sizer.shrink(Exception("Packet for query is too large; max_allowed_packet"))
+    assert sizer.size == 100
+    assert not sizer.shrink(TimeoutError())
+    stats = sizer.stats()
+    assert (stats["min"], stats["max"], stats["final"]) == (100, 2000, 100)
+    assert stats["decreases"] == 4
+    
+    fixed = AdaptiveBatchSizer(1000, enabled=False)
+    fixed.record(1000, 10.0, 100_000)
+    assert fixed.size == 1000 and not fixed.shrink(TimeoutError())
+    assert estimate_row_bytes([("abcd", 1, None)] * 10) == (4 + 16 + 8 + 8) * 10
+
+
+def test_failed_metadata_load_is_not_cached(tmp_path, monkeypatch):
+    """第一次读取失败（数据库暂时不可用）时不缓存空结果，之后的请求重新读取并得到正确结果"""
+    datasource_id = 9001
+    database = tmp_path / "later" / "source.db"
+    datasource = SimpleNamespace(
+        id=datasource_id, db_type=DatabaseType.SQLITE, host="", port=0,
+        database=str(database), username="", password=""
+    )
+    
+    async def get_datasource(db, requested_id):
+        return datasource if requested_id == datasource_id else None
+    
+    monkeypatch.setattr(DataSourceService, "get_datasource", get_datasource)
+    
+    async def scenario():
+        try:
+            # 数据库所在目录还不存在，连接失败
+            assert await DataSourceService.get_datasource_tables(None, datasource_id) == []
+            assert await DataSourceService.get_table_schema(None, datasource_id, "items") == []
+            
+            database.parent.mkdir()
+            _create_items(database, 0)
+            
+            tables = await DataSourceService.get_datasource_tables(None, datasource_id)
+            assert [table["name"] for table in tables] == ["items"]
+            schema = await DataSourceService.get_table_schema(None, datasource_id, "items")
+            assert [column["column_name"] for column in schema] == ["id", "name", "qty"]
+            # 成功的结果进入缓存
+            assert metadata_cache.get(datasource_id, "tables", None) == tables
+        finally:
+            metadata_cache.invalidate(datasource_id)
+    
+    _run(scenario())
+
+
+def test_spill_segment_round_trip(tmp_path):
+    """段文件按原样还原列批和行列表中的各类值"""
+    rows = [
+        (1, 1.5, True, "a", Decimal("1.10"), datetime(2024, 1, 2, 3, 4, 5), b"\x00\x01"),
+        (2, None, False, None, None, date(2024, 1, 2), timedelta(seconds=90)),
+    ]
+    names = ["id", "price", "flag", "name", "amount", "created_at", "data"]
+    store = SpillStore(str(tmp_path / "spill" / "task_1"))
+    
+    async def scenario():
+        for batch in (ColumnBatch.from_rows(names, rows), rows):
+            segment = await store.write((names, batch, 2, 0.5), 0, None)
+            columns, restored, last_key, read_elapsed = await store.read(segment)
+            assert (columns, last_key, read_elapsed) == (names, 2, 0.5)
+            restored_rows = restored.to_rows() if isinstance(restored, ColumnBatch) else restored
+            assert restored_rows == rows
+        return store.recover(0, None)
+    
+    assert [segment.rows for segment in asyncio.run(scenario())] == [2]
+    assert os.stat(tmp_path / "spill").st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Windows 上不检查目录权限")
+def test_spill_refuses_shared_directory(tmp_path):
+    """段文件根目录对其他用户开放时拒绝写入和读取"""
+    root = tmp_path / "spill"
+    root.mkdir()
+    root.chmod(0o777)
+    store = SpillStore(str(root / "task_1"))
+    
+    with pytest.raises(PermissionError):
+        asyncio.run(store.write((["id"], [(1,)], 1, 0.0), 0, None))
+    (root / "task_1").mkdir()
+    with pytest.raises(PermissionError):
+        store.recover(0, None)
\ No newline at end of file